@@ -0,0 +1,571 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class MetricResult:
+    """Kết quả 1 metric: `data` đúng dạng record của fe_* tương ứng, `notes` nối vào meta["notes"]."""
+
+    data: List[Dict[str, Any]]
+    notes: str
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+# Cột coverage trong record của top_brands / category_count: tên field -> cột logic đếm giá trị khác nhau
+COVERAGE_FIELDS = (("distinct_sellers", "seller_name"), ("distinct_skus", "sku"))
+
+
+def records(columns: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Ghép các cột (mảng NumPy / list cùng độ dài) thành list record theo thứ tự cột.
+    Mảng được chuyển 1 lần bằng `tolist()` (float64 -> float, int64 -> int, object giữ nguyên)
+    nên record chỉ chứa kiểu Python gốc, json.dumps không cần hook chuyển kiểu.
+    """
+    names = list(columns)
+    values = [c.tolist() if isinstance(c, np.ndarray) else c for c in columns.values()]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+@dataclass
+class Grouping:
+    """
+    Nhóm row theo 1 tổ hợp cột key.
+    `inverse[row]` là mã nhóm (-1 = row bị loại vì key NaN khi dropna); nhóm xếp theo
+    thứ tự key tăng dần (NaN cuối), giống `groupby(sort=True)`; `keys[i]` là giá trị cột i của từng nhóm.
+    """
+
+    inverse: np.ndarray
+    n_groups: int
+    keys: List[np.ndarray]
+    key_codes: List[np.ndarray]
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        """Tổng theo nhóm (cùng phép cộng bù Kahan như groupby().sum() của pandas)."""
+        keep = self.inverse >= 0
+        out = pd.Series(values[keep]).groupby(self.inverse[keep]).sum()
+        return out.reindex(np.arange(self.n_groups), fill_value=0.0).to_numpy(dtype=np.float64)
+
+    def count(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        keep = self.inverse >= 0
+        if mask is not None:
+            keep &= mask
+        return np.bincount(self.inverse[keep], minlength=self.n_groups)
+
+    def slices(self, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(row xếp theo nhóm – giữ thứ tự row trong nhóm, offsets) cho các row thỏa `mask`."""
+        keep = self.inverse >= 0
+        if mask is not None:
+            keep &= mask
+        rows = np.flatnonzero(keep)
+        rows = rows[np.argsort(self.inverse[rows], kind="stable")]
+        counts = np.bincount(self.inverse[rows], minlength=self.n_groups)
+        return rows, np.concatenate([[0], np.cumsum(counts)])
+
+
+class SortedGroups:
+    """
+    Giá trị của mọi nhóm sắp xếp 1 lần theo (nhóm, giá trị), kèm số lần xuất hiện `counts`
+    (None = mỗi giá trị 1 lần). Thống kê thứ tự (min / max / quantile / median) của tất cả
+    nhóm tính bằng vài phép tra mảng, không vòng lặp Python theo nhóm.
+    quantile() trùng khớp np.quantile (method="linear"), median() trùng khớp np.median.
+    """
+
+    def __init__(
+        self,
+        group: np.ndarray,
+        values: np.ndarray,
+        n_groups: int,
+        counts: Optional[np.ndarray] = None,
+    ):
+        keep = (group >= 0) & ~np.isnan(values)
+        group, values = group[keep], values[keep]
+        order = np.lexsort((values, group))
+        self.values = values[order]
+        self.n_groups = n_groups
+        if counts is None:
+            self._cum = None
+            self.n = np.bincount(group, minlength=n_groups)
+        else:
+            counts = counts[keep][order].astype(np.int64)
+            self._cum = np.cumsum(counts)
+            self.n = np.bincount(group[order], weights=counts, minlength=n_groups).astype(np.int64)
+        self._start = np.concatenate([[0], np.cumsum(self.n)[:-1]]).astype(np.int64)
+
+    def _at(self, groups: np.ndarray, rank: np.ndarray) -> np.ndarray:
+        """Giá trị thứ `rank` (0-based, tăng dần) trong từng nhóm `groups`."""
+        pos = self._start[groups] + rank
+        if self._cum is not None:
+            pos = np.searchsorted(self._cum, pos, side="right")
+        return self.values[pos]
+
+    def _each(self, fn) -> np.ndarray:
+        out = np.full(self.n_groups, np.nan)
+        has = np.flatnonzero(self.n > 0)
+        if len(has):
+            out[has] = fn(has, self.n[has])
+        return out
+
+    def min(self) -> np.ndarray:
+        return self._each(lambda g, n: self._at(g, np.zeros_like(n)))
+
+    def max(self) -> np.ndarray:
+        return self._each(lambda g, n: self._at(g, n - 1))
+
+    def quantile(self, q: float) -> np.ndarray:
+        def fn(g, n):
+            # Cùng công thức với np.quantile: index ảo (n - 1) * q rồi _lerp giữa 2 giá trị kề
+            virtual = (n - 1) * q
+            prev = np.floor(virtual)
+            above = virtual >= n - 1
+            prev = np.where(above, n - 1, prev).astype(np.int64)
+            nxt = np.where(above, n - 1, prev + 1)
+            gamma = virtual - np.where(above, -1, prev)
+            a, b = self._at(g, prev), self._at(g, nxt)
+            diff = b - a
+            return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+        return self._each(fn)
+
+    def median(self) -> np.ndarray:
+        def fn(g, n):
+            lo, hi = self._at(g, (n - 1) // 2), self._at(g, n // 2)
+            # np.median: trung bình 2 phần tử giữa (n chẵn) = (a + b) / 2
+            return np.where(n % 2 == 1, lo, (lo + hi) / 2)
+
+        return self._each(fn)
+
+
+class HitAggregator:
+    """
+    Tính nhiều metric của dashboard trên CÙNG 1 tập hit.
+
+    Mỗi cột key (platform / brand / seller / category...) chỉ factorize 1 lần, mỗi cột số
+    chỉ `to_numeric` 1 lần, và bảng nhóm theo từng tổ hợp key được cache -> các metric dùng chung
+    (VD top_brands và brand_share cùng nhóm (platform, brand)) không phải duyệt lại tập hit.
+    Record trả về giống hệt fe_* tương ứng trong analytics_core (renderer trong visualization.py dùng trực tiếp).
+    """
+
+    # Phạm vi dữ liệu ghi trong notes của từng metric
+    scope = "search subset"
+
+    def __init__(self, df_hits: pd.DataFrame, column_map: Dict[str, str]):
+        self.df = df_hits
+        self.columns = column_map
+        self._codes: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._numeric: Dict[str, np.ndarray] = {}
+        self._groupings: Dict[Tuple, Grouping] = {}
+
+    # --- cột dùng chung -------------------------------------------------------
+
+    def codes(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(codes, uniques đã sắp xếp) của cột logic `name`; NaN -> -1."""
+        if name not in self._codes:
+            codes, uniques = pd.factorize(self.df[self.columns[name]], sort=True, use_na_sentinel=True)
+            self._codes[name] = (codes.astype(np.int64), np.asarray(uniques, dtype=object))
+        return self._codes[name]
+
+    def numeric(self, name: str) -> np.ndarray:
+        """Cột logic `name` dạng float64 (`pd.to_numeric(errors="coerce")`, giữ NaN)."""
+        if name not in self._numeric:
+            values = pd.to_numeric(self.df[self.columns[name]], errors="coerce")
+            self._numeric[name] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        return self._numeric[name]
+
+    def group(self, names: Sequence[str], dropna: bool = True) -> Grouping:
+        key = (tuple(names), dropna)
+        if key in self._groupings:
+            return self._groupings[key]
+
+        n = len(self.df)
+        keep = np.ones(n, dtype=bool)
+        all_codes, all_uniques = [], []
+        for name in names:
+            codes, uniques = self.codes(name)
+            if dropna:
+                keep &= codes >= 0
+            else:
+                # groupby(dropna=False): nhóm NaN xếp sau cùng
+                codes = np.where(codes >= 0, codes, len(uniques))
+                uniques = np.append(uniques, np.nan).astype(object)
+            all_codes.append(codes)
+            all_uniques.append(uniques)
+
+        dims = tuple(max(len(u), 1) for u in all_uniques)
+        flat = np.ravel_multi_index([c[keep] for c in all_codes], dims) if names else np.zeros(int(keep.sum()), np.int64)
+        present, inv = np.unique(flat, return_inverse=True)
+        inverse = np.full(n, -1, dtype=np.int64)
+        inverse[keep] = inv
+        key_codes = list(np.unravel_index(present, dims)) if names else []
+        grouping = Grouping(
+            inverse=inverse,
+            n_groups=len(present),
+            keys=[u[c] for u, c in zip(all_uniques, key_codes)],
+            key_codes=key_codes,
+        )
+        self._groupings[key] = grouping
+        return grouping
+
+    def compute(self, metric: str, /, **params) -> MetricResult:
+        try:
+            fn = getattr(self, f"_metric_{metric}")
+        except AttributeError:
+            raise ValueError(f"metric '{metric}' không hỗ trợ") from None
+        return fn(**params)
+
+    def compute_many(self, metrics: Dict[str, Dict[str, Any]]) -> Dict[str, MetricResult]:
+        """`metrics`: tên metric -> tham số, VD {"top_brands": {"by": "revenue_est"}, "roi": {}}."""
+        return {metric: self.compute(metric, **(params or {})) for metric, params in metrics.items()}
+
+    # --- các metric -----------------------------------------------------------
+
+    def _price_rows(self) -> np.ndarray:
+        return ~np.isnan(self.numeric("price"))
+
+    def _price_summary(self, grouping: Grouping, quantiles: Tuple[float, ...]) -> Dict[str, np.ndarray]:
+        """
+        count / mean / std (ddof=1) / min / max / median và các quantile của giá theo từng nhóm
+        của `grouping`, mỗi thống kê là 1 mảng theo mã nhóm (nhóm không có giá: count = 0).
+        Thống kê thứ tự lấy từ SortedGroups (sắp xếp 1 lần) nên trùng khớp np.quantile / np.median.
+        """
+        price = self.numeric("price")
+        valid = self._price_rows() & (grouping.inverse >= 0)
+        n = grouping.count(valid)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = grouping.sum(np.where(valid, price, 0.0)) / n
+            dev = np.where(valid, price - mean[grouping.inverse], 0.0)
+            std = np.where(n > 1, np.sqrt(grouping.sum(dev * dev) / (n - 1)), 0.0)
+        sorted_groups = SortedGroups(grouping.inverse, price, grouping.n_groups)
+        out = {
+            "count": n, "mean": mean, "std": std,
+            "min": sorted_groups.min(), "max": sorted_groups.max(), "median": sorted_groups.median(),
+        }
+        for q in quantiles:
+            out[q] = sorted_groups.quantile(q)
+        return out
+
+    def _metric_price_stats(self, by_platform: bool = True) -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        grouping = self.group(["platform"] if by_platform else [])
+        s = self._price_summary(grouping, (0.1, 0.9))
+
+        # Nhóm không có giá hợp lệ: mọi thống kê = 0
+        has = s["count"] > 0
+        columns = {
+            name: np.where(has, s[stat], 0.0)
+            for name, stat in [
+                ("min_price", "min"), ("q10", 0.1), ("median_price", "median"), ("mean_price", "mean"),
+                ("q90", 0.9), ("max_price", "max"), ("std_price", "std"),
+            ]
+        }
+        columns["count"] = s["count"].astype(np.int64)
+        if by_platform:
+            columns["platform"] = grouping.keys[0]
+        data = records(columns)
+        return MetricResult(data, f"; fe_describe_price over {self.scope}")
+
+    def _metric_price_range(self, quantiles: Tuple[float, float] = (0.1, 0.9)) -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        q_low, q_high = quantiles
+        grouping = self.group(["platform", "categories"])
+        s = self._price_summary(grouping, (q_low, q_high))
+        g = np.flatnonzero(s["count"] > 0)
+        data = records(
+            {
+                "platform": grouping.keys[0][g],
+                "categories": grouping.keys[1][g],
+                "min_price": s["min"][g],
+                "q_low": s[q_low][g],
+                "median_price": s["median"][g],
+                "q_high": s[q_high][g],
+                "max_price": s["max"][g],
+                "count": s["count"][g].astype(np.int64),
+            }
+        )
+        return MetricResult(data, f"; fe_price_range_by_category over {self.scope}")
+
+    @staticmethod
+    def _bin_index(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        """Bin của từng giá trị theo quy ước np.histogram (bin cuối đóng 2 đầu); ngoài khoảng -> -1."""
+        n_bins = len(edges) - 1
+        idx = np.searchsorted(edges, values, side="right") - 1
+        idx[values == edges[-1]] = n_bins - 1
+        idx[(idx < 0) | (idx >= n_bins)] = -1
+        return idx
+
+    def _values(self, name: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(giá trị khác NaN, số lần xuất hiện, record chứa giá trị) của cột số `name`."""
+        values = self.numeric(name)
+        rec = np.flatnonzero(~np.isnan(values))
+        return values[rec], np.ones(len(rec)), rec
+
+    def _metric_rating_distribution(self, bins: int = 20, group_by_brand: bool = True) -> MetricResult:
+        rating, weights, rec = self._values("rating")
+        if len(rating) == 0:
+            return MetricResult([], "; no rating data", {"bin_edges": []})
+
+        bin_edges = np.linspace(rating.min(), rating.max(), bins + 1)
+        bin_idx = self._bin_index(rating, bin_edges)
+        counted = bin_idx >= 0
+
+        if group_by_brand:
+            grouping = self.group(["brand"])
+            group = grouping.inverse[rec]
+            keep = counted & (group >= 0)
+            group_keys = grouping.keys[0]
+            n_groups = grouping.n_groups
+            cell = group[keep] * bins + bin_idx[keep]
+        else:
+            keep = counted
+            group_keys = np.array([None], dtype=object)
+            n_groups = 1
+            cell = bin_idx[keep]
+        counts = np.bincount(cell, weights=weights[keep], minlength=n_groups * bins).astype(np.int64)
+
+        c = np.flatnonzero(counts)
+        g, b = np.divmod(c, bins)
+        data = records(
+            {
+                "bucket_left": bin_edges[b],
+                "bucket_right": bin_edges[b + 1],
+                "count": counts[c],
+                "brand": group_keys[g],
+            }
+        )
+        meta = {"bin_edges": bin_edges.tolist()}
+        return MetricResult(data, f"; fe_rating_distribution over {self.scope}", meta)
+
+    def _metric_sold_distribution(self, bins: Any = (0, 10, 50, 100, 500, 1000, 5000, 10000)) -> MetricResult:
+        sold = self.numeric("sold")
+        raw_notna = self.df[self.columns["sold"]].notna().to_numpy()
+        if not raw_notna.any():
+            return MetricResult([], "; no sold data", {"bin_edges": []})
+
+        has_sold = ~np.isnan(sold)
+        if isinstance(bins, int):
+            bin_edges = np.linspace(np.nanmin(sold[has_sold]), np.nanmax(sold[has_sold]), bins + 1)
+        else:
+            bin_edges = np.array(list(bins), dtype=float)
+        n_bins = len(bin_edges) - 1
+
+        grouping = self.group(["platform"])
+        total = grouping.count(has_sold)
+        bin_idx = self._bin_index(sold, bin_edges)
+        keep = has_sold & (bin_idx >= 0) & (grouping.inverse >= 0)
+        counts = np.bincount(grouping.inverse[keep] * n_bins + bin_idx[keep], minlength=grouping.n_groups * n_bins)
+
+        c = np.flatnonzero(counts)
+        g, b = np.divmod(c, n_bins)
+        data = records(
+            {
+                "platform": grouping.keys[0][g],
+                "bin_left": bin_edges[b],
+                "bin_right": bin_edges[b + 1],
+                "count": counts[c].astype(np.int64),
+                "pct": counts[c] / total[g],
+            }
+        )
+        meta = {"bin_edges": bin_edges.tolist()}
+        return MetricResult(data, f"; fe_sold_distribution over {self.scope}", meta)
+
+    def _metric_category_count(self, sublevel_field: str = "categories", top_k: Optional[int] = None) -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        values = self.df[self.columns[sublevel_field]].astype(str)
+        counts = values.value_counts()
+        if top_k is not None:
+            counts = counts.head(top_k)
+        # Row -> vị trí nhóm trong kết quả (theo index của value_counts, -1 = ngoài top_k)
+        inverse = counts.index.get_indexer(values)
+        data = records(
+            {
+                "product_count": counts.index.to_numpy(dtype=object),
+                "count": counts.to_numpy(dtype=np.int64),
+                **self._coverage(inverse, len(counts), np.arange(len(counts))),
+            }
+        )
+        return MetricResult(data, f"; fe_category_count_plot over {self.scope}")
+
+    def _distinct(self, inverse: np.ndarray, n_groups: int, name: str) -> Optional[np.ndarray]:
+        """Số giá trị khác nhau (bỏ NaN) của cột logic `name` trong từng nhóm; None nếu không có cột."""
+        if self.columns.get(name) not in self.df.columns:
+            return None
+        codes, uniques = self.codes(name)
+        keep = (inverse >= 0) & (codes >= 0)
+        n_values = max(len(uniques), 1)
+        pairs = np.unique(inverse[keep] * n_values + codes[keep])
+        return np.bincount(pairs // n_values, minlength=n_groups).astype(np.int64)
+
+    def _coverage(self, inverse: np.ndarray, n_groups: int, groups: np.ndarray) -> Dict[str, np.ndarray]:
+        """Các cột coverage (số seller / SKU khác nhau) của nhóm `groups`, bỏ cột không có dữ liệu."""
+        out = {}
+        for field_name, name in COVERAGE_FIELDS:
+            counts = self._distinct(inverse, n_groups, name)
+            if counts is not None:
+                out[field_name] = counts[groups]
+        return out
+
+    def _weights(self) -> np.ndarray:
+        """Số row gốc mà mỗi record đại diện (ở đây mỗi record là 1 row)."""
+        return np.ones(len(self.df))
+
+    def _sold(self) -> np.ndarray:
+        return np.nan_to_num(self.numeric("sold"), nan=0.0)
+
+    def _revenue(self) -> np.ndarray:
+        price = np.nan_to_num(self.numeric("price"), nan=0.0)
+        return price * self._sold()
+
+    def _platform_bounds(self, grouping: Grouping) -> List[Tuple[int, int]]:
+        """Khoảng mã nhóm [lo, hi) của từng platform (key đầu của grouping), bỏ platform NaN."""
+        n_platforms = len(self.codes("platform")[1])
+        bounds = np.searchsorted(grouping.key_codes[0], np.arange(n_platforms + 1))
+        return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:]) if lo < hi]
+
+    def _per_platform_top(self, grouping: Grouping, values: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (rank, mã nhóm) của top_k nhóm theo `values` trong từng platform, xếp theo platform rồi rank;
+        thứ tự giống `sort_values(ascending=False).head(top_k)` trên từng platform (giá trị bằng nhau
+        giữ thứ tự nhóm). 1 lần lexsort cho mọi platform, không vòng lặp Python.
+        """
+        platform = grouping.key_codes[0]
+        # groupby(dropna=False): platform NaN mang mã = số platform -> bỏ
+        groups = np.flatnonzero(platform < len(self.codes("platform")[1]))
+        groups = groups[np.lexsort((groups, -values[groups], platform[groups]))]
+        sorted_platform = platform[groups]
+        rank = np.arange(len(groups)) - np.searchsorted(sorted_platform, sorted_platform, side="left") + 1
+        top = rank <= top_k
+        return rank[top].astype(np.int64), groups[top].astype(np.int64)
+
+    def _metric_top_sellers(self, by: str = "product_count", top_k: int = 20) -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        grouping = self.group(["platform", "seller_name"], dropna=False)
+        if by == "sold":
+            values = grouping.sum(self._sold())
+        else:
+            seller_codes, _ = self.codes("seller_name")
+            values = grouping.sum(self._weights() * (seller_codes >= 0))
+        rank, g = self._per_platform_top(grouping, values, top_k)
+        data = records(
+            {
+                "rank": rank,
+                "seller_name": grouping.keys[1][g],
+                "platform": grouping.keys[0][g],
+                "value": values[g],
+            }
+        )
+        return MetricResult(data, f"; fe_top_sellers by={by} over {self.scope}")
+
+    def _metric_top_brands(self, by: str = "revenue_est", top_k: int = 20) -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        grouping = self.group(["platform", "brand"], dropna=False)
+        metric = self._sold() if by == "sold" else self._revenue()
+        values = grouping.sum(metric)
+        rank, g = self._per_platform_top(grouping, values, top_k)
+        data = records(
+            {
+                "rank": rank,
+                "brand": grouping.keys[1][g],
+                "platform": grouping.keys[0][g],
+                "value": values[g],
+                **self._coverage(grouping.inverse, grouping.n_groups, g),
+            }
+        )
+        return MetricResult(data, f"; fe_top_brands by={by} over {self.scope}")
+
+    def _metric_brand_share(self, metric: str = "sku", normalize: bool = True) -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        grouping = self.group(["platform", "brand"], dropna=False)
+        weights = self._revenue() if metric == "revenue_est" else self._weights()
+        values = grouping.sum(weights)
+
+        # Nhóm có platform NaN không nằm trong kết quả (giống vòng groupby(platform) của fe_brand_share_chart)
+        bounds = self._platform_bounds(grouping)
+        g = np.concatenate([np.arange(lo, hi) for lo, hi in bounds] or [np.empty(0, dtype=np.int64)])
+        total = np.concatenate([np.full(hi - lo, values[lo:hi].sum()) for lo, hi in bounds] or [np.empty(0)])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = values[g] / total * 100.0
+        if normalize:
+            share = np.where(total > 0, share.astype(object), None)
+        else:
+            share = np.full(len(g), None, dtype=object)
+        data = records(
+            {
+                "platform": grouping.keys[0][g],
+                "brand": grouping.keys[1][g],
+                "value": values[g],
+                "share_pct": share,
+            }
+        )
+        return MetricResult(data, f"; fe_brand_share_chart metric={metric} over {self.scope}")
+
+    def seller_diversity_table(self) -> Dict[str, np.ndarray]:
+        """
+        Số sản phẩm, số category và chỉ số đa dạng (entropy Shannon của tỉ lệ category) của MỌI
+        (platform, seller), theo thứ tự nhóm; tính từ 1 bảng đếm (nhóm, category) duy nhất.
+        """
+        grouping = self.group(["platform", "seller_name"], dropna=False)
+        weights = self._weights()
+        product_count = grouping.sum(weights)
+
+        # Bảng đếm (nhóm, category) 1 lần cho mọi seller
+        cat_codes, _ = pd.factorize(self.df[self.columns["category"]].astype(str), use_na_sentinel=True)
+        keep = (grouping.inverse >= 0) & (cat_codes >= 0)
+        n_cats = max(int(cat_codes.max()) + 1, 1) if len(cat_codes) else 1
+        pair, pair_inv = np.unique(grouping.inverse[keep] * n_cats + cat_codes[keep], return_inverse=True)
+        pair_count = np.bincount(pair_inv, weights=weights[keep])
+        pair_group = pair // n_cats
+        total = np.bincount(pair_group, weights=pair_count, minlength=grouping.n_groups)
+        unique_categories = np.bincount(pair_group, minlength=grouping.n_groups)
+        p = pair_count / total[pair_group]
+        entropy = -np.bincount(pair_group, weights=p * np.log(p + 1e-12), minlength=grouping.n_groups)
+
+        return {
+            "seller_name": grouping.keys[1],
+            "platform": grouping.keys[0],
+            "product_count": product_count.astype(np.int64),
+            "unique_categories": unique_categories.astype(np.int64),
+            "diversity_index": np.where(total > 0, entropy, 0.0),
+        }
+
+    def _metric_seller_diversity(self, min_products: int = 2) -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        table = self.seller_diversity_table()
+        g = np.flatnonzero(table["product_count"] >= min_products)
+        data = records({name: values[g] for name, values in table.items()})
+        return MetricResult(data, f"; fe_seller_diversity_index over {self.scope}")
+
+    def _metric_roi(self, group_by: str = "platform") -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        name = {"seller": "seller_name", "brand": "brand"}.get(group_by, "platform")
+        price = self.numeric("price")
+        sold = self.numeric("sold")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            roi = sold / np.where(price == 0, np.nan, price)
+        valid = np.isfinite(roi)
+
+        grouping = self.group([name], dropna=False)
+        keep = valid & (grouping.inverse >= 0)
+        stats = (
+            pd.Series(roi[keep])
+            .groupby(grouping.inverse[keep])
+            .agg(["mean", "median", "count"])
+        )
+        data = records(
+            {
+                "group": grouping.keys[0][stats.index.to_numpy()],
+                "roi_mean": stats["mean"].to_numpy(dtype=np.float64),
+                "roi_median": stats["median"].to_numpy(dtype=np.float64),
+                "count": stats["count"].to_numpy(dtype=np.int64),
+            }
+        )
+        return MetricResult(data, f"; fe_roi_table_for_A group_by={group_by} over {self.scope}")
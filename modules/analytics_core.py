@@ -1,11 +1,22 @@
+import copy
 import re
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime, timezone
 
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from modules.search_index import TokenIndex
+from modules.filter_index import FilterIndex
+from modules.embedding_store import EmbeddingStore
+from modules.vector_index import _top_k
+from modules.encoder import QueryEncoder, make_encoder
+from modules.aggregation import HitAggregator, records
+from modules.market_cube import CubeAggregator, MarketCube
 
 
 _COLUMN_MAP = {
@@ -28,8 +39,42 @@ _DEFAULT_PLATFORMS = ["Lazada", "Shopee", "Tiki", "TikTokShop", "Sendo"]
 # Số lượng row tối đa dùng để RESOLVE (category/brand) – cố định để tránh nhảy lung tung giữa các fe_*
 _RESOLVE_MAX_ROWS = 200
 
-_EMB_MODEL = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-_PRODUCT_EMB: Optional[np.ndarray] = None
+# Encoder cho query: tạo lười ở lần encode đầu (import module không nạp torch / model)
+_ENCODER: Optional[QueryEncoder] = None
+_ENCODER_LOCK = threading.Lock()
+# ndarray hoặc EmbeddingStore (mmap, có thể lượng tử hóa float16/int8)
+_PRODUCT_EMB: Optional[Union[np.ndarray, EmbeddingStore]] = None
+
+# ANN index (IVF/HNSW) dựng từ _PRODUCT_EMB – None nghĩa là luôn quét toàn bộ (exact)
+_VECTOR_INDEX = None
+# Số ứng viên lấy từ ANN = max_rows * _ANN_OVERSAMPLE (tối thiểu _ANN_MIN_CANDIDATES)
+_ANN_OVERSAMPLE = 4
+_ANN_MIN_CANDIDATES = 1000
+# Chấm điểm song song nhiều process trên embedding trong shared memory (ShardedSearch)
+_SHARDED_SEARCH = None
+
+# LRU cache embedding của query: 1 tool call chạy nhiều fe_* với cùng 1 query,
+# và các query phổ biến lặp lại giữa các session -> chỉ encode 1 lần
+_QUERY_CACHE_SIZE = 1024
+_QUERY_EMB_CACHE: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_QUERY_CACHE_STATS = {"hits": 0, "misses": 0}
+_QUERY_CACHE_LOCK = threading.Lock()
+
+# Inverted index token -> row id cho phần lexical của hybrid_search
+_TOKEN_INDEX: Optional[TokenIndex] = None
+# Ngưỡng độ giống trigram để coi 1 token catalogue là "gần giống" token query (typo_tolerant)
+_TYPO_MIN_SIMILARITY = 0.4
+
+# Index categorical (platform / category / brand / review_count) cho metadata filter
+_FILTER_INDEX: Optional[FilterIndex] = None
+
+# Danh sách category / brand của catalogue đã nạp (tính sẵn trong artifact bundle)
+_CATALOG_VOCAB: Optional[Dict[str, Any]] = None
+
+# Cube tiền tổng hợp cả catalogue: trả lời câu hỏi cấp danh mục / toàn thị trường không cần search
+_MARKET_CUBE: Optional[MarketCube] = None
+# Tên danh mục đã chuẩn hóa (_normalize_text) -> tên gốc, để nhận ra từ khóa là tên danh mục
+_CUBE_CATEGORIES: Dict[str, str] = {}
 
 
 @dataclass
@@ -69,8 +114,18 @@ def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+# Bỏ dấu tiếng Việt: sau NFD, dấu thanh / dấu mũ là ký tự kết hợp U+0300–U+036F
+_STRIP_MARKS = {c: None for c in range(0x300, 0x370)}
+
+
+def _fold_accents(s: str) -> str:
+    """ "Tai nghe không dây" -> "Tai nghe khong day" (đ -> d). """
+    s = s.replace("đ", "d").replace("Đ", "D")
+    return unicodedata.normalize("NFD", s).translate(_STRIP_MARKS)
+
+
 def _normalize_text(s: str) -> str:
-    s = s.lower()
+    s = _fold_accents(s.lower())
     s = re.sub(r"[^a-z0-9]+", " ", s)
     return s.strip()
 
@@ -96,30 +151,327 @@ def _build_meta(
     }
 
 
-def _apply_platform_filter(df: pd.DataFrame, platforms: Optional[List[str]]) -> pd.DataFrame:
-    col = _COLUMN_MAP["platform"]
-    if platforms:
-        return df[df[col].isin(platforms)]
-    return df
-
-
-def _apply_min_reviews(df: pd.DataFrame, min_reviews: int) -> pd.DataFrame:
-    col = _COLUMN_MAP["review_count"]
-    if col in df.columns and min_reviews > 0:
-        reviews = pd.to_numeric(df[col], errors="coerce").fillna(0)
-        return df[reviews >= min_reviews]
-    return df
-
-
 def _safe_column(df: pd.DataFrame, logical_name: str) -> str:
     return _COLUMN_MAP[logical_name]
 
 
-def set_product_embeddings(emb: np.ndarray) -> None:
+def set_product_embeddings(emb: Union[np.ndarray, EmbeddingStore]) -> None:
     global _PRODUCT_EMB
     _PRODUCT_EMB = emb
 
 
+def set_vector_index(index) -> None:
+    global _VECTOR_INDEX
+    _VECTOR_INDEX = index
+
+
+def set_sharded_search(sharded) -> None:
+    """Bật chấm điểm song song; `sharded.embeddings` thay cho _PRODUCT_EMB (bản trong shared memory)."""
+    global _SHARDED_SEARCH, _PRODUCT_EMB
+    _SHARDED_SEARCH = sharded
+    if sharded is not None:
+        _PRODUCT_EMB = sharded.embeddings
+
+
+def get_encoder() -> QueryEncoder:
+    global _ENCODER
+    with _ENCODER_LOCK:
+        if _ENCODER is None:
+            _ENCODER = make_encoder()
+        return _ENCODER
+
+
+def set_encoder(encoder: Optional[QueryEncoder]) -> None:
+    """Đổi backend encoder (VD OnnxEncoder); đổi model thì embedding cũ trong cache không còn đúng."""
+    global _ENCODER
+    with _ENCODER_LOCK:
+        _ENCODER = encoder
+    clear_query_cache()
+
+
+def _query_cache_key(query: str) -> str:
+    # Model uncased -> chữ hoa/thường, khoảng trắng thừa không đổi embedding
+    return " ".join(query.lower().split())
+
+
+def _cached_query_vectors(queries: List[str]) -> List[np.ndarray]:
+    """
+    Embedding (đã chuẩn hóa L2) của từng query, có LRU cache theo query đã chuẩn hóa.
+    Các query chưa có trong cache được encode chung 1 batch.
+    """
+    keys = [_query_cache_key(q) for q in queries]
+    found: Dict[str, np.ndarray] = {}
+    with _QUERY_CACHE_LOCK:
+        for key in keys:
+            if key in found:
+                continue
+            vec = _QUERY_EMB_CACHE.get(key)
+            if vec is not None:
+                _QUERY_EMB_CACHE.move_to_end(key)
+                _QUERY_CACHE_STATS["hits"] += 1
+                found[key] = vec
+            else:
+                _QUERY_CACHE_STATS["misses"] += 1
+                found[key] = None
+
+    missing = [key for key, vec in found.items() if vec is None]
+    if missing:
+        vecs = get_encoder().encode(missing)
+        with _QUERY_CACHE_LOCK:
+            for key, vec in zip(missing, vecs):
+                # Vector dùng chung giữa các lời gọi -> khóa ghi để tránh bị sửa nhầm
+                vec.setflags(write=False)
+                found[key] = vec
+                _QUERY_EMB_CACHE[key] = vec
+                _QUERY_EMB_CACHE.move_to_end(key)
+            while len(_QUERY_EMB_CACHE) > _QUERY_CACHE_SIZE:
+                _QUERY_EMB_CACHE.popitem(last=False)
+    return [found[key] for key in keys]
+
+
+def encode_query(query: str) -> np.ndarray:
+    """Embedding (đã chuẩn hóa L2) của query, có LRU cache theo query đã chuẩn hóa."""
+    return _cached_query_vectors([query])[0]
+
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    """Ma trận (len(queries), dim) embedding của nhiều query, encode 1 batch."""
+    return np.stack(_cached_query_vectors(list(queries)))
+
+
+def query_cache_info() -> Dict[str, int]:
+    with _QUERY_CACHE_LOCK:
+        return {
+            "hits": _QUERY_CACHE_STATS["hits"],
+            "misses": _QUERY_CACHE_STATS["misses"],
+            "size": len(_QUERY_EMB_CACHE),
+            "maxsize": _QUERY_CACHE_SIZE,
+        }
+
+
+def clear_query_cache() -> None:
+    with _QUERY_CACHE_LOCK:
+        _QUERY_EMB_CACHE.clear()
+        _QUERY_CACHE_STATS["hits"] = 0
+        _QUERY_CACHE_STATS["misses"] = 0
+
+
+def build_token_index(df: pd.DataFrame) -> TokenIndex:
+    name_col = _COLUMN_MAP["name"]
+    return TokenIndex.build(df[name_col].astype(str).map(_normalize_text))
+
+
+def set_token_index(index: Optional[TokenIndex]) -> None:
+    global _TOKEN_INDEX
+    _TOKEN_INDEX = index
+
+
+def set_catalog_vocab(categories: List[str], brands: List[str], n_rows: int) -> None:
+    global _CATALOG_VOCAB
+    _CATALOG_VOCAB = {"n_rows": n_rows, "categories": list(categories), "brands": list(brands)}
+
+
+def catalog_vocab(df: pd.DataFrame) -> Tuple[List[str], List[str]]:
+    """(catalog_categories, brand_list) đã sắp xếp; dùng bản tính sẵn nếu khớp catalogue."""
+    vocab = _CATALOG_VOCAB
+    if vocab is not None and vocab["n_rows"] == len(df):
+        return list(vocab["categories"]), list(vocab["brands"])
+    return (
+        sorted(df["super_category"].dropna().astype(str).unique().tolist()),
+        sorted(df["brand"].dropna().astype(str).unique().tolist()),
+    )
+
+
+def build_market_cube(df: pd.DataFrame, seller_diversity: bool = False) -> MarketCube:
+    """`seller_diversity`: tính sẵn chỉ số đa dạng của mọi seller trên cả catalogue (không phụ thuộc query)."""
+    return MarketCube.build(df, _COLUMN_MAP, seller_diversity=seller_diversity)
+
+
+def set_market_cube(cube: Optional[MarketCube]) -> None:
+    global _MARKET_CUBE, _CUBE_CATEGORIES
+    _MARKET_CUBE = cube
+    _CUBE_CATEGORIES = {_normalize_text(n): n for n in cube.category_names()} if cube is not None else {}
+
+
+def build_filter_index(df: pd.DataFrame) -> FilterIndex:
+    cols = [_COLUMN_MAP[c] for c in ("platform", "category", "categories", "brand")]
+    return FilterIndex.build(df, cols, review_col=_COLUMN_MAP["review_count"])
+
+
+def set_filter_index(index: Optional[FilterIndex]) -> None:
+    global _FILTER_INDEX
+    _FILTER_INDEX = index
+
+
+def _filter_positions(
+    df: pd.DataFrame,
+    detected_category: Optional[str],
+    platforms: Optional[List[str]],
+    brand: Optional[str],
+    min_reviews: int,
+) -> Optional[np.ndarray]:
+    """
+    Vị trí (tăng dần) các row của `df` qua metadata filter; None nghĩa là không lọc gì.
+    Có filter index thì tra index (kèm cache tổ hợp filter), không thì quét chuỗi bằng pandas.
+    """
+    cat_col = _COLUMN_MAP["category"]
+    cat_hier_col = _COLUMN_MAP["categories"]
+    brand_col = _COLUMN_MAP["brand"]
+    platform_col = _COLUMN_MAP["platform"]
+    review_col = _COLUMN_MAP["review_count"]
+
+    cat_lower = detected_category.lower() if detected_category else None
+    brand_norm = brand.lower() if brand else None
+
+    index = _FILTER_INDEX
+    if index is not None and index.n_rows == len(df):
+        return index.rows(
+            platforms=platforms,
+            category=cat_lower,
+            brand=brand_norm,
+            min_reviews=min_reviews,
+            platform_col=platform_col,
+            cat_col=cat_col,
+            cat_hier_col=cat_hier_col,
+            brand_col=brand_col,
+        )
+
+    mask = np.ones(len(df), dtype=bool)
+    filtered = False
+    if cat_lower:
+        cond = df[cat_col].astype(str).str.lower().eq(cat_lower)
+        if cat_hier_col in df.columns:
+            cond = cond | df[cat_hier_col].astype(str).str.lower().str.contains(cat_lower)
+        mask &= cond.to_numpy(dtype=bool)
+        filtered = True
+    if platforms:
+        mask &= df[platform_col].isin(platforms).to_numpy(dtype=bool)
+        filtered = True
+    if review_col in df.columns and min_reviews > 0:
+        reviews = pd.to_numeric(df[review_col], errors="coerce").fillna(0)
+        mask &= (reviews >= min_reviews).to_numpy(dtype=bool)
+        filtered = True
+    if brand_norm:
+        mask &= df[brand_col].astype(str).str.lower().str.contains(brand_norm).to_numpy(dtype=bool)
+        filtered = True
+    return np.flatnonzero(mask) if filtered else None
+
+
+def _token_index_for(df: pd.DataFrame) -> Optional[TokenIndex]:
+    """Token index dùng được cho `df` (dựng từ chính catalogue này, row id = index label)."""
+    index = _TOKEN_INDEX
+    if index is None or index.n_rows != len(df):
+        return None
+    return index
+
+
+def _phrase_mask(df: pd.DataFrame, hits: pd.DataFrame, q_norm: str) -> np.ndarray:
+    """
+    Mask các hit có `q_norm` nằm trong tên đã chuẩn hóa.
+    Có token index thì tra substring trên index (tên chuẩn hóa sẵn lúc load),
+    không chạy lại regex cho từng row.
+    """
+    if not q_norm:
+        return np.ones(len(hits), dtype=bool)
+    index = _token_index_for(df)
+    if index is not None:
+        return np.isin(hits.index.to_numpy(), index.substring_rows(q_norm))
+
+    name_col = _safe_column(hits, "name")
+
+    def has_phrase(txt: str) -> bool:
+        return q_norm in _normalize_text(str(txt))
+
+    return hits[name_col].apply(has_phrase).to_numpy(dtype=bool)
+
+
+def _scatter_scores(idx: np.ndarray, rows: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Đặt `values` (theo row id `rows`) vào mảng điểm song song với `idx`; row khác = 0."""
+    out = np.zeros(len(idx), dtype=np.float64)
+    if len(rows) == 0 or len(idx) == 0:
+        return out
+    pos = np.searchsorted(idx, rows)
+    pos_clipped = np.minimum(pos, len(idx) - 1)
+    valid = (pos < len(idx)) & (idx[pos_clipped] == rows)
+    out[pos[valid]] = values[valid]
+    return out
+
+
+def _indexed_lexical_scores(
+    index: TokenIndex,
+    query: str,
+    idx: np.ndarray,
+    lexical: str = "jaccard",
+) -> np.ndarray:
+    """
+    Điểm lexical tính từ posting list + bonus substring, trả về mảng song song với `idx`.
+    lexical="jaccard": Jaccard trên tập token; "bm25": BM25 chia cho điểm cao nhất
+    toàn catalogue (về [0, 1], không phụ thuộc metadata filter).
+    """
+    q_tokens = set(_tokenize(query))
+    q_norm = _normalize_text(query)
+
+    if lexical == "bm25":
+        rows, scores = index.bm25(q_tokens)
+        if len(scores):
+            scores = scores / scores.max()
+    else:
+        rows, scores = index.jaccard(q_tokens)
+    out = _scatter_scores(idx, rows, scores)
+    if q_norm:
+        phrase_rows = index.substring_rows(q_norm)
+        out += _scatter_scores(idx, phrase_rows, np.full(len(phrase_rows), 0.3))
+    return out
+
+
+# Gom embedding của các row ứng viên theo từng khối để bộ nhớ tạm không phình theo tập lọc
+_GATHER_CHUNK_ROWS = 65_536
+
+
+def _vector_scores(q_vec: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Điểm cosine của `rows` với query. Chỉ nhân phần embedding của các row còn lại
+    sau metadata filter (chi phí tỉ lệ với tập lọc), trừ khi tập lọc là cả catalogue.
+    `q_vec` dạng (dim, m) cho m query cùng lúc -> kết quả (len(rows), m).
+    """
+    if len(rows) == len(_PRODUCT_EMB):
+        scores = _PRODUCT_EMB @ q_vec
+        return scores[rows]
+    out = np.empty((len(rows),) + q_vec.shape[1:], dtype=np.result_type(_PRODUCT_EMB.dtype, q_vec.dtype))
+    for start in range(0, len(rows), _GATHER_CHUNK_ROWS):
+        block = rows[start:start + _GATHER_CHUNK_ROWS]
+        out[start:start + len(block)] = _PRODUCT_EMB[block] @ q_vec
+    return out
+
+
+def _ann_candidates(
+    q_vec: np.ndarray,
+    max_rows: Optional[int],
+    allowed_rows: np.ndarray,
+) -> Optional[np.ndarray]:
+    """
+    Lấy top-N row id từ ANN index, chỉ giữ các row còn lại sau metadata filter.
+    Trả về None khi phải fallback về tìm kiếm exact:
+    - chưa có index / không giới hạn max_rows,
+    - số ứng viên cần lấy gần bằng cả catalogue,
+    - filter quá hẹp khiến số ứng viên ANN còn sống < max_rows.
+    """
+    if _VECTOR_INDEX is None or max_rows is None or _PRODUCT_EMB is None:
+        return None
+    if _VECTOR_INDEX.n_rows != len(_PRODUCT_EMB):
+        return None
+
+    k = max(max_rows * _ANN_OVERSAMPLE, _ANN_MIN_CANDIDATES)
+    if k * 2 >= _VECTOR_INDEX.n_rows:
+        return None
+
+    rows, _ = _VECTOR_INDEX.search(q_vec, k)
+    rows = rows[np.isin(rows, allowed_rows)]
+    if len(rows) < max_rows:
+        return None
+    return rows
+
+
 def hybrid_search(
     df: pd.DataFrame,
     query: str,
@@ -130,35 +482,67 @@ def hybrid_search(
     max_rows: Optional[int] = None,
     alpha: float = 0.5,
     beta: float = 0.5,
+    typo_tolerant: bool = False,
+    lexical: str = "jaccard",
 ) -> pd.DataFrame:
+    """
+    lexical: "jaccard" (mặc định) hoặc "bm25" cho phần điểm lexical (cộng bonus substring 0.3).
+    typo_tolerant=True: chỉ xét các row chứa token gần giống (trigram) token của query
+    và chấm điểm lexical theo query đã sửa theo vocab -> tập ứng viên hẹp, chịu được gõ sai.
+    Cần token index; nếu không tìm được token nào gần giống thì tìm kiếm như bình thường.
+    """
+    if lexical not in ("jaccard", "bm25"):
+        raise ValueError(f"lexical phải là 'jaccard' hoặc 'bm25', nhận '{lexical}'")
+
+    # Vị trí (trong `df`) của các row qua metadata filter
+    pos = _filter_positions(df, detected_category, platforms, brand, min_reviews)
+    if pos is None:
+        pos = np.arange(len(df))
+    return _rank_positions(df, pos, query, max_rows, alpha, beta, typo_tolerant, lexical)
+
+
+def _rank_positions(
+    df: pd.DataFrame,
+    pos: np.ndarray,
+    query: str,
+    max_rows: Optional[int],
+    alpha: float,
+    beta: float,
+    typo_tolerant: bool = False,
+    lexical: str = "jaccard",
+    q_scores: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """
+    Phần chấm điểm + xếp hạng của hybrid_search trên các vị trí `pos` đã qua filter.
+    `q_scores`: điểm vector đã tính sẵn (song song với `pos`, VD từ batch nhiều query);
+    khi có thì không encode / không dùng ANN.
+    """
     name_col = _safe_column(df, "name")
-    cat_col = _safe_column(df, "category")
-    cat_hier_col = _safe_column(df, "categories")
-    brand_col = _safe_column(df, "brand")
-
-    data = df
-
-    if detected_category:
-        cat_lower = detected_category.lower()
-        cond_cat = data[cat_col].astype(str).str.lower().eq(cat_lower)
-        if cat_hier_col in data.columns:
-            cond_cat_hier = data[cat_hier_col].astype(str).str.lower().str.contains(cat_lower)
-            cond = cond_cat | cond_cat_hier
-        else:
-            cond = cond_cat
-        data = data[cond]
-
-    data = _apply_platform_filter(data, platforms)
-    data = _apply_min_reviews(data, min_reviews)
-
-    if brand:
-        brand_norm = brand.lower()
-        data = data[data[brand_col].astype(str).str.lower().str.contains(brand_norm)]
-
-    if data.empty:
-        return data
-
-    if query:
+    if len(pos) == 0:
+        return df.iloc[:0]
+
+    # Chấm điểm trên mảng NumPy song song với `pos`; chỉ materialize top-k row cuối cùng
+    idx = df.index.to_numpy()[pos]
+    index = _token_index_for(df)
+    use_index = index is not None and df.index.is_monotonic_increasing
+    lexical_query = query
+    if query and typo_tolerant and use_index:
+        fuzzy_rows, corrected = index.fuzzy_rows(_tokenize(query), _TYPO_MIN_SIMILARITY)
+        if len(fuzzy_rows):
+            keep = np.isin(idx, fuzzy_rows)
+            pos, idx = pos[keep], idx[keep]
+            if q_scores is not None:
+                q_scores = q_scores[keep]
+            lexical_query = " ".join(corrected)
+            if len(pos) == 0:
+                return df.iloc[:0]
+
+    if query and use_index:
+        lexical_scores = _indexed_lexical_scores(index, lexical_query, idx, lexical)
+    elif query and lexical == "bm25":
+        # Chưa có index dùng được cho df này: dựng tạm (BM25 cần thống kê toàn catalogue)
+        lexical_scores = _indexed_lexical_scores(build_token_index(df), lexical_query, pos, lexical)
+    elif query:
         q_tokens = set(_tokenize(query))
         q_norm = _normalize_text(query)
 
@@ -175,33 +559,40 @@ def hybrid_search(
                 bonus = 0.3
             return jaccard + bonus
 
-        lexical_scores = data[name_col].astype(str).apply(score_row)
+        lexical_scores = df[name_col].iloc[pos].astype(str).apply(score_row).to_numpy(dtype=np.float64)
     else:
-        lexical_scores = pd.Series(0.0, index=data.index)
-
-    vector_scores = pd.Series(0.0, index=data.index)
-    if query and _PRODUCT_EMB is not None:
-        q_vec = _EMB_MODEL.encode(
-            [query],
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-        )[0]
-        idx = data.index.to_numpy()
-        vec_scores_full = _PRODUCT_EMB @ q_vec
-        vector_scores = pd.Series(vec_scores_full[idx], index=data.index)
+        lexical_scores = np.zeros(len(pos), dtype=np.float64)
+
+    # Vị trí (trong `pos`) của các row được chấm điểm vector
+    positions = np.arange(len(pos))
+    vector_scores = np.zeros(len(pos), dtype=np.float64)
+    if query and q_scores is not None:
+        vector_scores = q_scores
+    elif query and _PRODUCT_EMB is not None:
+        q_vec = encode_query(query)
+        ann_rows = _ann_candidates(q_vec, max_rows, idx)
+        if ann_rows is not None:
+            # Chỉ chấm điểm vector cho ứng viên ANN + các row có điểm lexical
+            positions = np.flatnonzero(np.isin(idx, ann_rows) | (lexical_scores > 0))
+            lexical_scores = lexical_scores[positions]
+        elif _SHARDED_SEARCH is not None and _SHARDED_SEARCH.accepts(_PRODUCT_EMB, idx):
+            # Tập ứng viên lớn: chấm điểm + top-k theo shard trên nhiều process rồi gộp
+            order = _SHARDED_SEARCH.rank(q_vec, idx, lexical_scores, alpha, beta, max_rows)
+            return df.iloc[pos[order]]
+        vector_scores = _vector_scores(q_vec, idx[positions])
 
     if query:
         final_scores = alpha * lexical_scores + beta * vector_scores
     else:
         final_scores = vector_scores
 
-    data = data.assign(_hybrid_score=final_scores)
-    data = data[data["_hybrid_score"] > 0].sort_values("_hybrid_score", ascending=False)
-
+    hit = np.flatnonzero(final_scores > 0)
     if max_rows is not None:
-        data = data.head(max_rows)
+        order = hit[_top_k(final_scores[hit], max_rows)]
+    else:
+        order = hit[np.argsort(-final_scores[hit], kind="stable")]
 
-    return data.drop(columns=["_hybrid_score"])
+    return df.iloc[pos[positions[order]]]
 
 
 _CATEGORY_KEYWORDS = {
@@ -467,7 +858,13 @@ def resolve_product(
     df: pd.DataFrame,
     hint: Optional[Dict[str, Any]] = None,
     max_rows: int = 200,
+    has_hits: Optional[bool] = None,
 ) -> Dict[str, Any]:
+    """
+    `has_hits`: kết quả search chính đã có hit hay chưa. Nếu caller đã search
+    (VD _run_search) thì truyền vào để khỏi chạy thêm 1 lượt hybrid_search;
+    để None thì hàm tự search (chỉ khi được gọi độc lập).
+    """
 
     query = A or ""
     tokens = _tokenize(query)
@@ -489,17 +886,19 @@ def resolve_product(
     notes_parts = []
 
     # Hybrid search chỉ để xem có hit hay không (không dùng để đoán brand/category)
-    hits = hybrid_search(
-        df=df,
-        query=A,
-        detected_category=None,
-        platforms=platforms,
-        brand=None,
-        min_reviews=min_reviews,
-        max_rows=max_rows,
-    )
+    if has_hits is None:
+        hits = hybrid_search(
+            df=df,
+            query=A,
+            detected_category=None,
+            platforms=platforms,
+            brand=None,
+            min_reviews=min_reviews,
+            max_rows=max_rows,
+        )
+        has_hits = not hits.empty
 
-    if not hits.empty:
+    if has_hits:
         notes_parts.append("hybrid_search_hits")
         confidence += 0.1
 
@@ -531,7 +930,23 @@ def resolve_product(
 
 
 
-def _search_df_core(
+def _search_filters(
+    hint: Optional[Dict[str, Any]],
+    min_reviews: int,
+) -> Tuple[Dict[str, Any], Optional[str], List[str], Optional[str]]:
+    """hint (đã bổ sung min_reviews), category, platforms, brand dùng để lọc khi search."""
+    hint = dict(hint or {})
+    if "min_reviews" not in hint:
+        hint["min_reviews"] = min_reviews
+
+    # ❗ Dùng đúng HINT, không dùng predicted brand/category
+    detected_category = hint.get("category")
+    brand_guess = hint.get("brand")
+    platforms = hint.get("platforms") or _DEFAULT_PLATFORMS
+    return hint, detected_category, platforms, brand_guess
+
+
+def _run_search(
     df: pd.DataFrame,
     A: str,
     catalog_categories: List[str],
@@ -540,12 +955,27 @@ def _search_df_core(
     min_reviews: int = 0,
     max_rows: int = 500,
     enforce_phrase: bool = True,
-) -> Tuple[pd.DataFrame, Dict[str, Any]]:
-    hint = dict(hint or {})
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
+    hits: Optional[pd.DataFrame] = None,
+) -> "SearchResult":
+    """`hits`: kết quả hybrid_search(max_rows * 3) đã tính sẵn (VD từ batch) thì không search lại."""
+    hint, detected_category, platforms, brand_guess = _search_filters(hint, min_reviews)
+
+    if hits is not None:
+        df_hits = hits
+    else:
+        df_hits = hybrid_search(
+            df=df,
+            query=A,
+            detected_category=detected_category,
+            platforms=platforms,
+            brand=brand_guess,
+            min_reviews=hint["min_reviews"],
+            max_rows=max_rows * 3,
+            alpha=0.5,
+            beta=0.5,
+        )
 
-    # ❗ Quan trọng: luôn dùng _RESOLVE_MAX_ROWS để resolve category/brand
+    # Confidence / notes lấy từ chính lượt search này, không search thêm lượt nữa
     resolution = resolve_product(
         A=A,
         catalog_categories=catalog_categories,
@@ -553,52 +983,22 @@ def _search_df_core(
         df=df,
         hint=hint,
         max_rows=_RESOLVE_MAX_ROWS,
+        has_hits=not df_hits.empty,
     )
 
-    # ❗ Dùng đúng HINT, không dùng predicted brand/category
-    detected_category = hint.get("category")
-    brand_guess = hint.get("brand")
-
-    platforms = resolution["data"]["platforms"] or _DEFAULT_PLATFORMS
-
-    if "platforms" in hint and hint["platforms"]:
-        platforms = hint["platforms"]
-    if "category" in hint and hint["category"]:
-        detected_category = hint["category"]
-    if "brand" in hint and hint["brand"]:
-        brand_guess = hint["brand"]
-
-    df_hits = hybrid_search(
-        df=df,
-        query=A,
-        detected_category=detected_category,
-        platforms=platforms,
-        brand=brand_guess,
-        min_reviews=hint.get("min_reviews", min_reviews),
-        max_rows=max_rows * 3,
-        alpha=0.5,
-        beta=0.5,
-    )
-
-    name_col = _safe_column(df_hits, "name")
-
+    # Vị trí của từng hit trong ranking hybrid (trước phrase filter)
+    ranks = np.arange(len(df_hits))
     if enforce_phrase and A:
-        q_norm = _normalize_text(A)
-
-        def has_phrase(txt: str) -> bool:
-            return q_norm in _normalize_text(str(txt))
-
-        df_hits = df_hits[df_hits[name_col].apply(has_phrase)]
-
-    if max_rows is not None and not df_hits.empty:
-        df_hits = df_hits.head(max_rows)
+        keep = _phrase_mask(df, df_hits, _normalize_text(A))
+        df_hits = df_hits[keep]
+        ranks = ranks[keep]
 
     filters_meta = {
         "platforms": platforms,
         "time_window": None,
         "brand": brand_guess,
         "sku": None,
-        "min_reviews": hint.get("min_reviews", min_reviews),
+        "min_reviews": hint["min_reviews"],
     }
 
     confidence = resolution["meta"]["confidence"]
@@ -613,7 +1013,207 @@ def _search_df_core(
     )
     meta["brand_guess"] = brand_guess
 
-    return df_hits, meta
+    return SearchResult(hits=df_hits, ranks=ranks, meta=meta, max_rows=max_rows)
+
+
+def _search_df_core(
+    df: pd.DataFrame,
+    A: str,
+    catalog_categories: List[str],
+    brand_list: List[str],
+    hint: Optional[Dict[str, Any]] = None,
+    min_reviews: int = 0,
+    max_rows: int = 500,
+    enforce_phrase: bool = True,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    result = _run_search(
+        df=df,
+        A=A,
+        catalog_categories=catalog_categories,
+        brand_list=brand_list,
+        hint=hint,
+        min_reviews=min_reviews,
+        max_rows=max_rows,
+        enforce_phrase=enforce_phrase,
+    )
+    return result.top(max_rows)
+
+
+@dataclass
+class SearchResult:
+    """
+    Kết quả 1 lần search ở `max_rows` rộng nhất.
+    `top(m)` cho ra đúng kết quả của `_search_df_core(max_rows=m)` với mọi m <= max_rows:
+    giữ các hit có rank hybrid < m * 3 (đã qua phrase filter) rồi lấy m dòng đầu.
+    """
+
+    hits: pd.DataFrame
+    ranks: np.ndarray
+    meta: Dict[str, Any]
+    max_rows: int
+
+    def top(self, max_rows: Optional[int]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        if max_rows is None:
+            max_rows = self.max_rows
+        if max_rows > self.max_rows:
+            raise ValueError(f"max_rows={max_rows} vượt quá phạm vi đã search ({self.max_rows})")
+        df_hits = self.hits
+        if max_rows < self.max_rows:
+            df_hits = df_hits[self.ranks < max_rows * 3]
+        if not df_hits.empty:
+            df_hits = df_hits.head(max_rows)
+        # fe_* sửa meta["notes"] tại chỗ -> mỗi lần trả về 1 bản sao
+        return df_hits, copy.deepcopy(self.meta)
+
+
+# Số hit mỗi metric xét (giống max_rows của fe_* tương ứng); metric không có ở đây dùng 2000
+_METRIC_MAX_ROWS = {"price_stats": 500}
+
+
+def _normalize_hint(
+    hint: Optional[Dict[str, Any]],
+    platforms: Optional[List[str]],
+    min_reviews: int,
+) -> Dict[str, Any]:
+    hint = dict(hint or {})
+    if platforms:
+        hint["platforms"] = platforms
+    if "min_reviews" not in hint:
+        hint["min_reviews"] = min_reviews
+    return hint
+
+
+class AnalysisContext:
+    """
+    Ngữ cảnh phân tích dùng chung cho mọi fe_* trong 1 tool call.
+
+    Tính catalog_categories / brand_list 1 lần và chạy search 1 lần ở `max_rows`
+    rộng nhất; mỗi fe_* lấy tập hit của mình qua `SearchResult.top(...)`.
+    fe_* nào có bộ lọc khác (VD truyền thêm brand) sẽ tự search riêng.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        A: str,
+        platforms: Optional[List[str]] = None,
+        min_reviews: int = 0,
+        hint: Optional[Dict[str, Any]] = None,
+        max_rows: int = 2000,
+        enforce_phrase: bool = True,
+    ):
+        self.df = df
+        self.A = A
+        self.min_reviews = min_reviews
+        self.hint = _normalize_hint(hint, platforms, min_reviews)
+        self.max_rows = max_rows
+        self.enforce_phrase = enforce_phrase
+        self._catalog_categories: Optional[List[str]] = None
+        self._brand_list: Optional[List[str]] = None
+        self._result: Optional[SearchResult] = None
+        self._cube: Optional[Tuple[CubeAggregator, Dict[str, Any]]] = None
+        self._cube_checked = False
+
+    @property
+    def catalog_categories(self) -> List[str]:
+        if self._catalog_categories is None:
+            self._catalog_categories, self._brand_list = catalog_vocab(self.df)
+        return self._catalog_categories
+
+    @property
+    def brand_list(self) -> List[str]:
+        if self._brand_list is None:
+            self._catalog_categories, self._brand_list = catalog_vocab(self.df)
+        return self._brand_list
+
+    def covers(
+        self,
+        df: pd.DataFrame,
+        A: str,
+        hint: Dict[str, Any],
+        enforce_phrase: bool = True,
+    ) -> bool:
+        return (
+            df is self.df
+            and A == self.A
+            and hint == self.hint
+            and enforce_phrase == self.enforce_phrase
+        )
+
+    def cube_scope(self) -> Optional[Tuple[CubeAggregator, Dict[str, Any]]]:
+        """Phạm vi market cube của context (xem _cube_scope), tính 1 lần."""
+        if not self._cube_checked:
+            self._cube = _cube_scope(self.df, self.A, self.hint, self.min_reviews)
+            self._cube_checked = True
+        return self._cube
+
+    def aggregate(self, metrics: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Nhiều metric trên tập hit của context trong 1 lượt (HitAggregator dùng chung
+        factorize / bảng nhóm). `metrics`: tên metric -> tham số,
+        VD {"top_brands": {"by": "revenue_est"}, "roi": {"group_by": "brand"}}.
+        Trả về tên metric -> {"data", "meta"} giống hệt fe_* tương ứng
+        (kể cả khi trả lời từ market cube).
+        """
+        out = {}
+        by_rows: Dict[int, List[str]] = {}
+        for metric, params in metrics.items():
+            params = params or {}
+            scope = self.cube_scope() if _MARKET_CUBE is not None and _MARKET_CUBE.supports(metric, params) else None
+            if scope is not None:
+                aggregator, meta = scope
+                out[metric] = _metric_output(aggregator.df, copy.deepcopy(meta), metric, aggregator, **params)
+            else:
+                by_rows.setdefault(_METRIC_MAX_ROWS.get(metric, 2000), []).append(metric)
+
+        for max_rows, names in by_rows.items():
+            df_hits, meta = self.search(max_rows)
+            aggregator = HitAggregator(df_hits, _COLUMN_MAP)
+            for metric in names:
+                params = metrics[metric] or {}
+                out[metric] = _metric_output(df_hits, copy.deepcopy(meta), metric, aggregator, **params)
+        return {metric: out[metric] for metric in metrics}
+
+    def search(self, max_rows: int) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        if self._result is None or max_rows > self._result.max_rows:
+            self._result = _run_search(
+                df=self.df,
+                A=self.A,
+                catalog_categories=self.catalog_categories,
+                brand_list=self.brand_list,
+                hint=self.hint,
+                min_reviews=self.min_reviews,
+                max_rows=max(max_rows, self.max_rows),
+                enforce_phrase=self.enforce_phrase,
+            )
+        return self._result.top(max_rows)
+
+
+def _search_for_fe(
+    df: pd.DataFrame,
+    A: str,
+    hint: Dict[str, Any],
+    min_reviews: int,
+    max_rows: int,
+    context: Optional[AnalysisContext] = None,
+    enforce_phrase: bool = True,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Tập hit cho 1 fe_*: lấy từ context nếu cùng bộ lọc, ngược lại tự search."""
+    if context is not None and context.covers(df, A, hint, enforce_phrase):
+        return context.search(max_rows)
+
+    catalog_categories, brand_list = catalog_vocab(df)
+
+    return _search_df_core(
+        df=df,
+        A=A,
+        catalog_categories=catalog_categories,
+        brand_list=brand_list,
+        hint=hint,
+        min_reviews=min_reviews,
+        max_rows=max_rows,
+        enforce_phrase=enforce_phrase,
+    )
 
 
 # def search_products_hybrid(
@@ -673,129 +1273,249 @@ def search_products_hybrid(
     min_reviews: int = 0,
     max_rows: int = 50,
     enforce_phrase: bool = True,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
     
     # --- CẬP NHẬT 2: Tự động lấy danh sách Category/Brand từ DF nếu không truyền vào ---
     # Điều này giúp tools_real.py gọi hàm ngắn gọn hơn, không cần chuẩn bị list này
-    if catalog_categories is None:
-        catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    
-    if brand_list is None:
-        brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
+    if catalog_categories is None or brand_list is None:
+        cats, brands = catalog_vocab(df)
+        catalog_categories = cats if catalog_categories is None else catalog_categories
+        brand_list = brands if brand_list is None else brand_list
 
     # --- CẬP NHẬT 3: Đưa platforms vào hint để _search_df_core hiểu ---
     hint = dict(hint or {})
     if platforms:
         hint["platforms"] = platforms
 
-    # Gọi hàm lõi
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=max_rows,
-        enforce_phrase=enforce_phrase,
-    )
-
-    records: List[Dict[str, Any]] = []
-    for _, row in df_hits.iterrows():
-        records.append(
-            {
-                "sku": row.get("sku"),
-                "product_name": row.get("product_name"),
-                "platform": row.get("platform"),
-                "super_category": row.get("super_category"),
-                "categories": row.get("categories"),
-                "brand": row.get("brand"),
-                "price": float(row.get("price", 0) or 0),
-                "sold": float(row.get("sold", 0) or 0),
-                "rating": float(row.get("rating", 0) or 0),
-                "review_count": int(row.get("review_count", 0) or 0),
-                "seller_name": row.get("seller_name"),
-                "url": row.get("url"),
-            }
+    # Gọi hàm lõi (dùng lại tập hit của context nếu cùng bộ lọc)
+    if context is not None and context.covers(
+        df, A, _normalize_hint(hint, platforms, min_reviews), enforce_phrase
+    ):
+        df_hits, meta = context.search(max_rows)
+    else:
+        df_hits, meta = _search_df_core(
+            df=df,
+            A=A,
+            catalog_categories=catalog_categories,
+            brand_list=brand_list,
+            hint=hint,
+            min_reviews=min_reviews,
+            max_rows=max_rows,
+            enforce_phrase=enforce_phrase,
         )
 
     return {
-        "data": records,
+        "data": _hits_to_records(df_hits),
         "meta": meta,
     }
 
-def fe_describe_price(
+
+# Cột record sản phẩm theo thứ tự output: (tên, kiểu) – None = giữ nguyên giá trị
+_RECORD_FIELDS = [
+    ("sku", None),
+    ("product_name", None),
+    ("platform", None),
+    ("super_category", None),
+    ("categories", None),
+    ("brand", None),
+    ("price", float),
+    ("sold", float),
+    ("rating", float),
+    ("review_count", int),
+    ("seller_name", None),
+    ("url", None),
+]
+
+
+def _record_column(df_hits: pd.DataFrame, name: str, kind: Optional[type]) -> Union[np.ndarray, List[Any]]:
+    """
+    1 cột record dạng mảng / list (không duyệt từng row bằng Python khi cột là số).
+    Cùng quy ước với `float(row.get(name, 0) or 0)` / `int(...)`: thiếu cột hoặc None -> 0, NaN giữ NaN
+    (review_count NaN -> 0).
+    """
+    if name not in df_hits.columns:
+        return np.zeros(len(df_hits), dtype=np.float64 if kind is float else np.int64) if kind else [None] * len(df_hits)
+    col = df_hits[name]
+    if kind is None:
+        return col.tolist()
+    if not pd.api.types.is_numeric_dtype(col):
+        return [kind(v or 0) for v in col.tolist()]
+    values = col.to_numpy(dtype=np.float64, na_value=np.nan)
+    if kind is int:
+        return np.nan_to_num(values, nan=0.0).astype(np.int64)
+    return values
+
+
+def _hits_to_records(df_hits: pd.DataFrame) -> List[Dict[str, Any]]:
+    return records({name: _record_column(df_hits, name, kind) for name, kind in _RECORD_FIELDS})
+
+
+def search_products_hybrid_batch(
     df: pd.DataFrame,
-    A: str,
+    queries: List[str],
     platforms: Optional[List[str]] = None,
-    min_reviews: int = 0,
-    by_platform: bool = True,
+    catalog_categories: Optional[List[str]] = None,
+    brand_list: Optional[List[str]] = None,
     hint: Optional[Dict[str, Any]] = None,
-) -> Dict[str, Any]:
+    min_reviews: int = 0,
+    max_rows: int = 50,
+    enforce_phrase: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    search_products_hybrid cho nhiều query cùng bộ lọc (job hằng đêm, dashboard so sánh).
+
+    Lọc metadata 1 lần, encode mọi query trong 1 batch và chấm điểm vector cho tất cả
+    bằng 1 phép nhân ma trận–ma trận (tìm kiếm exact, không qua ANN).
+    Trả về list kết quả theo đúng thứ tự `queries`, mỗi phần tử cùng dạng search_products_hybrid.
+    """
+    queries = list(queries)
+    if catalog_categories is None or brand_list is None:
+        cats, brands = catalog_vocab(df)
+        catalog_categories = cats if catalog_categories is None else catalog_categories
+        brand_list = brands if brand_list is None else brand_list
+
     hint = dict(hint or {})
     if platforms:
         hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
+    hint, detected_category, search_platforms, brand_guess = _search_filters(hint, min_reviews)
+
+    pos = _filter_positions(df, detected_category, search_platforms, brand_guess, hint["min_reviews"])
+    if pos is None:
+        pos = np.arange(len(df))
+
+    # Cột j của `scores` = điểm vector của query thứ j (chỉ với query khác rỗng)
+    scores = None
+    with_text = [j for j, q in enumerate(queries) if q]
+    if with_text and _PRODUCT_EMB is not None and len(pos):
+        q_mat = encode_queries([queries[j] for j in with_text])
+        scores = _vector_scores(q_mat.T, df.index.to_numpy()[pos])
+    col_of = {j: c for c, j in enumerate(with_text)}
+
+    results: List[Dict[str, Any]] = []
+    for j, A in enumerate(queries):
+        q_scores = scores[:, col_of[j]] if scores is not None and j in col_of else None
+        hits = _rank_positions(df, pos, A, max_rows * 3, 0.5, 0.5, q_scores=q_scores)
+        df_hits, meta = _run_search(
+            df=df,
+            A=A,
+            catalog_categories=catalog_categories,
+            brand_list=brand_list,
+            hint=hint,
+            min_reviews=min_reviews,
+            max_rows=max_rows,
+            enforce_phrase=enforce_phrase,
+            hits=hits,
+        ).top(max_rows)
+        results.append({"data": _hits_to_records(df_hits), "meta": meta})
+    return results
+
+
+def _cube_scope(
+    df: pd.DataFrame,
+    A: str,
+    hint: Dict[str, Any],
+    min_reviews: int,
+) -> Optional[Tuple[CubeAggregator, Dict[str, Any]]]:
+    """
+    (aggregator trên các cell thỏa filter, meta) khi trả lời được từ market cube: từ khóa rỗng
+    hoặc chính là tên danh mục (super_category / categories) và không lọc min_reviews.
+    None nếu phải search. Kết quả là toàn bộ thị trường thỏa filter, không phải top hit.
+    """
+    cube = _MARKET_CUBE
+    if cube is None or cube.n_rows != len(df):
+        return None
+    hint, detected_category, platforms, brand_guess = _search_filters(hint, min_reviews)
+    if hint["min_reviews"] > 0:
+        return None
+    query = _normalize_text(A or "")
+    keyword_category = _CUBE_CATEGORIES.get(query) if query else None
+    if query and keyword_category is None:
+        return None
+
+    categories = [c.lower() for c in (detected_category, keyword_category) if c]
+    cells = cube.select(platforms, categories, brand_guess.lower() if brand_guess else None)
+
+    notes_parts = ["market_cube", f"keyword_category={keyword_category}" if keyword_category else "whole_market"]
+    if detected_category:
+        notes_parts.append(f"category_from_hint={detected_category}")
+    if brand_guess:
+        notes_parts.append(f"brand_from_hint={brand_guess}")
+    meta = _build_meta(
+        product_query=A,
+        detected_category=detected_category or keyword_category,
+        confidence=0.2 if len(cells) else 0.1,
+        filters={
+            "platforms": platforms,
+            "time_window": None,
+            "brand": brand_guess,
+            "sku": None,
+            "min_reviews": hint["min_reviews"],
+        },
+        notes="; ".join(notes_parts),
+    )
+    meta["brand_guess"] = brand_guess
+    return cube.aggregator(cells, platform_only=not categories and not brand_guess), meta
 
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
 
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=500,
-        enforce_phrase=True,
+def _fe_metric(
+    df: pd.DataFrame,
+    A: str,
+    hint: Dict[str, Any],
+    min_reviews: int,
+    context: Optional[AnalysisContext],
+    metric: str,
+    /,
+    **params,
+) -> Dict[str, Any]:
+    """
+    1 metric của fe_*: lấy từ market cube nếu được (xem _cube_scope), ngược lại
+    search (dùng chung context nếu cùng bộ lọc) rồi tính trên tập hit.
+    """
+    if _MARKET_CUBE is not None and _MARKET_CUBE.supports(metric, params):
+        if context is not None and context.covers(df, A, hint):
+            scope = context.cube_scope()
+        else:
+            scope = _cube_scope(df, A, hint, min_reviews)
+        if scope is not None:
+            aggregator, meta = scope
+            return _metric_output(aggregator.df, copy.deepcopy(meta), metric, aggregator, **params)
+
+    df_hits, meta = _search_for_fe(
+        df, A, hint, min_reviews, max_rows=_METRIC_MAX_ROWS.get(metric, 2000), context=context
     )
+    return _metric_output(df_hits, meta, metric, None, **params)
 
-    price_col = _safe_column(df_hits, "price")
-    platform_col = _safe_column(df_hits, "platform")
-
-    if df_hits.empty:
-        meta["notes"] += "; no data"
-        return {"data": [], "meta": meta}
-
-    def agg(group: pd.DataFrame) -> Dict[str, Any]:
-        prices = pd.to_numeric(group[price_col], errors="coerce").dropna()
-        if prices.empty:
-            return {
-                "min_price": 0.0,
-                "q10": 0.0,
-                "median_price": 0.0,
-                "mean_price": 0.0,
-                "q90": 0.0,
-                "max_price": 0.0,
-                "std_price": 0.0,
-                "count": 0,
-            }
-        return {
-            "min_price": float(prices.min()),
-            "q10": float(np.quantile(prices, 0.1)),
-            "median_price": float(np.median(prices)),
-            "mean_price": float(prices.mean()),
-            "q90": float(np.quantile(prices, 0.9)),
-            "max_price": float(prices.max()),
-            "std_price": float(prices.std(ddof=1)) if len(prices) > 1 else 0.0,
-            "count": int(len(prices)),
-        }
 
-    if by_platform:
-        rows = []
-        for platform, g in df_hits.groupby(platform_col):
-            s = agg(g)
-            s["platform"] = platform
-            rows.append(s)
-        data = rows
-    else:
-        s = agg(df_hits)
-        data = [s]
+def _metric_output(
+    df_hits: pd.DataFrame,
+    meta: Dict[str, Any],
+    metric: str,
+    aggregator: Optional[HitAggregator] = None,
+    /,
+    **params,
+) -> Dict[str, Any]:
+    """Chạy 1 metric của HitAggregator trên tập hit và gộp notes / meta như các fe_*."""
+    if aggregator is None:
+        aggregator = HitAggregator(df_hits, _COLUMN_MAP)
+    result = aggregator.compute(metric, **params)
+    meta["notes"] += result.notes
+    meta.update(result.meta)
+    return {"data": result.data, "meta": meta}
+
+
+def fe_describe_price(
+    df: pd.DataFrame,
+    A: str,
+    platforms: Optional[List[str]] = None,
+    min_reviews: int = 0,
+    by_platform: bool = True,
+    hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
+) -> Dict[str, Any]:
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    meta["notes"] += "; fe_describe_price over search subset"
-    return {"data": data, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "price_stats", by_platform=by_platform)
 
 
 def fe_rating_distribution(
@@ -806,75 +1526,11 @@ def fe_rating_distribution(
     group_by_brand: bool = True,
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
-    hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
-
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
-
-    rating_col = _safe_column(df_hits, "rating")
-    brand_col = _safe_column(df_hits, "brand")
-
-    df_hits = df_hits.dropna(subset=[rating_col])
-    ratings = pd.to_numeric(df_hits[rating_col], errors="coerce").dropna()
-    if ratings.empty:
-        meta["notes"] += "; no rating data"
-        meta["bin_edges"] = []
-        return {"data": [], "meta": meta}
-
-    bin_edges = np.linspace(ratings.min(), ratings.max(), bins + 1)
-
-    records: List[Dict[str, Any]] = []
-
-    if group_by_brand:
-        for brand, g in df_hits.groupby(brand_col):
-            r = pd.to_numeric(g[rating_col], errors="coerce").dropna().values
-            if len(r) == 0:
-                continue
-            counts, edges = np.histogram(r, bins=bin_edges)
-            for i in range(len(edges) - 1):
-                if counts[i] == 0:
-                    continue
-                records.append(
-                    {
-                        "bucket_left": float(edges[i]),
-                        "bucket_right": float(edges[i + 1]),
-                        "count": int(counts[i]),
-                        "brand": brand,
-                    }
-                )
-    else:
-        counts, edges = np.histogram(ratings.values, bins=bin_edges)
-        for i in range(len(edges) - 1):
-            if counts[i] == 0:
-                continue
-            records.append(
-                {
-                    "bucket_left": float(edges[i]),
-                    "bucket_right": float(edges[i + 1]),
-                    "count": int(counts[i]),
-                    "brand": None,
-                }
-            )
-
-    meta["notes"] += "; fe_rating_distribution over search subset"
-    meta["bin_edges"] = [float(x) for x in bin_edges]
-    return {"data": records, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "rating_distribution", bins=bins, group_by_brand=group_by_brand)
 
 
 def fe_sold_distribution(
@@ -884,66 +1540,11 @@ def fe_sold_distribution(
     bins: Any = (0, 10, 50, 100, 500, 1000, 5000, 10000),
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
-    hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
-
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
-
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
-
-    sold_col = _safe_column(df_hits, "sold")
-    platform_col = _safe_column(df_hits, "platform")
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    df_hits = df_hits.dropna(subset=[sold_col])
-    if df_hits.empty:
-        meta["notes"] += "; no sold data"
-        meta["bin_edges"] = []
-        return {"data": [], "meta": meta}
-
-    sold_values = pd.to_numeric(df_hits[sold_col], errors="coerce").dropna()
-    if isinstance(bins, int):
-        bin_edges = np.linspace(sold_values.min(), sold_values.max(), bins + 1)
-    else:
-        bin_edges = np.array(list(bins), dtype=float)
-
-    records: List[Dict[str, Any]] = []
-    for platform, g in df_hits.groupby(platform_col):
-        s = pd.to_numeric(g[sold_col], errors="coerce").dropna().values
-        total_count = len(s)
-        if total_count == 0:
-            continue
-        counts, edges = np.histogram(s, bins=bin_edges)
-        for i in range(len(edges) - 1):
-            if counts[i] == 0:
-                continue
-            pct = counts[i] / total_count
-            records.append(
-                {
-                    "platform": platform,
-                    "bin_left": float(edges[i]),
-                    "bin_right": float(edges[i + 1]),
-                    "count": int(counts[i]),
-                    "pct": float(pct),
-                }
-            )
-
-    meta["notes"] += "; fe_sold_distribution over search subset"
-    meta["bin_edges"] = [float(x) for x in bin_edges]
-    return {"data": records, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "sold_distribution", bins=bins)
 
 
 def fe_category_count_plot(
@@ -954,50 +1555,14 @@ def fe_category_count_plot(
     top_k: Optional[int] = None,
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
-    hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
     if sublevel_field not in _COLUMN_MAP:
         raise ValueError(f"sublevel_field '{sublevel_field}' not in column map")
 
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
-
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
-
-    sub_col = _safe_column(df_hits, sublevel_field)
-
-    if df_hits.empty:
-        meta["notes"] += "; no data"
-        return {"data": [], "meta": meta}
-
-    counts = (
-        df_hits[sub_col]
-        .astype(str)
-        .value_counts()
-        .reset_index()
-        .rename(columns={"index": sub_col, sub_col: "product_count"})
-    )
-
-    if top_k is not None:
-        counts = counts.head(top_k)
-
-    data = counts.to_dict("records")
-    meta["notes"] += "; fe_category_count_plot over search subset"
-    return {"data": data, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "category_count", sublevel_field=sublevel_field, top_k=top_k)
 
 
 def fe_brand_share_chart(
@@ -1008,70 +1573,11 @@ def fe_brand_share_chart(
     normalize: bool = True,
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
-    hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
-
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
-
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    if df_hits.empty:
-        meta["notes"] += "; no data"
-        return {"data": [], "meta": meta}
-
-    price_col = _safe_column(df_hits, "price")
-    sold_col = _safe_column(df_hits, "sold")
-    brand_col = _safe_column(df_hits, "brand")
-    platform_col = _safe_column(df_hits, "platform")
-
-    df_hits = df_hits.copy()
-    if metric == "revenue_est":
-        price = pd.to_numeric(df_hits[price_col], errors="coerce").fillna(0)
-        sold = pd.to_numeric(df_hits[sold_col], errors="coerce").fillna(0)
-        df_hits["metric_value"] = price * sold
-    else:
-        df_hits["metric_value"] = 1.0
-
-    grouped = (
-        df_hits.groupby([platform_col, brand_col], dropna=False)["metric_value"]
-        .sum()
-        .reset_index()
-    )
-
-    data: List[Dict[str, Any]] = []
-    for platform, g in grouped.groupby(platform_col):
-        total = g["metric_value"].sum()
-        for _, row in g.iterrows():
-            value = float(row["metric_value"])
-            if normalize and total > 0:
-                share_pct = value / total * 100.0
-            else:
-                share_pct = None
-            data.append(
-                {
-                    "platform": platform,
-                    "brand": row[brand_col],
-                    "value": value,
-                    "share_pct": float(share_pct) if share_pct is not None else None,
-                }
-            )
-
-    meta["notes"] += f"; fe_brand_share_chart metric={metric} over search subset"
-    return {"data": data, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "brand_share", metric=metric, normalize=normalize)
 
 
 def fe_top_sellers(
@@ -1082,63 +1588,11 @@ def fe_top_sellers(
     top_k: int = 20,
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
-    hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
-
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
-
-    if df_hits.empty:
-        meta["notes"] += "; no data"
-        return {"data": [], "meta": meta}
-
-    seller_col = _safe_column(df_hits, "seller_name")
-    platform_col = _safe_column(df_hits, "platform")
-    sold_col = _safe_column(df_hits, "sold")
-
-    if by == "sold":
-        grouped = (
-            df_hits.groupby([platform_col, seller_col], dropna=False)[sold_col]
-            .apply(lambda x: pd.to_numeric(x, errors="coerce").fillna(0).sum())
-            .reset_index(name="value")
-        )
-    else:
-        grouped = (
-            df_hits.groupby([platform_col, seller_col], dropna=False)[seller_col]
-            .count()
-            .reset_index(name="value")
-        )
-
-    records: List[Dict[str, Any]] = []
-    for platform, g in grouped.groupby(platform_col):
-        g_sorted = g.sort_values("value", ascending=False).head(top_k)
-        for rank, (_, row) in enumerate(g_sorted.iterrows(), start=1):
-            records.append(
-                {
-                    "rank": rank,
-                    "seller_name": row[seller_col],
-                    "platform": platform,
-                    "value": float(row["value"]),
-                }
-            )
-
-    meta["notes"] += f"; fe_top_sellers by={by} over search subset"
-    return {"data": records, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "top_sellers", by=by, top_k=top_k)
 
 
 def fe_top_brands(
@@ -1149,66 +1603,11 @@ def fe_top_brands(
     top_k: int = 20,
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
-    hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
-
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
-
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
-
-    if df_hits.empty:
-        meta["notes"] += "; no data"
-        return {"data": [], "meta": meta}
-
-    brand_col = _safe_column(df_hits, "brand")
-    platform_col = _safe_column(df_hits, "platform")
-    price_col = _safe_column(df_hits, "price")
-    sold_col = _safe_column(df_hits, "sold")
-
-    df_hits = df_hits.copy()
-    if by == "sold":
-        df_hits["metric_value"] = pd.to_numeric(df_hits[sold_col], errors="coerce").fillna(0)
-    else:
-        price = pd.to_numeric(df_hits[price_col], errors="coerce").fillna(0)
-        sold = pd.to_numeric(df_hits[sold_col], errors="coerce").fillna(0)
-        df_hits["metric_value"] = price * sold
-
-    grouped = (
-        df_hits.groupby([platform_col, brand_col], dropna=False)["metric_value"]
-        .sum()
-        .reset_index()
-        .rename(columns={"metric_value": "value"})
-    )
-
-    records: List[Dict[str, Any]] = []
-    for platform, g in grouped.groupby(platform_col):
-        g_sorted = g.sort_values("value", ascending=False).head(top_k)
-        for rank, (_, row) in enumerate(g_sorted.iterrows(), start=1):
-            records.append(
-                {
-                    "rank": rank,
-                    "brand": row[brand_col],
-                    "platform": platform,
-                    "value": float(row["value"]),
-                }
-            )
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    meta["notes"] += f"; fe_top_brands by={by} over search subset"
-    return {"data": records, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "top_brands", by=by, top_k=top_k)
 
 
 def fe_seller_diversity_index(
@@ -1218,59 +1617,11 @@ def fe_seller_diversity_index(
     min_products: int = 2,
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
-    hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
-
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
-
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
-
-    if df_hits.empty:
-        meta["notes"] += "; no data"
-        return {"data": [], "meta": meta}
-
-    seller_col = _safe_column(df_hits, "seller_name")
-    platform_col = _safe_column(df_hits, "platform")
-    cat_col = _safe_column(df_hits, "category")
-
-    records: List[Dict[str, Any]] = []
-    for (platform, seller), g in df_hits.groupby([platform_col, seller_col], dropna=False):
-        product_count = len(g)
-        if product_count < min_products:
-            continue
-        cat_counts = g[cat_col].astype(str).value_counts()
-        unique_categories = len(cat_counts)
-
-        total = cat_counts.sum()
-        p = cat_counts.values / total
-        diversity_index = float(-(p * np.log(p + 1e-12)).sum())
-
-        records.append(
-            {
-                "seller_name": seller,
-                "platform": platform,
-                "product_count": int(product_count),
-                "unique_categories": int(unique_categories),
-                "diversity_index": diversity_index,
-            }
-        )
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    meta["notes"] += "; fe_seller_diversity_index over search subset"
-    return {"data": records, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "seller_diversity", min_products=min_products)
 
 
 def fe_price_range_by_category(
@@ -1281,59 +1632,14 @@ def fe_price_range_by_category(
     quantiles: Tuple[float, float] = (0.1, 0.9),
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
     hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
     if brand:
         hint["brand"] = brand
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
-
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
-
-    if df_hits.empty:
-        meta["notes"] += "; no data"
-        return {"data": [], "meta": meta}
-
-    price_col = _safe_column(df_hits, "price")
-    platform_col = _safe_column(df_hits, "platform")
-    cat_col = _safe_column(df_hits, "categories")
-
-    q_low, q_high = quantiles
-
-    records: List[Dict[str, Any]] = []
-    for (platform, cat), g in df_hits.groupby([platform_col, cat_col]):
-        prices = pd.to_numeric(g[price_col], errors="coerce").dropna()
-        if prices.empty:
-            continue
-        records.append(
-            {
-                "platform": platform,
-                "categories": cat,
-                "min_price": float(prices.min()),
-                "q_low": float(np.quantile(prices, q_low)),
-                "median_price": float(np.median(prices)),
-                "q_high": float(np.quantile(prices, q_high)),
-                "max_price": float(prices.max()),
-                "count": int(len(prices)),
-            }
-        )
-
-    meta["notes"] += "; fe_price_range_by_category over search subset"
-    return {"data": records, "meta": meta}
+    return _fe_metric(df, A, hint, min_reviews, context, "price_range", quantiles=quantiles)
 
 
 def fe_roi_table_for_A(
@@ -1343,63 +1649,8 @@ def fe_roi_table_for_A(
     group_by: str = "platform",
     min_reviews: int = 0,
     hint: Optional[Dict[str, Any]] = None,
+    context: Optional[AnalysisContext] = None,
 ) -> Dict[str, Any]:
-    hint = dict(hint or {})
-    if platforms:
-        hint["platforms"] = platforms
-    if "min_reviews" not in hint:
-        hint["min_reviews"] = min_reviews
-
-    catalog_categories = sorted(df["super_category"].dropna().astype(str).unique().tolist())
-    brand_list = sorted(df["brand"].dropna().astype(str).unique().tolist())
-
-    df_hits, meta = _search_df_core(
-        df=df,
-        A=A,
-        catalog_categories=catalog_categories,
-        brand_list=brand_list,
-        hint=hint,
-        min_reviews=min_reviews,
-        max_rows=2000,
-        enforce_phrase=True,
-    )
-
-    if df_hits.empty:
-        meta["notes"] += "; no data"
-        return {"data": [], "meta": meta}
-
-    price_col = _safe_column(df_hits, "price")
-    sold_col = _safe_column(df_hits, "sold")
-    platform_col = _safe_column(df_hits, "platform")
-    seller_col = _safe_column(df_hits, "seller_name")
-    brand_col = _safe_column(df_hits, "brand")
-
-    if group_by == "seller":
-        group_col = seller_col
-    elif group_by == "brand":
-        group_col = brand_col
-    else:
-        group_col = platform_col
-
-    df_hits = df_hits.copy()
-    price = pd.to_numeric(df_hits[price_col], errors="coerce").replace(0, np.nan)
-    sold = pd.to_numeric(df_hits[sold_col], errors="coerce")
-    df_hits["roi"] = sold / price
-    df_hits = df_hits.replace([np.inf, -np.inf], np.nan).dropna(subset=["roi"])
-
-    grouped = df_hits.groupby(group_col, dropna=False)["roi"]
-    stats = grouped.agg(["mean", "median", "count"]).reset_index()
-
-    data: List[Dict[str, Any]] = []
-    for _, row in stats.iterrows():
-        data.append(
-            {
-                "group": row[group_col],
-                "roi_mean": float(row["mean"]),
-                "roi_median": float(row["median"]),
-                "count": int(row["count"]),
-            }
-        )
+    hint = _normalize_hint(hint, platforms, min_reviews)
 
-    meta["notes"] += f"; fe_roi_table_for_A group_by={group_by} over search subset"
-    return {"data": data, "meta": meta}
\ No newline at end of file
+    return _fe_metric(df, A, hint, min_reviews, context, "roi", group_by=group_by)
@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from modules.embedding_store import EmbeddingStore
+from modules.filter_index import FilterIndex
+from modules.market_cube import MarketCube
+from modules.search_index import TokenIndex
+
+
+# Tăng khi đổi định dạng bundle / cách tiền xử lý -> mọi bundle cũ tự bị bỏ qua
+BUNDLE_VERSION = 4
+
+_MANIFEST = "manifest.json"
+_STAMP_FILE = "source_stamp.json"
+# Thư mục tạm của tiến trình khác (đang ghi bundle) chỉ bị xóa khi đã bỏ dở lâu hơn ngưỡng này
+_STALE_TMP_SECONDS = 24 * 3600
+# Lỗi khi nạp bundle hỏng (file thiếu / cắt cụt / rác) -> coi như chưa có bundle
+_LOAD_ERRORS = (
+    OSError, ValueError, KeyError, TypeError, IndexError, AttributeError, ImportError, EOFError, pickle.UnpicklingError,
+)
+
+
+def _file_digest(path: str, chunk_size: int = 1 << 24) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_hash(paths: List[str], root: str, extra: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Hash nội dung các file nguồn (+ BUNDLE_VERSION + `extra`, VD dtype embedding).
+    Hash từng file được nhớ theo (size, mtime) trong `<root>/source_stamp.json`
+    nên khởi động lại khi nguồn không đổi không phải đọc lại cả file.
+    """
+    stamp_path = os.path.join(root, _STAMP_FILE)
+    try:
+        with open(stamp_path, encoding="utf-8") as f:
+            stamps = json.load(f)
+    except (OSError, ValueError):
+        stamps = {}
+
+    h = hashlib.blake2b(digest_size=20)
+    h.update(json.dumps({"version": BUNDLE_VERSION, **(extra or {})}, sort_keys=True).encode())
+    changed = False
+    for path in paths:
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        stamp = stamps.get(key)
+        if stamp is None or stamp[:2] != [st.st_size, st.st_mtime_ns]:
+            stamp = [st.st_size, st.st_mtime_ns, _file_digest(path)]
+            stamps[key] = stamp
+            changed = True
+        h.update(stamp[2].encode())
+
+    if changed:
+        try:
+            os.makedirs(root, exist_ok=True)
+            with open(stamp_path, "w", encoding="utf-8") as f:
+                json.dump(stamps, f)
+        except OSError as e:
+            print(f"⚠️ Không lưu được source stamp: {e}")
+    return h.hexdigest()
+
+
+def bundle_dir(root: str, digest: str) -> str:
+    return os.path.join(root, digest)
+
+
+def _read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, _MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def _prune_bundles(root: str, digest: str) -> None:
+    """
+    Xóa bundle của hash nguồn khác (thư mục có manifest hợp lệ) và thư mục tạm bỏ dở quá lâu.
+    Thư mục tạm đang ghi của tiến trình khác (VD `python -m modules.artifact_bundle` chạy
+    song song với app) được giữ nguyên.
+    """
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name == digest or not os.path.isdir(path):
+            continue
+        if ".tmp-" in name:
+            try:
+                stale = time.time() - os.path.getmtime(path) > _STALE_TMP_SECONDS
+            except OSError:
+                continue
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        manifest = _read_manifest(path)
+        if manifest is not None and manifest.get("source_hash") != digest:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _save_arrays(path: str, arrays: Dict[str, np.ndarray]) -> Dict[str, str]:
+    """Mỗi mảng 1 file .npy (mmap được nếu không phải object); trả về tên -> file."""
+    os.makedirs(path, exist_ok=True)
+    files = {}
+    for i, (name, arr) in enumerate(arrays.items()):
+        fname = f"{i:03d}.npy"
+        arr = np.asarray(arr)
+        np.save(os.path.join(path, fname), arr, allow_pickle=arr.dtype == object)
+        files[name] = fname
+    return files
+
+
+def _load_arrays(path: str, files: Dict[str, str]) -> Dict[str, np.ndarray]:
+    out = {}
+    for name, fname in files.items():
+        full = os.path.join(path, fname)
+        try:
+            out[name] = np.load(full, mmap_mode="r")
+        except ValueError:
+            # Mảng object (chuỗi) không mmap được -> nạp bình thường
+            out[name] = np.load(full, allow_pickle=True)
+    return out
+
+
+def _table_arrays(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Bảng dạng cột: cột số giữ nguyên dtype, cột chuỗi lưu mã (int32) + giá trị duy nhất."""
+    arrays = {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            arrays[f"{col}/codes"] = codes.astype(np.int32)
+            arrays[f"{col}/uniques"] = np.asarray(uniques, dtype=object)
+        else:
+            arrays[f"{col}/values"] = values.to_numpy()
+    return arrays
+
+
+def _table_from_arrays(columns: List[str], arrays: Dict[str, np.ndarray]) -> pd.DataFrame:
+    data = {}
+    for col in columns:
+        if f"{col}/values" in arrays:
+            data[col] = np.asarray(arrays[f"{col}/values"])
+        else:
+            data[col] = arrays[f"{col}/uniques"][np.asarray(arrays[f"{col}/codes"])]
+    return pd.DataFrame(data)
+
+
+def save_bundle(
+    root: str,
+    digest: str,
+    df: pd.DataFrame,
+    emb: EmbeddingStore,
+    token_index: TokenIndex,
+    filter_index: FilterIndex,
+    market_cube: MarketCube,
+    catalog_categories: List[str],
+    brand_list: List[str],
+    overwrite: bool = False,
+) -> str:
+    """
+    Ghi bundle vào `<root>/<digest>/` (ghi ra thư mục tạm rồi đổi tên -> không bao giờ
+    nạp phải bundle ghi dở), sau đó xóa các bundle cũ. Nếu tiến trình khác vừa ghi xong
+    bundle cùng hash thì giữ bundle đó (có thể đang được đọc), trừ khi `overwrite`. Trả về đường dẫn bundle.
+    """
+    final = bundle_dir(root, digest)
+    tmp = f"{final}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    emb.save(os.path.join(tmp, "embeddings.npy"))
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "source_hash": digest,
+        "n_rows": len(df),
+        "columns": list(df.columns),
+        "table": _save_arrays(os.path.join(tmp, "table"), _table_arrays(df)),
+        "token_index": _save_arrays(os.path.join(tmp, "token_index"), token_index.to_arrays()),
+        "filter_index": _save_arrays(os.path.join(tmp, "filter_index"), filter_index.to_arrays()),
+        "market_cube": _save_arrays(os.path.join(tmp, "market_cube"), market_cube.to_arrays()),
+        "catalog_categories": list(catalog_categories),
+        "brand_list": list(brand_list),
+    }
+    # Manifest ghi sau cùng: có manifest nghĩa là bundle đầy đủ
+    with open(os.path.join(tmp, _MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    try:
+        keep = not overwrite and _open_bundle(final, digest) is not None
+    except _LOAD_ERRORS:
+        keep = False
+    if keep:
+        shutil.rmtree(tmp, ignore_errors=True)
+    else:
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+
+    _prune_bundles(root, digest)
+    return final
+
+
+def load_bundle(root: str, digest: str) -> Optional[Dict[str, Any]]:
+    """
+    Nạp bundle khớp `digest` (mảng mở bằng mmap); None nếu chưa có / khác phiên bản / hỏng
+    (caller dựng lại từ nguồn và ghi đè bundle hỏng).
+    Trả về dict: df, emb, emb_path, token_index, filter_index, market_cube, catalog_categories, brand_list.
+    """
+    path = bundle_dir(root, digest)
+    try:
+        return _open_bundle(path, digest)
+    except _LOAD_ERRORS as e:
+        print(f"⚠️ Artifact bundle hỏng, sẽ dựng lại từ nguồn: {path} ({type(e).__name__}: {e})")
+        return None
+
+
+def _open_bundle(path: str, digest: str) -> Optional[Dict[str, Any]]:
+    """None nếu không có manifest khớp; bundle hỏng -> ném lỗi trong _LOAD_ERRORS."""
+    manifest = _read_manifest(path)
+    if manifest is None or manifest.get("version") != BUNDLE_VERSION or manifest.get("source_hash") != digest:
+        return None
+    n_rows = manifest["n_rows"]
+    df = _table_from_arrays(manifest["columns"], _load_arrays(os.path.join(path, "table"), manifest["table"]))
+    if len(df) != n_rows:
+        raise ValueError(f"bảng có {len(df)} row, manifest ghi {n_rows}")
+    token_arrays = _load_arrays(os.path.join(path, "token_index"), manifest["token_index"])
+    filter_arrays = _load_arrays(os.path.join(path, "filter_index"), manifest["filter_index"])
+    cube_arrays = _load_arrays(os.path.join(path, "market_cube"), manifest["market_cube"])
+    emb_path = os.path.join(path, "embeddings.npy")
+    return {
+        "df": df,
+        "emb": EmbeddingStore.load(emb_path),
+        "emb_path": emb_path,
+        "token_index": TokenIndex.from_arrays(token_arrays),
+        "filter_index": FilterIndex.from_arrays(n_rows, filter_arrays),
+        "market_cube": MarketCube.from_arrays(cube_arrays),
+        "catalog_categories": manifest["catalog_categories"],
+        "brand_list": manifest["brand_list"],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """`python -m modules.artifact_bundle` – dựng (lại) bundle từ CSV + embeddings."""
+    from modules.data_loader import build_bundle
+
+    parser = argparse.ArgumentParser(description="Dựng artifact bundle cho get_data_engine")
+    parser.add_argument("--force", action="store_true", help="Dựng lại kể cả khi hash nguồn không đổi")
+    args = parser.parse_args(argv)
+    path = build_bundle(force=args.force)
+    print(f"✅ Bundle: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,159 @@
 import pandas as pd
 import numpy as np
 import os
-from modules.analytics_core import set_product_embeddings
+from modules.analytics_core import (
+    set_product_embeddings, set_vector_index, build_token_index, set_token_index,
+    build_filter_index, set_filter_index, set_catalog_vocab, catalog_vocab, set_sharded_search,
+    build_market_cube, set_market_cube,
+)
+from modules.artifact_bundle import bundle_dir, load_bundle, save_bundle, source_hash
+from modules.vector_index import load_or_build_vector_index
+from modules.embedding_store import EmbeddingStore
+from modules.sharded_search import ShardedSearch
 
 # Biến toàn cục để lưu cache
 _CACHED_DF = None
 
+# ANN index chỉ đáng dựng khi catalogue đủ lớn; nhỏ hơn thì quét exact vẫn nhanh
+ANN_INDEX_KIND = "ivf"  # "ivf" | "hnsw" | "exact"
+ANN_MIN_ROWS = 200_000
+# Núm chỉnh recall/latency của ANN:
+# - IVF: quét ít nhất `nprobe` cụm và đủ `scan_factor * k` row
+# - HNSW: ef (nên >= số ứng viên lớn nhất mà hybrid_search yêu cầu)
+ANN_PARAMS = {
+    "ivf": {"nprobe": 16, "scan_factor": 4.0},
+    "hnsw": {"ef": 8192},
+    "exact": {},
+}
+
+# Kiểu lưu embedding (mở bằng mmap, dùng chung page cache giữa các worker):
+# "float32" (file gốc) | "float16" (1/2 RAM) | "int8" (1/4 RAM, kèm scale từng row)
+EMB_STORE_DTYPE = "float16"
+
+# Chấm điểm vector song song: số worker process (0 = tắt). Embedding được copy vào
+# shared memory và chia shard theo khoảng row; chỉ bật khi catalogue >= SHARDED_MIN_ROWS
+SEARCH_WORKERS = 0
+SHARDED_MIN_ROWS = 500_000
+
+# Tính sẵn chỉ số đa dạng danh mục của mọi seller lúc load (lưu trong market cube của bundle):
+# câu hỏi không từ khóa / chỉ lọc platform về seller diversity đọc thẳng bảng, không gộp cell
+PRECOMPUTE_SELLER_DIVERSITY = True
+
+# Artifact bundle (df đã tiền xử lý + index + embeddings) nằm trong data/bundles/<hash nguồn>/
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_CSV = os.path.join(BASE_DIR, "data", "data_fixed.csv")
+EMB_NPY = os.path.join(BASE_DIR, "data", "product_name_embeddings.npy")
+BUNDLE_ROOT = os.path.join(BASE_DIR, "data", "bundles")
+
+
+def _load_source():
+    """Đọc CSV + embeddings gốc và tiền xử lý; trả về (df, emb)."""
+    # 1. Load CSV & Numpy
+    df = pd.read_csv(DATA_CSV)
+    # Embedding mở dạng mmap (lượng tử hóa nếu cần), không nạp cả ma trận vào RAM
+    emb = EmbeddingStore.open(EMB_NPY, dtype=EMB_STORE_DTYPE)
+
+    # 2. Preprocessing (Logic từ file test của bạn)
+    # Loại bỏ dòng tiêu đề lặp lại nếu có
+    mask_valid = df["product_name"] != "product_name"
+    df = df[mask_valid].reset_index(drop=True)
+    # Chỉ ghi lại bảng ánh xạ row, không copy ma trận embedding
+    emb = emb.select(mask_valid.values)
+
+    # Chuyển đổi kiểu dữ liệu số
+    df["price"] = pd.to_numeric(df["price"], errors="coerce").fillna(0)
+    df["sold"] = pd.to_numeric(df["sold"], errors="coerce").fillna(0)
+    df["rating"] = pd.to_numeric(df["rating"], errors="coerce") # Rating có thể để NaN
+    df["review_count"] = pd.to_numeric(df["review_count"], errors="coerce").fillna(0).astype(int)
+
+    # Điền chuỗi rỗng cho các cột khác
+    cols_other = df.columns.difference(["price", "sold", "rating", "review_count"])
+    df[cols_other] = df[cols_other].fillna("")
+    return df, emb
+
+
+def _source_hash() -> str:
+    extra = {"emb_dtype": EMB_STORE_DTYPE, "seller_diversity": PRECOMPUTE_SELLER_DIVERSITY}
+    return source_hash([DATA_CSV, EMB_NPY], BUNDLE_ROOT, extra=extra)
+
+
+def build_bundle(force: bool = False) -> str:
+    """
+    Dựng artifact bundle offline (`python -m modules.artifact_bundle`).
+    Bỏ qua nếu đã có bundle khớp hash nguồn (trừ khi `force`). Trả về đường dẫn bundle.
+    """
+    digest = _source_hash()
+    if not force and load_bundle(BUNDLE_ROOT, digest) is not None:
+        return bundle_dir(BUNDLE_ROOT, digest)
+
+    df, emb = _load_source()
+    categories, brands = catalog_vocab(df)
+    market_cube = build_market_cube(df, seller_diversity=PRECOMPUTE_SELLER_DIVERSITY)
+    return save_bundle(
+        BUNDLE_ROOT, digest, df, emb, build_token_index(df), build_filter_index(df), market_cube, categories, brands,
+        overwrite=force,
+    )
+
+
 def get_data_engine():
     """
     Hàm này load dữ liệu, xử lý preprocessing và nạp embedding.
     Nó chỉ chạy 1 lần, các lần sau sẽ trả về biến đã cache.
+    Nếu đã có artifact bundle khớp hash nguồn thì nạp thẳng (mmap), bỏ qua CSV + dựng index.
     """
     global _CACHED_DF
     
     if _CACHED_DF is not None:
         return _CACHED_DF
 
-    # Đường dẫn file (Lấy đường dẫn tuyệt đối để tránh lỗi path)
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    DATA_CSV = os.path.join(BASE_DIR, "data", "data_fixed.csv")
-    EMB_NPY = os.path.join(BASE_DIR, "data", "product_name_embeddings.npy")
-
     print(f"⏳ Đang nạp dữ liệu từ: {DATA_CSV}")
     
     try:
-        # 1. Load CSV & Numpy
-        df = pd.read_csv(DATA_CSV)
-        emb = np.load(EMB_NPY)
-
-        # 2. Preprocessing (Logic từ file test của bạn)
-        # Loại bỏ dòng tiêu đề lặp lại nếu có
-        mask_valid = df["product_name"] != "product_name"
-        df = df[mask_valid].reset_index(drop=True)
-        emb = emb[mask_valid.values]
-
-        # Chuyển đổi kiểu dữ liệu số
-        df["price"] = pd.to_numeric(df["price"], errors="coerce").fillna(0)
-        df["sold"] = pd.to_numeric(df["sold"], errors="coerce").fillna(0)
-        df["rating"] = pd.to_numeric(df["rating"], errors="coerce") # Rating có thể để NaN
-        df["review_count"] = pd.to_numeric(df["review_count"], errors="coerce").fillna(0).astype(int)
-
-        # Điền chuỗi rỗng cho các cột khác
-        cols_other = df.columns.difference(["price", "sold", "rating", "review_count"])
-        df[cols_other] = df[cols_other].fillna("")
-
-        # 3. Nạp Embeddings vào Core
+        digest = _source_hash()
+        bundle = load_bundle(BUNDLE_ROOT, digest)
+        if bundle is None:
+            # 1-2. Load + tiền xử lý từ nguồn, 3. dựng inverted index cho phần lexical,
+            # index cho metadata filter và market cube, rồi lưu bundle cho lần khởi động sau
+            df, emb = _load_source()
+            token_index, filter_index = build_token_index(df), build_filter_index(df)
+            market_cube = build_market_cube(df, seller_diversity=PRECOMPUTE_SELLER_DIVERSITY)
+            categories, brands = catalog_vocab(df)
+            try:
+                path = save_bundle(
+                    BUNDLE_ROOT, digest, df, emb, token_index, filter_index, market_cube, categories, brands,
+                )
+                bundle = load_bundle(BUNDLE_ROOT, digest)
+                print(f"✅ Đã lưu artifact bundle: {path}")
+            except OSError as e:
+                print(f"⚠️ Không lưu được artifact bundle: {e}")
+            if bundle is None:
+                bundle = {
+                    "df": df, "emb": emb, "emb_path": EMB_NPY,
+                    "token_index": token_index, "filter_index": filter_index, "market_cube": market_cube,
+                    "catalog_categories": categories, "brand_list": brands,
+                }
+        else:
+            print(f"⚡ Nạp artifact bundle: {bundle_dir(BUNDLE_ROOT, digest)}")
+
+        df, emb = bundle["df"], bundle["emb"]
+        set_token_index(bundle["token_index"])
+        set_filter_index(bundle["filter_index"])
+        set_market_cube(bundle["market_cube"])
+        set_catalog_vocab(bundle["catalog_categories"], bundle["brand_list"], len(df))
+
+        # 4. Nạp Embeddings vào Core
         print(f"✅ Đã nạp {len(df)} dòng dữ liệu. Kích thước Emb: {emb.shape}")
         set_product_embeddings(emb)
+        if SEARCH_WORKERS > 0 and len(df) >= SHARDED_MIN_ROWS:
+            print(f"⏳ Đang chia embedding vào shared memory cho {SEARCH_WORKERS} worker...")
+            sharded = ShardedSearch(emb, workers=SEARCH_WORKERS)
+            set_sharded_search(sharded)
+            emb = sharded.embeddings
+        if len(df) >= ANN_MIN_ROWS:
+            print(f"⏳ Đang nạp/dựng ANN index ({ANN_INDEX_KIND})...")
+            set_vector_index(load_or_build_vector_index(
+                emb, bundle["emb_path"], kind=ANN_INDEX_KIND, **ANN_PARAMS.get(ANN_INDEX_KIND, {})
+            ))
 
         # Lưu vào cache
         _CACHED_DF = df
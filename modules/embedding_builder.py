@@ -0,0 +1,236 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from modules.encoder import DEFAULT_MODEL, QueryEncoder, make_encoder
+
+
+# Mỗi chunk là 1 đơn vị checkpoint (1 file .npy trong thư mục làm việc)
+CHUNK_ROWS = 50_000
+BATCH_SIZE = 1024
+
+_WORKER_ENCODER: Optional[QueryEncoder] = None
+
+
+def row_hashes(names: pd.Series) -> np.ndarray:
+    """Hash uint64 của từng product_name (ổn định giữa các lần chạy)."""
+    return pd.util.hash_pandas_object(names.astype(str), index=False).to_numpy(dtype=np.uint64)
+
+
+def encoder_key() -> str:
+    """Định danh model theo cấu hình encoder; đổi model thì phải encode lại toàn bộ."""
+    backend = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+    if backend == "onnx":
+        return f"onnx:{os.getenv('EMBEDDING_MODEL_DIR')}/{os.getenv('EMBEDDING_ONNX_FILE', 'model.onnx')}"
+    return f"sentence-transformers:{DEFAULT_MODEL}"
+
+
+def hashes_path(out_path: str) -> str:
+    """File hash product_name của lần build trước, VD: product_name_embeddings.rowhash.npy"""
+    base, _ = os.path.splitext(out_path)
+    return f"{base}.rowhash.npy"
+
+
+def _meta_path(out_path: str) -> str:
+    base, _ = os.path.splitext(out_path)
+    return f"{base}.build.json"
+
+
+def _init_worker(encoder_factory: Callable[[], QueryEncoder], threads: Optional[int]) -> None:
+    global _WORKER_ENCODER
+    if threads:
+        # Tránh mỗi process chiếm hết core (đặt trước khi torch / onnxruntime được nạp)
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ[var] = str(threads)
+    _WORKER_ENCODER = encoder_factory()
+
+
+def _encode_chunk(texts: List[str], path: str, batch_size: int) -> str:
+    """Encode 1 chunk theo batch lớn, ghi ra file tạm rồi đổi tên (checkpoint nguyên tử)."""
+    parts = [_WORKER_ENCODER.encode(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+    vecs = np.concatenate(parts).astype(np.float32) if parts else np.empty((0, 0), np.float32)
+    tmp = path + ".tmp.npy"
+    np.save(tmp, vecs)
+    os.replace(tmp, path)
+    return path
+
+
+def _previous_build(out_path: str, key: str):
+    """(vectors mmap, hashes) của lần build trước nếu dùng lại được, ngược lại (None, None)."""
+    try:
+        with open(_meta_path(out_path), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("encoder") != key:
+            return None, None
+        vectors = np.load(out_path, mmap_mode="r")
+        hashes = np.load(hashes_path(out_path))
+    except (OSError, ValueError):
+        return None, None
+    if len(hashes) != len(vectors):
+        return None, None
+    return vectors, hashes
+
+
+def _plan_digest(pending: np.ndarray, key: str, chunk_rows: int) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps({"encoder": key, "chunk_rows": chunk_rows}).encode())
+    h.update(np.ascontiguousarray(pending).tobytes())
+    return h.hexdigest()
+
+
+def build_embeddings(
+    csv_path: str,
+    out_path: str,
+    workers: Optional[int] = None,
+    chunk_rows: int = CHUNK_ROWS,
+    batch_size: int = BATCH_SIZE,
+    full: bool = False,
+    encoder_factory: Callable[[], QueryEncoder] = make_encoder,
+    threads_per_worker: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Sinh `out_path` (float32, 1 row / dòng CSV, đã chuẩn hóa L2) từ cột product_name.
+
+    - Chỉ encode các product_name (duy nhất) có hash chưa có trong lần build trước
+      (`full=True` để encode lại hết); row còn lại copy vector cũ.
+    - Phần cần encode chia thành chunk `chunk_rows`, encode song song trên `workers` process
+      (0 = chạy trong process hiện tại); mỗi chunk xong được ghi ra `<out>.work/` nên chạy lại
+      sau khi bị ngắt sẽ tiếp tục từ các chunk còn thiếu.
+    Trả về thống kê: rows, reused, encoded, chunks, chunks_resumed.
+    """
+    names = pd.read_csv(csv_path, usecols=["product_name"], dtype=str, keep_default_na=False)["product_name"]
+    hashes = row_hashes(names)
+    n = len(hashes)
+    key = encoder_key() if encoder_factory is make_encoder else getattr(encoder_factory, "__name__", "custom")
+
+    old_vecs, old_hashes = (None, None) if full else _previous_build(out_path, key)
+    old_row = np.full(n, -1, dtype=np.int64)
+    if old_hashes is not None and len(old_hashes):
+        uniq_old, first_old = np.unique(old_hashes, return_index=True)
+        pos = np.clip(np.searchsorted(uniq_old, hashes), 0, len(uniq_old) - 1)
+        hit = uniq_old[pos] == hashes
+        old_row[hit] = first_old[pos[hit]]
+
+    # product_name cần encode: mỗi hash 1 lần, theo thứ tự xuất hiện đầu tiên (plan ổn định khi chạy lại)
+    need = np.flatnonzero(old_row < 0)
+    pending_hash, first = np.unique(hashes[need], return_index=True)
+    order = np.argsort(first, kind="stable")
+    pending_hash, pending_rows = pending_hash[order], need[first[order]]
+
+    work_dir = out_path + ".work"
+    digest = _plan_digest(pending_hash, key, chunk_rows)
+    plan_file = os.path.join(work_dir, "plan.json")
+    try:
+        with open(plan_file, encoding="utf-8") as f:
+            same_plan = json.load(f).get("digest") == digest
+    except (OSError, ValueError):
+        same_plan = False
+    if not same_plan:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        with open(plan_file, "w", encoding="utf-8") as f:
+            json.dump({"digest": digest, "pending": int(len(pending_rows))}, f)
+
+    chunk_paths = [os.path.join(work_dir, f"chunk_{i:05d}.npy") for i in range(0, len(pending_rows), chunk_rows)]
+    todo = [(j, p) for j, p in enumerate(chunk_paths) if not os.path.exists(p)]
+    stats = {
+        "rows": n,
+        "reused": int(n - len(need)),
+        "encoded": int(len(pending_rows)),
+        "chunks": len(chunk_paths),
+        "chunks_resumed": len(chunk_paths) - len(todo),
+    }
+
+    def texts_of(j: int) -> List[str]:
+        rows = pending_rows[j * chunk_rows:(j + 1) * chunk_rows]
+        return names.iloc[rows].tolist()
+
+    if todo:
+        print(f"⏳ Encode {stats['encoded']} product_name ({len(todo)}/{len(chunk_paths)} chunk)...")
+    if todo and workers == 0:
+        _init_worker(encoder_factory, None)
+        for j, path in todo:
+            _encode_chunk(texts_of(j), path, batch_size)
+    elif todo:
+        workers = workers or max(1, min(len(todo), (os.cpu_count() or 2) // 2))
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(encoder_factory, threads_per_worker),
+        ) as pool:
+            # Giữ tối đa 2 chunk / worker trong hàng đợi để không pickle hết text 1 lúc
+            queue, running, done = list(todo), set(), 0
+            while queue or running:
+                while queue and len(running) < 2 * workers:
+                    j, path = queue.pop(0)
+                    running.add(pool.submit(_encode_chunk, texts_of(j), path, batch_size))
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    fut.result()
+                    done += 1
+                    print(f"   chunk {done}/{len(todo)}")
+
+    # Ghép: vector cũ cho row không đổi + vector mới theo hash (các row trùng tên dùng chung)
+    new_vecs = [np.load(p, mmap_mode="r") for p in chunk_paths]
+    if new_vecs:
+        dim = new_vecs[0].shape[1]
+    elif old_vecs is not None:
+        dim = old_vecs.shape[1]
+    else:
+        dim = 0
+    slot = np.full(n, -1, dtype=np.int64)
+    if len(pending_hash):
+        sorter = np.argsort(pending_hash, kind="stable")
+        slot[need] = sorter[np.searchsorted(pending_hash, hashes[need], sorter=sorter)]
+
+    tmp = out_path + ".tmp.npy"
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(n, dim))
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        reuse = np.flatnonzero(old_row[start:stop] >= 0)
+        if reuse.size:
+            out[start + reuse] = old_vecs[old_row[start + reuse]]
+        fresh = start + np.flatnonzero(slot[start:stop] >= 0)
+        src_chunk = slot[fresh] // chunk_rows
+        for c in np.unique(src_chunk):
+            sel = src_chunk == c
+            out[fresh[sel]] = new_vecs[c][slot[fresh[sel]] % chunk_rows]
+    out.flush()
+    del out, old_vecs, new_vecs
+
+    os.replace(tmp, out_path)
+    np.save(hashes_path(out_path), hashes)
+    with open(_meta_path(out_path), "w", encoding="utf-8") as f:
+        json.dump({"encoder": key, "rows": n, "dim": int(dim)}, f)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """`python -m modules.embedding_builder` – (cập nhật) product_name_embeddings.npy từ data_fixed.csv."""
+    from modules.data_loader import DATA_CSV, EMB_NPY
+
+    parser = argparse.ArgumentParser(description="Sinh embedding product_name (song song, chạy tiếp được)")
+    parser.add_argument("--csv", default=DATA_CSV)
+    parser.add_argument("--out", default=EMB_NPY)
+    parser.add_argument("--workers", type=int, default=None, help="Số process encode (0 = không dùng pool)")
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--full", action="store_true", help="Encode lại toàn bộ, không dùng vector cũ")
+    args = parser.parse_args(argv)
+
+    stats = build_embeddings(
+        args.csv, args.out, workers=args.workers, chunk_rows=args.chunk_rows,
+        batch_size=args.batch_size, full=args.full, threads_per_worker=args.threads_per_worker,
+    )
+    print(f"✅ {stats}")
+
+
+if __name__ == "__main__":
+    main()
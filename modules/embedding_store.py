@@ -0,0 +1,200 @@
+import os
+from typing import Optional, Union
+
+import numpy as np
+
+
+# Hậu tố file lượng tử hóa nằm cạnh file embedding gốc (float32)
+_SUFFIX = {"float16": ".f16", "int8": ".i8"}
+
+
+class EmbeddingStore:
+    """
+    Kho embedding chỉ đọc, mở bằng `mmap_mode="r"` nên các worker cùng máy
+    dùng chung page cache của OS thay vì mỗi process giữ 1 bản float32.
+
+    - dtype "float32": dùng thẳng file gốc
+    - dtype "float16": 1/2 bộ nhớ
+    - dtype "int8": 1/4 bộ nhớ, kèm scale float32 cho từng row (v ≈ q * scale)
+
+    `rows` là bảng ánh xạ row logic -> row trong file, dùng để lọc row
+    (VD bỏ dòng header lặp) mà không phải copy ma trận.
+
+    Hỗ trợ đúng các phép mà analytics_core / vector_index dùng:
+    `len(store)`, `store.shape`, `store[rows]` (trả float32), `store @ q`.
+    """
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        scales: Optional[np.ndarray] = None,
+        rows: Optional[np.ndarray] = None,
+        chunk_rows: int = 65_536,
+    ):
+        self.vectors = vectors
+        self.scales = scales
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+
+    @property
+    def storage_dtype(self) -> str:
+        return "int8" if self.scales is not None else str(self.vectors.dtype)
+
+    @property
+    def shape(self):
+        return (len(self), int(self.vectors.shape[1]))
+
+    def __len__(self) -> int:
+        return int(len(self.rows) if self.rows is not None else self.vectors.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def _file_rows(self, rows: Union[slice, np.ndarray]) -> Union[slice, np.ndarray]:
+        if isinstance(rows, slice):
+            if self.rows is None:
+                return rows
+            return self.rows[rows]
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return self.rows[rows] if self.rows is not None else rows
+
+    def __getitem__(self, rows) -> np.ndarray:
+        """Các row logic `rows`, đã giải lượng tử về float32."""
+        file_rows = self._file_rows(rows)
+        block = np.asarray(self.vectors[file_rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[file_rows][:, None]
+        return block
+
+    def __matmul__(self, q: np.ndarray) -> np.ndarray:
+        """Điểm tích vô hướng của MỌI row với q (q: (dim,) hoặc (dim, m))."""
+        q = np.asarray(q, dtype=np.float32)
+        n = len(self)
+        out = np.empty((n,) + q.shape[1:], dtype=np.float32)
+        for start in range(0, n, self.chunk_rows):
+            stop = min(start + self.chunk_rows, n)
+            file_rows = self._file_rows(slice(start, stop))
+            # Giải lượng tử sau phép nhân: (v_q @ q) * scale -> không cần bung khối float32
+            part = np.asarray(self.vectors[file_rows], dtype=np.float32) @ q
+            if self.scales is not None:
+                s = self.scales[file_rows]
+                part *= s if part.ndim == 1 else s[:, None]
+            out[start:stop] = part
+        return out
+
+    def select(self, rows: np.ndarray) -> "EmbeddingStore":
+        """Store mới chỉ gồm `rows` (chỉ số logic hoặc mask bool) – không copy vector."""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        file_rows = self.rows[rows] if self.rows is not None else rows
+        if self.rows is None and len(file_rows) == self.vectors.shape[0] and np.array_equal(
+            file_rows, np.arange(len(file_rows))
+        ):
+            file_rows = None
+        return EmbeddingStore(self.vectors, self.scales, file_rows, self.chunk_rows)
+
+    def save(self, path: str) -> None:
+        """
+        Ghi các row logic ra file .npy liền mạch (giữ nguyên dtype lưu trữ, không lượng tử hóa lại);
+        int8 kèm file scale `<path>.scales.npy`. Mở lại bằng `EmbeddingStore.load(path)`.
+        """
+        n, dim = self.shape
+        tmp = path + ".tmp"
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.vectors.dtype, shape=(n, dim))
+        for start in range(0, n, self.chunk_rows):
+            stop = min(start + self.chunk_rows, n)
+            out[start:stop] = self.vectors[self._file_rows(slice(start, stop))]
+        out.flush()
+        del out
+        if self.scales is not None:
+            rows = self.rows if self.rows is not None else slice(None)
+            np.save(self._scales_path(path), np.asarray(self.scales[rows], dtype=np.float32))
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _scales_path(path: str) -> str:
+        base, _ = os.path.splitext(path)
+        return f"{base}.scales.npy"
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingStore":
+        """Mở file đã ghi bằng `save` (mmap)."""
+        scales_path = cls._scales_path(path)
+        scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        return cls(np.load(path, mmap_mode="r"), scales)
+
+    @staticmethod
+    def quantized_paths(src_path: str, dtype: str):
+        base, _ = os.path.splitext(src_path)
+        suffix = _SUFFIX[dtype]
+        return f"{base}{suffix}.npy", (f"{base}{suffix}.scales.npy" if dtype == "int8" else None)
+
+    @classmethod
+    def quantize(cls, src_path: str, dtype: str = "float16", chunk_rows: int = 65_536) -> None:
+        """Ghi bản lượng tử hóa của file .npy float32 (đọc theo chunk, không nạp hết vào RAM)."""
+        src = np.load(src_path, mmap_mode="r")
+        vec_path, scale_path = cls.quantized_paths(src_path, dtype)
+        out_dtype = np.float16 if dtype == "float16" else np.int8
+
+        tmp_vec = vec_path + ".tmp"
+        vectors = np.lib.format.open_memmap(tmp_vec, mode="w+", dtype=out_dtype, shape=src.shape)
+        scales = np.empty(src.shape[0], dtype=np.float32) if dtype == "int8" else None
+
+        for start in range(0, src.shape[0], chunk_rows):
+            block = np.asarray(src[start:start + chunk_rows], dtype=np.float32)
+            if dtype == "int8":
+                s = np.abs(block).max(axis=1) / 127.0
+                s[s == 0] = 1.0
+                vectors[start:start + len(block)] = np.round(block / s[:, None]).astype(np.int8)
+                scales[start:start + len(block)] = s
+            else:
+                vectors[start:start + len(block)] = block.astype(np.float16)
+
+        vectors.flush()
+        del vectors
+        if scales is not None:
+            np.save(scale_path, scales)
+        os.replace(tmp_vec, vec_path)
+
+    @classmethod
+    def open(cls, src_path: str, dtype: str = "float16") -> "EmbeddingStore":
+        """
+        Mở embedding dạng mmap. Với float16/int8, tự tạo (hoặc tạo lại) file lượng tử hóa
+        cạnh file gốc khi chưa có hoặc cũ hơn file gốc.
+        """
+        if dtype == "float32":
+            return cls(np.load(src_path, mmap_mode="r"))
+        if dtype not in _SUFFIX:
+            raise ValueError(f"dtype '{dtype}' không hỗ trợ (float32 | float16 | int8)")
+
+        vec_path, scale_path = cls.quantized_paths(src_path, dtype)
+        src_mtime = os.path.getmtime(src_path)
+        stale = any(
+            p is not None and (not os.path.exists(p) or os.path.getmtime(p) < src_mtime)
+            for p in (vec_path, scale_path)
+        )
+        if stale:
+            print(f"⏳ Đang lượng tử hóa embedding sang {dtype}...")
+            cls.quantize(src_path, dtype)
+
+        vectors = np.load(vec_path, mmap_mode="r")
+        scales = np.load(scale_path) if scale_path else None
+        return cls(vectors, scales)
+
+
+def quantization_recall(
+    reference: np.ndarray,
+    store: EmbeddingStore,
+    queries: np.ndarray,
+    k: int = 50,
+) -> float:
+    """Recall@k của top-k tính trên `store` so với top-k trên embedding float32 gốc."""
+    from modules.vector_index import ExactIndex, measure_recall
+
+    return measure_recall(ExactIndex(store), reference, queries, k=k)
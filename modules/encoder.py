@@ -0,0 +1,146 @@
+import importlib.util
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class QueryEncoder:
+    """
+    Interface encoder cho query: encode(texts) -> ndarray (len(texts), dim) float32, đã chuẩn hóa L2.
+    Model được nạp lười ở lần encode đầu tiên (import module không kéo theo torch / model).
+    """
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SentenceTransformerEncoder(QueryEncoder):
+    """Backend mặc định: sentence-transformers (PyTorch)."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: Optional[str] = None):
+        self.model_name = model_name
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+
+                self._model = SentenceTransformer(self.model_name, device=self.device)
+            return self._model
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vecs = self._get_model().encode(
+            list(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        return np.asarray(vecs, dtype=np.float32)
+
+
+class OnnxEncoder(QueryEncoder):
+    """
+    MiniLM chạy bằng ONNX Runtime trên CPU (không cần torch lúc chạy).
+
+    `model_dir` chứa tokenizer.json và file .onnx, export 1 lần, VD:
+        optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 <model_dir>
+    Bản int8 (dynamic quantization) tạo bằng `quantize_onnx_model`.
+    Pipeline giống sentence-transformers: mean pooling theo attention mask rồi chuẩn hóa L2.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        file_name: str = "model.onnx",
+        max_length: int = 256,
+        intra_op_threads: Optional[int] = None,
+    ):
+        self.model_dir = model_dir
+        self.file_name = file_name
+        self.max_length = max_length
+        self.intra_op_threads = intra_op_threads
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is None:
+                import onnxruntime as ort
+                from tokenizers import Tokenizer
+
+                tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+                tokenizer.enable_truncation(max_length=self.max_length)
+                tokenizer.enable_padding()
+
+                opts = ort.SessionOptions()
+                opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                if self.intra_op_threads:
+                    opts.intra_op_num_threads = self.intra_op_threads
+                self._session = ort.InferenceSession(
+                    os.path.join(self.model_dir, self.file_name),
+                    sess_options=opts,
+                    providers=["CPUExecutionProvider"],
+                )
+                self._tokenizer = tokenizer
+            return self._session, self._tokenizer
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        session, tokenizer = self._load()
+        enc = tokenizer.encode_batch(list(texts))
+        ids = np.array([e.ids for e in enc], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in enc], dtype=np.int64)
+        inputs = {
+            "input_ids": ids,
+            "attention_mask": mask,
+            "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64),
+        }
+        feed = {i.name: inputs[i.name] for i in session.get_inputs() if i.name in inputs}
+
+        out = session.run(None, feed)[0]
+        if out.ndim == 3:
+            # last_hidden_state -> mean pooling theo attention mask
+            m = mask[:, :, None].astype(np.float32)
+            out = (out * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+        out = out.astype(np.float32)
+        out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+
+def quantize_onnx_model(src_path: str, dst_path: str) -> None:
+    """Dynamic quantization int8 cho trọng số (nhỏ ~4 lần, encode nhanh hơn trên CPU)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(src_path, dst_path, weight_type=QuantType.QInt8)
+
+
+def make_encoder(
+    backend: Optional[str] = None,
+    model_dir: Optional[str] = None,
+    onnx_file: Optional[str] = None,
+) -> QueryEncoder:
+    """
+    Tạo encoder theo cấu hình (mặc định đọc biến môi trường):
+    - EMBEDDING_BACKEND: "sentence-transformers" (mặc định) | "onnx"
+    - EMBEDDING_MODEL_DIR: thư mục model ONNX (bắt buộc với "onnx")
+    - EMBEDDING_ONNX_FILE: tên file .onnx, VD "model_quantized.onnx" (mặc định "model.onnx")
+    Thiếu onnxruntime / thư mục model thì lùi về sentence-transformers.
+    """
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+    if backend == "onnx":
+        model_dir = model_dir or os.getenv("EMBEDDING_MODEL_DIR")
+        onnx_file = onnx_file or os.getenv("EMBEDDING_ONNX_FILE", "model.onnx")
+        if importlib.util.find_spec("onnxruntime") is None:
+            print("⚠️ Chưa cài onnxruntime, dùng sentence-transformers thay thế.")
+        elif not model_dir or not os.path.exists(os.path.join(model_dir, onnx_file)):
+            print(f"⚠️ Không tìm thấy model ONNX '{onnx_file}' trong {model_dir}, dùng sentence-transformers.")
+        else:
+            return OnnxEncoder(model_dir, file_name=onnx_file)
+    return SentenceTransformerEncoder()
@@ -0,0 +1,209 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class CategoricalColumn:
+    """
+    Cột dạng mã hóa categorical: codes[row] -> giá trị trong `uniques`.
+    Row của từng giá trị lưu dạng CSR (đã sắp xếp tăng dần):
+    value_rows[offsets[c]:offsets[c + 1]].
+    """
+
+    def __init__(
+        self,
+        codes: np.ndarray,
+        uniques: np.ndarray,
+        value_rows: np.ndarray,
+        offsets: np.ndarray,
+    ):
+        self.codes = codes
+        self.uniques = pd.Series(uniques, dtype=object)
+        # Giá trị dạng lowercase để so khớp (giống `astype(str).str.lower()` trên cả cột)
+        self.lower = self.uniques.astype(str).str.lower()
+        self.value_rows = value_rows
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, values: pd.Series) -> "CategoricalColumn":
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        codes = codes.astype(np.int32)
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(uniques))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(codes, np.asarray(uniques, dtype=object), order.astype(np.int64), offsets)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "codes": self.codes,
+            "uniques": self.uniques.to_numpy(dtype=object),
+            "value_rows": self.value_rows,
+            "offsets": self.offsets,
+        }
+
+    def count(self, match: np.ndarray) -> int:
+        """Số row thuộc các giá trị được chọn (`match`: mask bool trên uniques)."""
+        return int(np.diff(self.offsets)[match].sum())
+
+    def rows(self, match: np.ndarray) -> np.ndarray:
+        """Row id (tăng dần) của các giá trị được chọn."""
+        parts = [self.value_rows[self.offsets[c]:self.offsets[c + 1]] for c in np.flatnonzero(match)]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+
+class FilterIndex:
+    """
+    Index cho metadata filter của hybrid_search (platform / category / brand / min_reviews).
+
+    Mỗi điều kiện được đánh giá trên các giá trị DUY NHẤT của cột (vài trăm chuỗi)
+    thay vì trên cả catalogue. Planner lấy điều kiện hẹp nhất (đếm từ CSR, không tốn chi phí)
+    để sinh row id, rồi lọc tiếp các điều kiện còn lại bằng bảng tra theo codes
+    -> chi phí tỉ lệ với tập kết quả hẹp nhất. Các tổ hợp filter hay dùng được cache (LRU).
+    """
+
+    cache_size = 256
+
+    def __init__(
+        self,
+        n_rows: int,
+        columns: Dict[str, CategoricalColumn],
+        reviews: Optional[np.ndarray] = None,
+    ):
+        self.n_rows = n_rows
+        self.columns = columns
+        self.reviews = reviews
+        if reviews is not None:
+            self._review_order = np.argsort(reviews, kind="stable").astype(np.int64)
+            self._review_sorted = reviews[self._review_order]
+        self._cache: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(
+        cls,
+        df: pd.DataFrame,
+        columns: List[str],
+        review_col: Optional[str] = None,
+    ) -> "FilterIndex":
+        cats = {col: CategoricalColumn.build(df[col]) for col in columns if col in df.columns}
+        reviews = None
+        if review_col and review_col in df.columns:
+            reviews = pd.to_numeric(df[review_col], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        return cls(len(df), cats, reviews)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Mảng của index theo tên "<cột>/<mảng>" (để lưu vào artifact bundle)."""
+        arrays = {f"{col}/{k}": v for col, c in self.columns.items() for k, v in c.to_arrays().items()}
+        if self.reviews is not None:
+            arrays["reviews"] = self.reviews
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, n_rows: int, arrays: Dict[str, np.ndarray]) -> "FilterIndex":
+        parts: Dict[str, Dict[str, np.ndarray]] = {}
+        for key, arr in arrays.items():
+            if "/" in key:
+                col, name = key.split("/", 1)
+                parts.setdefault(col, {})[name] = arr
+        columns = {col: CategoricalColumn(**p) for col, p in parts.items()}
+        return cls(n_rows, columns, arrays.get("reviews"))
+
+    def _review_rows(self, min_reviews: int) -> np.ndarray:
+        start = int(np.searchsorted(self._review_sorted, min_reviews, side="left"))
+        return np.sort(self._review_order[start:])
+
+    def _plan(
+        self,
+        platforms: Optional[List[str]],
+        category: Optional[str],
+        brand: Optional[str],
+        min_reviews: int,
+        platform_col: str,
+        cat_col: str,
+        cat_hier_col: str,
+        brand_col: str,
+    ) -> Optional[np.ndarray]:
+        # Mỗi điều kiện: (ước lượng số row, hàm sinh row id, hàm lọc tập ứng viên)
+        conds = []
+
+        if category:
+            cat = self.columns[cat_col]
+            hier = self.columns.get(cat_hier_col)
+            eq = cat.lower.eq(category).to_numpy(dtype=bool)
+            if hier is not None:
+                contains = hier.lower.str.contains(category).to_numpy(dtype=bool)
+                conds.append((
+                    cat.count(eq) + hier.count(contains),
+                    lambda: np.union1d(cat.rows(eq), hier.rows(contains)),
+                    lambda r: eq[cat.codes[r]] | contains[hier.codes[r]],
+                ))
+            else:
+                conds.append((cat.count(eq), lambda: cat.rows(eq), lambda r: eq[cat.codes[r]]))
+
+        if platforms and platform_col in self.columns:
+            plat = self.columns[platform_col]
+            isin = plat.uniques.isin(platforms).to_numpy(dtype=bool)
+            conds.append((plat.count(isin), lambda: plat.rows(isin), lambda r: isin[plat.codes[r]]))
+
+        if min_reviews > 0 and self.reviews is not None:
+            n = len(self._review_sorted) - int(np.searchsorted(self._review_sorted, min_reviews, side="left"))
+            conds.append((n, lambda: self._review_rows(min_reviews), lambda r: self.reviews[r] >= min_reviews))
+
+        if brand:
+            br = self.columns[brand_col]
+            contains_b = br.lower.str.contains(brand).to_numpy(dtype=bool)
+            conds.append((br.count(contains_b), lambda: br.rows(contains_b), lambda r: contains_b[br.codes[r]]))
+
+        if not conds:
+            return None
+
+        conds.sort(key=lambda c: c[0])
+        rows = conds[0][1]()
+        for _, _, keep in conds[1:]:
+            if rows.size == 0:
+                break
+            rows = rows[keep(rows)]
+        return rows
+
+    def rows(
+        self,
+        platforms: Optional[List[str]] = None,
+        category: Optional[str] = None,
+        brand: Optional[str] = None,
+        min_reviews: int = 0,
+        platform_col: str = "platform",
+        cat_col: str = "super_category",
+        cat_hier_col: str = "categories",
+        brand_col: str = "brand",
+    ) -> Optional[np.ndarray]:
+        """
+        Row id (vị trí, tăng dần, chỉ đọc) thỏa mọi điều kiện; None nghĩa là không có điều kiện nào.
+        `category` / `brand` đã lowercase, so khớp giống hybrid_search:
+        category = super_category bằng đúng HOẶC categories chứa chuỗi; brand = chứa chuỗi.
+        """
+        key = (
+            tuple(sorted(platforms)) if platforms else None,
+            category or None,
+            brand or None,
+            min_reviews if min_reviews > 0 else 0,
+        )
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        rows = self._plan(platforms, category, brand, min_reviews, platform_col, cat_col, cat_hier_col, brand_col)
+        if rows is None:
+            return None
+        rows.setflags(write=False)
+
+        with self._lock:
+            self._cache[key] = rows
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rows
@@ -0,0 +1,452 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from modules.aggregation import COVERAGE_FIELDS, Grouping, HitAggregator, MetricResult, SortedGroups, records
+from modules.filter_index import FilterIndex
+from modules.sketches import DEFAULT_COMPRESSION, DEFAULT_PRECISION, HyperLogLogSet, TDigestSet
+
+
+# Chiều của cube (tên logic trong column map); mỗi tổ hợp giá trị là 1 cell
+CUBE_DIMS = ("platform", "category", "categories", "brand", "seller_name")
+
+# Metric trả lời được từ cube (sold_distribution cần giá trị sold từng row -> luôn search)
+CUBE_METRICS = (
+    "price_stats", "price_range", "rating_distribution", "category_count", "brand_share",
+    "top_sellers", "top_brands", "seller_diversity", "roi",
+)
+
+# Sai số tương đối mặc định của sketch quantile ROI
+RELATIVE_ACCURACY = 0.01
+
+# Giá: 1 t-digest, số seller / SKU khác nhau: 1 HyperLogLog cho mỗi (platform, super_category, categories, brand).
+# Mọi filter của cube chỉ dùng các chiều này (không lọc theo seller) nên tập cell được chọn luôn gồm trọn các digest
+DIGEST_DIMS = ("platform", "category", "categories", "brand")
+
+# Cột của bảng seller_diversity tính sẵn (cùng thứ tự record của fe_seller_diversity_index)
+DIVERSITY_FIELDS = ("seller_name", "platform", "product_count", "unique_categories", "diversity_index")
+
+
+def quantize(values: np.ndarray, relative_accuracy: float) -> np.ndarray:
+    """
+    Làm tròn giá trị về mốc của thang log cơ số gamma = (1 + a) / (1 - a) (kiểu DDSketch):
+    mọi giá trị trong 1 bucket quy về cùng 1 mốc, sai số tương đối <= a. a = 0 -> giữ nguyên.
+    """
+    if not relative_accuracy:
+        return values
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    out = values.astype(np.float64, copy=True)
+    mag = np.abs(values)
+    nz = mag > 0
+    k = np.ceil(np.log(mag[nz]) / np.log(gamma))
+    out[nz] = np.sign(values[nz]) * 2 * gamma ** k / (gamma + 1)
+    return out
+
+
+@dataclass
+class ValueCounts:
+    """
+    Phân phối giá trị của từng cell dạng CSR: values[offsets[c]:offsets[c + 1]] (tăng dần)
+    kèm số lần xuất hiện. Gộp nhiều cell = nối các đoạn lại (sketch cộng được).
+    """
+
+    offsets: np.ndarray
+    values: np.ndarray
+    counts: np.ndarray
+
+    @classmethod
+    def build(
+        cls,
+        cell: np.ndarray,
+        values: np.ndarray,
+        n_cells: int,
+        relative_accuracy: float = 0.0,
+    ) -> "ValueCounts":
+        keep = ~np.isnan(values)
+        cell, values = cell[keep], quantize(values[keep], relative_accuracy)
+        order = np.lexsort((values, cell))
+        cell, values = cell[order], values[order]
+        new = np.ones(len(values), dtype=bool)
+        new[1:] = (cell[1:] != cell[:-1]) | (values[1:] != values[:-1])
+        starts = np.flatnonzero(new)
+        counts = np.diff(np.append(starts, len(values)))
+        per_cell = np.bincount(cell[starts], minlength=n_cells)
+        offsets = np.concatenate([[0], np.cumsum(per_cell)]).astype(np.int64)
+        return cls(offsets, values[starts], counts.astype(np.int64))
+
+    def take(self, cells: np.ndarray) -> "ValueCounts":
+        """Sketch của các cell `cells` (theo đúng thứ tự đó)."""
+        lengths = np.diff(self.offsets)[cells]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        idx = np.repeat(self.offsets[cells] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return ValueCounts(offsets, self.values[idx], self.counts[idx])
+
+    def cell_of_value(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+
+
+class CubeAggregator(HitAggregator):
+    """
+    Cùng các metric của HitAggregator nhưng mỗi record là 1 cell của cube (đại diện nhiều row):
+    tổng / số đếm lấy từ measure của cell, quantile / phân phối lấy từ sketch.
+    Record trả về cùng dạng với fe_* tương ứng.
+    """
+
+    scope = "market cube"
+
+    def __init__(
+        self,
+        cells: pd.DataFrame,
+        column_map: Dict[str, str],
+        measures: Dict[str, np.ndarray],
+        sketches: Dict[str, ValueCounts],
+        price_digests: TDigestSet,
+        distinct: Dict[str, HyperLogLogSet],
+        cell_digest: np.ndarray,
+        seller_diversity: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        super().__init__(cells, column_map)
+        self.measures = measures
+        self.sketches = sketches
+        # Digest giá / HyperLogLog của các cell được chọn; cell_digest[cell] = vị trí digest của cell
+        self.price_digests = price_digests
+        self.distinct = distinct
+        self.cell_digest = cell_digest
+        # Bảng seller_diversity tính sẵn của đúng các platform được chọn (chỉ khi không lọc category / brand)
+        self.seller_diversity = seller_diversity
+
+    def _weights(self) -> np.ndarray:
+        return self.measures["rows"]
+
+    def _sold(self) -> np.ndarray:
+        return self.measures["sold"]
+
+    def _revenue(self) -> np.ndarray:
+        return self.measures["revenue"]
+
+    def _values(self, name: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        sketch = self.sketches[name]
+        return sketch.values, sketch.counts, sketch.cell_of_value()
+
+    def _price_summary(self, grouping: Grouping, quantiles: Tuple[float, ...]) -> Dict[str, np.ndarray]:
+        """
+        count / mean / std / min / max (chính xác) và quantile, median (gộp t-digest) của giá theo nhóm.
+        Nhóm của `grouping` là tổ hợp con của DIGEST_DIMS nên mỗi digest thuộc đúng 1 nhóm.
+        """
+        inverse, n_groups = grouping.inverse, grouping.n_groups
+        m = self.measures
+        keep = (inverse >= 0) & (m["price_n"] > 0)
+        g, n_cell = inverse[keep], m["price_n"][keep]
+        cell_mean = m["price_sum"][keep] / n_cell
+
+        n = np.bincount(g, weights=n_cell, minlength=n_groups)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.bincount(g, weights=m["price_sum"][keep], minlength=n_groups) / n
+            # Gộp phương sai các cell (Chan và cộng sự): M2 = sum M2_i + sum n_i (mean_i - mean)^2
+            m2 = np.bincount(g, weights=m["price_m2"][keep] + n_cell * (cell_mean - mean[g]) ** 2, minlength=n_groups)
+            std = np.where(n > 1, np.sqrt(m2 / (n - 1)), 0.0)
+        lo = pd.Series(m["price_min"][keep]).groupby(g).min().reindex(range(n_groups)).to_numpy()
+        hi = pd.Series(m["price_max"][keep]).groupby(g).max().reindex(range(n_groups)).to_numpy()
+
+        target = self._digest_target(inverse, len(self.price_digests))
+        qs = self.price_digests.quantiles(target, n_groups, (0.5, *quantiles))
+        out = {"count": n.astype(np.int64), "mean": mean, "std": std, "min": lo, "max": hi, "median": qs[0.5]}
+        out.update({q: qs[q] for q in quantiles})
+        return out
+
+    def _digest_target(self, inverse: np.ndarray, n_digests: int) -> np.ndarray:
+        """Nhóm của từng digest (mọi cell cùng digest thuộc cùng 1 nhóm khi nhóm theo DIGEST_DIMS)."""
+        target = np.full(n_digests, -1, dtype=np.int64)
+        target[self.cell_digest] = inverse
+        return target
+
+    def _distinct(self, inverse: np.ndarray, n_groups: int, name: str) -> Optional[np.ndarray]:
+        if name not in self.distinct:
+            return None
+        sketch = self.distinct[name]
+        return np.rint(sketch.estimate(self._digest_target(inverse, len(sketch)), n_groups)).astype(np.int64)
+
+    def seller_diversity_table(self) -> Dict[str, np.ndarray]:
+        if self.seller_diversity is not None:
+            return self.seller_diversity
+        return super().seller_diversity_table()
+
+    def _metric_sold_distribution(self, bins: Any = None) -> MetricResult:
+        raise ValueError("sold_distribution không có trong market cube")
+
+    def _metric_category_count(self, sublevel_field: str = "categories", top_k: Optional[int] = None) -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        codes, uniques = self.codes(sublevel_field)
+        keep = codes >= 0
+        counts = np.bincount(codes[keep], weights=self._weights()[keep], minlength=len(uniques))
+        # Giống value_counts(): giảm dần theo số lượng
+        order = np.argsort(-counts, kind="stable")
+        order = order[counts[order] > 0]
+        if top_k is not None:
+            order = order[:top_k]
+        position = np.full(len(uniques), -1, dtype=np.int64)
+        position[order] = np.arange(len(order))
+        inverse = np.where(keep, position[codes], -1)
+        data = records(
+            {
+                "product_count": uniques[order],
+                "count": counts[order].astype(np.int64),
+                **self._coverage(inverse, len(order), np.arange(len(order))),
+            }
+        )
+        return MetricResult(data, f"; fe_category_count_plot over {self.scope}")
+
+    def _metric_roi(self, group_by: str = "platform") -> MetricResult:
+        if self.df.empty:
+            return MetricResult([], "; no data")
+        name = {"seller": "seller_name", "brand": "brand"}.get(group_by, "platform")
+        grouping = self.group([name], dropna=False)
+        m = self.measures
+        n = np.bincount(grouping.inverse, weights=m["roi_n"], minlength=grouping.n_groups)
+        total = np.bincount(grouping.inverse, weights=m["roi_sum"], minlength=grouping.n_groups)
+        values, counts, rec = self._values("roi")
+        median = SortedGroups(grouping.inverse[rec], values, grouping.n_groups, counts).median()
+        g = np.flatnonzero(n > 0)
+        data = records(
+            {
+                "group": grouping.keys[0][g],
+                "roi_mean": total[g] / n[g],
+                "roi_median": median[g],
+                "count": n[g].astype(np.int64),
+            }
+        )
+        return MetricResult(data, f"; fe_roi_table_for_A group_by={group_by} over {self.scope}")
+
+
+class MarketCube:
+    """
+    Cube tiền tổng hợp của cả catalogue, dựng 1 lần lúc load (lưu trong artifact bundle).
+
+    Cell = tổ hợp (platform, super_category, categories, brand, seller_name). Mỗi cell giữ số row,
+    tổng sold / doanh thu ước tính, thống kê giá (count, tổng, M2, min, max), tổng ROI và sketch
+    phân phối ROI (làm tròn theo `relative_accuracy`, 0 = chính xác) / rating (chính xác).
+    Phân vị giá lấy từ t-digest theo DIGEST_DIMS (`compression`, None = chính xác; digest nhỏ giữ chính xác),
+    số seller / SKU khác nhau từ HyperLogLog theo DIGEST_DIMS (`distinct`, gộp được giữa các cell).
+    Câu hỏi cấp danh mục / toàn thị trường lọc cell bằng FilterIndex trên bảng cell (cùng quy tắc
+    filter với hybrid_search) rồi tổng hợp cell -> không quét lại row.
+    `seller_diversity` (tùy chọn) là bảng đa dạng danh mục của mọi (platform, seller) trên cả catalogue:
+    không phụ thuộc query nên câu hỏi chỉ lọc platform đọc thẳng bảng này.
+    """
+
+    def __init__(
+        self,
+        n_rows: int,
+        cells: pd.DataFrame,
+        column_map: Dict[str, str],
+        measures: Dict[str, np.ndarray],
+        sketches: Dict[str, ValueCounts],
+        price_digests: TDigestSet,
+        distinct: Dict[str, HyperLogLogSet],
+        cell_digest: np.ndarray,
+        relative_accuracy: float,
+        compression: Optional[float],
+        seller_diversity: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        self.n_rows = n_rows
+        self.cells = cells
+        self.columns = column_map
+        self.measures = measures
+        self.sketches = sketches
+        self.price_digests = price_digests
+        self.distinct = distinct
+        self.cell_digest = cell_digest
+        self.relative_accuracy = relative_accuracy
+        self.compression = compression
+        self.seller_diversity = seller_diversity
+        index_cols = [column_map[d] for d in DIGEST_DIMS]
+        self.index = FilterIndex.build(cells, index_cols)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @classmethod
+    def build(
+        cls,
+        df: pd.DataFrame,
+        column_map: Dict[str, str],
+        relative_accuracy: float = RELATIVE_ACCURACY,
+        seller_diversity: bool = False,
+        compression: Optional[float] = DEFAULT_COMPRESSION,
+        precision: int = DEFAULT_PRECISION,
+    ) -> "MarketCube":
+        key_cols = [column_map[d] for d in CUBE_DIMS]
+        cell = df.groupby(key_cols, dropna=False, sort=False).ngroup().to_numpy(dtype=np.int64)
+        n_cells = int(cell.max()) + 1 if len(cell) else 0
+        _, first = np.unique(cell, return_index=True)
+        cells = df[key_cols].iloc[first].reset_index(drop=True)
+
+        def numeric(name: str) -> np.ndarray:
+            return pd.to_numeric(df[column_map[name]], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+        def total(values: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+            c = cell if rows is None else cell[rows]
+            return np.bincount(c, weights=values, minlength=n_cells)
+
+        price, sold, rating = numeric("price"), numeric("sold"), numeric("rating")
+        sold0 = np.nan_to_num(sold, nan=0.0)
+        has_price = np.flatnonzero(~np.isnan(price))
+        p = price[has_price]
+        price_n = np.bincount(cell[has_price], minlength=n_cells).astype(np.float64)
+        price_sum = total(p, has_price)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cell_mean = price_sum / price_n
+            roi = sold / np.where(price == 0, np.nan, price)
+        has_roi = np.flatnonzero(np.isfinite(roi))
+        by_cell = pd.Series(p).groupby(cell[has_price])
+
+        measures = {
+            "rows": np.bincount(cell, minlength=n_cells).astype(np.float64),
+            "sold": total(sold0),
+            "revenue": total(np.nan_to_num(price, nan=0.0) * sold0),
+            "price_n": price_n,
+            "price_sum": price_sum,
+            "price_m2": total((p - cell_mean[cell[has_price]]) ** 2, has_price),
+            "price_min": by_cell.min().reindex(range(n_cells)).to_numpy(dtype=np.float64),
+            "price_max": by_cell.max().reindex(range(n_cells)).to_numpy(dtype=np.float64),
+            "roi_n": np.bincount(cell[has_roi], minlength=n_cells).astype(np.float64),
+            "roi_sum": total(roi[has_roi], has_roi),
+        }
+        sketches = {
+            "roi": ValueCounts.build(cell[has_roi], roi[has_roi], n_cells, relative_accuracy),
+            "rating": ValueCounts.build(cell, rating, n_cells),
+        }
+        digest_cols = [column_map[d] for d in DIGEST_DIMS]
+        cell_digest = cells.groupby(digest_cols, dropna=False, sort=False).ngroup().to_numpy(dtype=np.int64)
+        n_digests = int(cell_digest.max()) + 1 if len(cell_digest) else 0
+        price_digests = TDigestSet.build(cell_digest[cell], price, n_digests, compression)
+        distinct = {
+            name: HyperLogLogSet.build(cell_digest[cell], df[column_map[name]].to_numpy(), n_digests, precision)
+            for _, name in COVERAGE_FIELDS
+            if column_map[name] in df.columns
+        }
+
+        diversity = HitAggregator(df, column_map).seller_diversity_table() if seller_diversity else None
+        return cls(
+            len(df), cells, column_map, measures, sketches, price_digests, distinct, cell_digest,
+            relative_accuracy, compression, diversity,
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Mảng của cube theo tên (để lưu vào artifact bundle)."""
+        arrays = {
+            "n_rows": np.asarray(self.n_rows),
+            "relative_accuracy": np.asarray(self.relative_accuracy),
+            "compression": np.asarray(np.nan if self.compression is None else self.compression),
+            "cell_digest": self.cell_digest,
+            "key_columns": np.asarray(list(self.cells.columns), dtype=object),
+            "column_map": np.asarray(list(self.columns.items()), dtype=object),
+        }
+        for i, col in enumerate(self.cells.columns):
+            arrays[f"key/{i}"] = self.cells[col].to_numpy(dtype=object)
+        arrays.update({f"measure/{k}": v for k, v in self.measures.items()})
+        for name, sketch in self.sketches.items():
+            for part in ("offsets", "values", "counts"):
+                arrays[f"sketch/{name}/{part}"] = getattr(sketch, part)
+        arrays.update({f"digest/price/{k}": v for k, v in self.price_digests.to_arrays().items()})
+        for name, sketch in self.distinct.items():
+            arrays.update({f"hll/{name}/{k}": v for k, v in sketch.to_arrays().items()})
+        if self.seller_diversity is not None:
+            arrays.update({f"diversity/{k}": v for k, v in self.seller_diversity.items()})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "MarketCube":
+        column_map = {str(k): str(v) for k, v in arrays["column_map"]}
+        key_columns = list(arrays["key_columns"])
+        cells = pd.DataFrame({col: arrays[f"key/{i}"] for i, col in enumerate(key_columns)})
+        measures = {k.split("/", 1)[1]: np.asarray(v) for k, v in arrays.items() if k.startswith("measure/")}
+        sketches = {
+            name: ValueCounts(*(np.asarray(arrays[f"sketch/{name}/{part}"]) for part in ("offsets", "values", "counts")))
+            for name in {k.split("/")[1] for k in arrays if k.startswith("sketch/")}
+        }
+        diversity = None
+        if "diversity/platform" in arrays:
+            diversity = {k: np.asarray(arrays[f"diversity/{k}"]) for k in DIVERSITY_FIELDS}
+        price_digests = TDigestSet.from_arrays(
+            {k.rsplit("/", 1)[1]: v for k, v in arrays.items() if k.startswith("digest/price/")}
+        )
+        distinct = {
+            name: HyperLogLogSet.from_arrays(
+                {k.rsplit("/", 1)[1]: v for k, v in arrays.items() if k.startswith(f"hll/{name}/")}
+            )
+            for name in {k.split("/")[1] for k in arrays if k.startswith("hll/")}
+        }
+        compression = float(arrays["compression"])
+        return cls(
+            int(arrays["n_rows"]), cells, column_map, measures, sketches, price_digests, distinct,
+            np.asarray(arrays["cell_digest"]), float(arrays["relative_accuracy"]),
+            None if np.isnan(compression) else compression, diversity,
+        )
+
+    def category_names(self) -> List[str]:
+        """Tên super_category và categories có trong catalogue."""
+        names = set()
+        for dim in ("category", "categories"):
+            names.update(str(v) for v in self.cells[self.columns[dim]].dropna().unique() if str(v).strip())
+        return sorted(names)
+
+    def select(
+        self,
+        platforms: Optional[List[str]] = None,
+        categories: Optional[List[str]] = None,
+        brand: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Vị trí (tăng dần) các cell thỏa filter, cùng quy tắc với hybrid_search:
+        platform thuộc `platforms`, mỗi category (lowercase) = super_category bằng đúng HOẶC
+        categories chứa chuỗi (nhiều category -> phải thỏa tất cả), brand (lowercase) = chứa chuỗi.
+        """
+        cols = {d: self.columns[d] for d in ("platform", "category", "categories", "brand")}
+        rows = None
+        for category in categories or [None]:
+            found = self.index.rows(
+                platforms=platforms,
+                category=category,
+                brand=brand,
+                platform_col=cols["platform"],
+                cat_col=cols["category"],
+                cat_hier_col=cols["categories"],
+                brand_col=cols["brand"],
+            )
+            if found is not None:
+                rows = found if rows is None else np.intersect1d(rows, found)
+        return np.arange(len(self.cells)) if rows is None else rows
+
+    def supports(self, metric: str, params: Dict[str, Any]) -> bool:
+        if metric not in CUBE_METRICS:
+            return False
+        if metric == "category_count":
+            # Số seller / SKU khác nhau của mỗi nhóm chỉ gộp được khi nhóm là tổ hợp của DIGEST_DIMS
+            return params.get("sublevel_field", "categories") in DIGEST_DIMS
+        return True
+
+    def aggregator(self, cells: np.ndarray, platform_only: bool = False) -> CubeAggregator:
+        """
+        Aggregator trên các cell `cells` (kết quả của select()). `platform_only`: cells chỉ lọc theo
+        platform (không category / brand) -> seller_diversity lấy từ bảng tính sẵn nếu có.
+        """
+        frame = self.cells.iloc[cells].reset_index(drop=True)
+        diversity = None
+        if platform_only and self.seller_diversity is not None:
+            platforms = frame[self.columns["platform"]].unique()
+            keep = pd.Series(self.seller_diversity["platform"]).isin(platforms).to_numpy()
+            diversity = {k: v[keep] for k, v in self.seller_diversity.items()}
+        digests, cell_digest = np.unique(self.cell_digest[cells], return_inverse=True)
+        return CubeAggregator(
+            frame,
+            self.columns,
+            {k: v[cells] for k, v in self.measures.items()},
+            {k: v.take(cells) for k, v in self.sketches.items()},
+            self.price_digests.take(digests),
+            {k: v.take(digests) for k, v in self.distinct.items()},
+            cell_digest.reshape(-1),
+            diversity,
+        )
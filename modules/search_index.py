@@ -0,0 +1,316 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _trigrams(token: str) -> set:
+    """Trigram ký tự của token, đệm 2 khoảng trắng đầu / 1 cuối (giống pg_trgm)."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _prefix_range(keys: List[str], prefix: str) -> Tuple[int, int]:
+    """Khoảng [lo, hi) của các key bắt đầu bằng `prefix` trong list đã sắp xếp."""
+    return bisect_left(keys, prefix), bisect_left(keys, prefix + "\uffff")
+
+
+class TrigramIndex:
+    """
+    Index trigram ký tự -> token id trên vocab (không phải trên từng row),
+    dùng để tìm các token gần giống token query (gõ sai / thiếu ký tự).
+    Độ giống = Jaccard trên tập trigram.
+    """
+
+    def __init__(self, tokens: List[str]):
+        gram_ids: Dict[str, int] = {}
+        pair_gram, pair_tok = [], []
+        n_grams = np.zeros(len(tokens), dtype=np.int32)
+        for tid, tok in enumerate(tokens):
+            grams = _trigrams(tok)
+            n_grams[tid] = len(grams)
+            for g in grams:
+                pair_gram.append(gram_ids.setdefault(g, len(gram_ids)))
+                pair_tok.append(tid)
+
+        pair_gram = np.asarray(pair_gram, dtype=np.int64)
+        pair_tok = np.asarray(pair_tok, dtype=np.int64)
+        order = np.lexsort((pair_tok, pair_gram))
+        self.gram_ids = gram_ids
+        self.gram_tokens = pair_tok[order]
+        counts = np.bincount(pair_gram, minlength=len(gram_ids))
+        self.gram_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.n_grams = n_grams
+
+    def similar(self, token: str, threshold: float = 0.4) -> Tuple[np.ndarray, np.ndarray]:
+        """Token id có độ giống >= threshold với `token`, sắp xếp giảm dần theo độ giống."""
+        grams = [self.gram_ids[g] for g in _trigrams(token) if g in self.gram_ids]
+        if not grams:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        hits = np.concatenate([self.gram_tokens[self.gram_offsets[g]:self.gram_offsets[g + 1]] for g in grams])
+        tids, overlap = np.unique(hits, return_counts=True)
+        sims = overlap / (len(_trigrams(token)) + self.n_grams[tids] - overlap)
+        keep = sims >= threshold
+        tids, sims = tids[keep], sims[keep]
+        order = np.argsort(-sims, kind="stable")
+        return tids[order], sims[order]
+
+
+class TokenIndex:
+    """
+    Inverted index cho tên sản phẩm (đã chuẩn hóa).
+
+    - vocab: token -> term id
+    - postings dạng CSR: row id của term t nằm trong
+      term_rows[term_offsets[t]:term_offsets[t + 1]] (đã sắp xếp tăng dần)
+    - row_token_count: số token KHÁC NHAU của mỗi row (để tính Jaccard)
+    - name_norm: tên đã chuẩn hóa, dùng để kiểm tra substring mà không chạy lại regex
+    - vocab đã sắp xếp theo tiền tố / hậu tố / mọi hậu tố (suffix array trên vocab)
+      để tra token theo tiền tố, hậu tố, substring bằng bisect thay vì quét cả vocab
+    - kết quả substring_rows được cache (LRU) vì cùng 1 query được tra cả lúc chấm điểm
+      lexical lẫn lúc lọc phrase
+    - trigram index trên vocab để sinh ứng viên khi query gõ sai (fuzzy_terms / fuzzy_rows)
+    - trọng số BM25 của từng posting tính sẵn lúc load: CSR term-major chính là
+      ma trận document-term chuyển vị, điểm BM25 của query = 1 phép gom (sparse mat-vec)
+    """
+
+    bm25_k1 = 1.2
+    bm25_b = 0.75
+
+    substring_cache_size = 256
+
+    def __init__(
+        self,
+        vocab: Dict[str, int],
+        term_offsets: np.ndarray,
+        term_rows: np.ndarray,
+        row_token_count: np.ndarray,
+        name_norm: np.ndarray,
+        term_tf: Optional[np.ndarray] = None,
+        row_length: Optional[np.ndarray] = None,
+    ):
+        self.vocab = vocab
+        self.term_offsets = term_offsets
+        self.term_rows = term_rows
+        self.row_token_count = row_token_count
+        self.name_norm = name_norm
+        # Số lần term xuất hiện trong row (song song term_rows) và tổng số token của row, cho BM25
+        self.term_tf = term_tf if term_tf is not None else np.ones(len(term_rows), dtype=np.int32)
+        self.row_length = row_length if row_length is not None else row_token_count
+        self.n_rows = int(len(row_token_count))
+        self._substring_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._substring_lock = threading.Lock()
+
+        tokens = list(vocab)
+        self.tokens = [""] * len(vocab)
+        for tok, tid in vocab.items():
+            self.tokens[tid] = tok
+        self.trigrams = TrigramIndex(self.tokens)
+        self.bm25_weight = self._bm25_weights()
+        self._prefix_keys, self._prefix_ids = self._sorted_keys(
+            (tok, vocab[tok]) for tok in tokens
+        )
+        self._suffix_keys, self._suffix_ids = self._sorted_keys(
+            (tok[::-1], vocab[tok]) for tok in tokens
+        )
+        self._substr_keys, self._substr_ids = self._sorted_keys(
+            (tok[i:], vocab[tok]) for tok in tokens for i in range(len(tok))
+        )
+
+    @staticmethod
+    def _sorted_keys(pairs: Iterable[Tuple[str, int]]) -> Tuple[List[str], np.ndarray]:
+        pairs = sorted(pairs)
+        keys = [k for k, _ in pairs]
+        ids = np.fromiter((i for _, i in pairs), dtype=np.int64, count=len(pairs))
+        return keys, ids
+
+    def _terms_with_prefix(self, prefix: str) -> np.ndarray:
+        lo, hi = _prefix_range(self._prefix_keys, prefix)
+        return self._prefix_ids[lo:hi]
+
+    def _terms_with_suffix(self, suffix: str) -> np.ndarray:
+        lo, hi = _prefix_range(self._suffix_keys, suffix[::-1])
+        return self._suffix_ids[lo:hi]
+
+    def _terms_containing(self, part: str) -> np.ndarray:
+        # part nằm trong token <=> part là tiền tố của một hậu tố nào đó của token
+        lo, hi = _prefix_range(self._substr_keys, part)
+        return np.unique(self._substr_ids[lo:hi])
+
+    @classmethod
+    def build(cls, name_norm: Iterable[str]) -> "TokenIndex":
+        """Dựng index từ danh sách tên đã chuẩn hóa (token cách nhau bởi khoảng trắng)."""
+        names = pd.Series(list(name_norm), dtype=object)
+        n_rows = len(names)
+
+        tokens = names.str.split().explode().dropna()
+        tokens = tokens[tokens != ""]
+        all_rows = tokens.index.to_numpy(dtype=np.int64)
+        row_length = np.bincount(all_rows, minlength=n_rows).astype(np.int32)
+        pairs = pd.DataFrame({"row": all_rows, "tok": tokens.to_numpy()})
+        pairs = pairs.groupby(["row", "tok"], sort=False).size().reset_index(name="tf")
+
+        term_ids, uniques = pd.factorize(pairs["tok"])
+        rows = pairs["row"].to_numpy()
+
+        order = np.lexsort((rows, term_ids))
+        term_rows = rows[order]
+        term_tf = pairs["tf"].to_numpy(dtype=np.int32)[order]
+        counts = np.bincount(term_ids, minlength=len(uniques))
+        term_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        row_token_count = np.bincount(rows, minlength=n_rows).astype(np.int32)
+        vocab = {tok: i for i, tok in enumerate(uniques)}
+
+        return cls(
+            vocab, term_offsets, term_rows, row_token_count, names.to_numpy(),
+            term_tf=term_tf, row_length=row_length,
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Các mảng gốc của index (để lưu vào artifact bundle); phần còn lại dựng lại khi nạp."""
+        return {
+            "tokens": np.asarray(self.tokens, dtype=object),
+            "term_offsets": self.term_offsets,
+            "term_rows": self.term_rows,
+            "term_tf": self.term_tf,
+            "row_token_count": self.row_token_count,
+            "row_length": self.row_length,
+            "name_norm": np.asarray(self.name_norm, dtype=object),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "TokenIndex":
+        vocab = {tok: i for i, tok in enumerate(arrays["tokens"].tolist())}
+        return cls(
+            vocab, arrays["term_offsets"], arrays["term_rows"], arrays["row_token_count"],
+            arrays["name_norm"], term_tf=arrays["term_tf"], row_length=arrays["row_length"],
+        )
+
+    def _bm25_weights(self) -> np.ndarray:
+        """idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)) cho từng posting."""
+        if len(self.term_rows) == 0:
+            return np.empty(0, dtype=np.float32)
+        k1, b = self.bm25_k1, self.bm25_b
+        df_t = np.diff(self.term_offsets)
+        idf = np.log1p((self.n_rows - df_t + 0.5) / (df_t + 0.5))
+        term_of_posting = np.repeat(np.arange(len(df_t)), df_t)
+
+        dl = self.row_length[self.term_rows].astype(np.float64)
+        avgdl = max(float(self.row_length.mean()), 1e-9)
+        tf = self.term_tf.astype(np.float64)
+        w = idf[term_of_posting] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        return w.astype(np.float32)
+
+    def postings(self, term_id: int) -> np.ndarray:
+        return self.term_rows[self.term_offsets[term_id]:self.term_offsets[term_id + 1]]
+
+    def _union_postings(self, term_ids: Iterable[int]) -> np.ndarray:
+        term_ids = list(term_ids)
+        if not term_ids:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.postings(t) for t in term_ids]))
+
+    def jaccard(self, q_tokens: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Jaccard(query tokens, row tokens) cho mọi row có ít nhất 1 token chung.
+        Row không có trong kết quả có Jaccard = 0.
+        """
+        q_tokens = set(q_tokens)
+        term_ids = [self.vocab[t] for t in q_tokens if t in self.vocab]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        hits = np.concatenate([self.postings(t) for t in term_ids])
+        rows, overlap = np.unique(hits, return_counts=True)
+        union = len(q_tokens) + self.row_token_count[rows] - overlap
+        return rows, overlap / union
+
+    def fuzzy_terms(self, token: str, threshold: float = 0.4) -> np.ndarray:
+        """Term id gần giống `token` (token có sẵn trong vocab luôn đứng đầu)."""
+        tids, _ = self.trigrams.similar(token, threshold)
+        exact = self.vocab.get(token)
+        if exact is None:
+            return tids
+        return np.concatenate([[exact], tids[tids != exact]]).astype(np.int64)
+
+    def fuzzy_rows(self, q_tokens: Iterable[str], threshold: float = 0.4) -> Tuple[np.ndarray, List[str]]:
+        """
+        Row chứa ít nhất 1 token gần giống 1 token của query, kèm query đã "sửa" theo vocab
+        (token không có trong vocab được thay bằng token giống nhất, nếu có).
+        """
+        term_ids: List[np.ndarray] = []
+        corrected: List[str] = []
+        for tok in q_tokens:
+            tids = self.fuzzy_terms(tok, threshold)
+            corrected.append(self.tokens[tids[0]] if len(tids) else tok)
+            term_ids.append(tids)
+        rows = self._union_postings(np.concatenate(term_ids)) if term_ids else np.empty(0, dtype=np.int64)
+        return rows, corrected
+
+    def bm25(self, q_tokens: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Điểm BM25 của query (tập token) cho mọi row có ít nhất 1 token chung.
+        Row không có trong kết quả có điểm = 0.
+        """
+        term_ids = [self.vocab[t] for t in set(q_tokens) if t in self.vocab]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        spans = [slice(self.term_offsets[t], self.term_offsets[t + 1]) for t in term_ids]
+        hits = np.concatenate([self.term_rows[sp] for sp in spans])
+        weights = np.concatenate([self.bm25_weight[sp] for sp in spans])
+        rows, inverse = np.unique(hits, return_inverse=True)
+        return rows, np.bincount(inverse, weights=weights, minlength=len(rows))
+
+    def substring_rows(self, q_norm: str) -> np.ndarray:
+        """
+        Các row có `q_norm` là substring của tên đã chuẩn hóa.
+
+        Sinh ứng viên từ vocab (tra bằng bisect) thay vì quét từng row:
+        - query 1 token: token đó phải là substring của 1 token trong row
+        - query nhiều token: token đầu là hậu tố, token cuối là tiền tố,
+          các token giữa phải khớp nguyên vẹn
+        Sau đó xác nhận lại bằng phép `in` trên name_norm của các ứng viên.
+        Kết quả (chỉ đọc) được cache theo q_norm.
+        """
+        with self._substring_lock:
+            rows = self._substring_cache.get(q_norm)
+            if rows is not None:
+                self._substring_cache.move_to_end(q_norm)
+                return rows
+
+        rows = self._substring_rows(q_norm)
+        rows.setflags(write=False)
+        with self._substring_lock:
+            self._substring_cache[q_norm] = rows
+            while len(self._substring_cache) > self.substring_cache_size:
+                self._substring_cache.popitem(last=False)
+        return rows
+
+    def _substring_rows(self, q_norm: str) -> np.ndarray:
+        q_parts = q_norm.split()
+        if not q_parts:
+            return np.empty(0, dtype=np.int64)
+
+        if len(q_parts) == 1:
+            return self._union_postings(self._terms_containing(q_parts[0]))
+
+        first, inner, last = q_parts[0], q_parts[1:-1], q_parts[-1]
+        candidates: Optional[np.ndarray] = None
+        for tok in inner:
+            if tok not in self.vocab:
+                return np.empty(0, dtype=np.int64)
+            rows = self.postings(self.vocab[tok])
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+
+        for term_ids in (self._terms_with_suffix(first), self._terms_with_prefix(last)):
+            rows = self._union_postings(term_ids)
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            if candidates.size == 0:
+                return candidates
+
+        keep = np.fromiter((q_norm in s for s in self.name_norm[candidates]), dtype=bool, count=len(candidates))
+        return candidates[keep]
@@ -0,0 +1,227 @@
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from modules.embedding_store import EmbeddingStore
+from modules.vector_index import _top_k
+
+
+# Trạng thái trong từng worker process (gắn vào shared memory 1 lần lúc khởi tạo)
+_WORKER_EMB: Optional[Union[np.ndarray, EmbeddingStore]] = None
+_WORKER_SHM: List[shared_memory.SharedMemory] = []
+
+
+def _attach(spec: Dict) -> Tuple[Union[np.ndarray, EmbeddingStore], List[shared_memory.SharedMemory]]:
+    shm = shared_memory.SharedMemory(name=spec["vectors"])
+    handles = [shm]
+    vectors = np.ndarray(spec["shape"], dtype=spec["dtype"], buffer=shm.buf)
+    vectors.setflags(write=False)
+    if spec["kind"] == "ndarray":
+        return vectors, handles
+    scales = None
+    if spec["scales"]:
+        s_shm = shared_memory.SharedMemory(name=spec["scales"])
+        handles.append(s_shm)
+        scales = np.ndarray((spec["shape"][0],), dtype=np.float32, buffer=s_shm.buf)
+        scales.setflags(write=False)
+    return EmbeddingStore(vectors, scales), handles
+
+
+def _init_worker(spec: Dict) -> None:
+    global _WORKER_EMB, _WORKER_SHM
+    _WORKER_EMB, _WORKER_SHM = _attach(spec)
+
+
+def _slice_rows(emb: Union[np.ndarray, EmbeddingStore], start: int, stop: int):
+    """Các row [start, stop) dạng view (không copy)."""
+    if isinstance(emb, EmbeddingStore):
+        scales = emb.scales[start:stop] if emb.scales is not None else None
+        return EmbeddingStore(emb.vectors[start:stop], scales, chunk_rows=emb.chunk_rows)
+    return emb[start:stop]
+
+
+def _score_shard(
+    start: int,
+    stop: int,
+    q_vec: np.ndarray,
+    rows: Optional[np.ndarray],
+    lex_at: np.ndarray,
+    lex_val: np.ndarray,
+    alpha: float,
+    beta: float,
+    k: Optional[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Chấm điểm 1 shard (row [start, stop) của ma trận embedding) trong worker.
+    `rows`: row id (tăng dần, trong shard) còn lại sau filter, None = cả shard.
+    `lex_at` / `lex_val`: điểm lexical khác 0, theo vị trí trong danh sách ứng viên của shard.
+    Trả về (vị trí ứng viên, điểm) của top-k trong shard, đã xếp giảm dần.
+    """
+    return _rank_shard(_WORKER_EMB, start, stop, q_vec, rows, lex_at, lex_val, alpha, beta, k)
+
+
+def _rank_shard(emb, start, stop, q_vec, rows, lex_at, lex_val, alpha, beta, k):
+    # Cùng phép tính với _vector_scores / _rank_positions của analytics_core (kết quả trùng khớp)
+    if rows is None:
+        vector_scores = _slice_rows(emb, start, stop) @ q_vec
+    else:
+        vector_scores = np.empty(len(rows), dtype=np.result_type(emb.dtype, q_vec.dtype))
+        for s in range(0, len(rows), 65_536):
+            block = rows[s:s + 65_536]
+            vector_scores[s:s + len(block)] = emb[block] @ q_vec
+    lexical_scores = np.zeros(len(vector_scores), dtype=np.float64)
+    lexical_scores[lex_at] = lex_val
+    final_scores = alpha * lexical_scores + beta * vector_scores
+
+    hit = np.flatnonzero(final_scores > 0)
+    if k is not None:
+        order = hit[_top_k(final_scores[hit], k)]
+    else:
+        order = hit[np.argsort(-final_scores[hit], kind="stable")]
+    return order, final_scores[order]
+
+
+class ShardedSearch:
+    """
+    Chấm điểm vector + xếp hạng của hybrid_search song song trên nhiều process.
+
+    Ma trận embedding (giữ nguyên dtype lưu trữ, int8 kèm scale) được copy 1 lần vào
+    `multiprocessing.shared_memory`; mọi worker gắn vào cùng vùng nhớ (không copy) và
+    process chính dùng luôn bản này qua `.embeddings`. Catalogue chia thành `n_shards`
+    khoảng row liên tiếp (ranh giới làm tròn theo `align`); mỗi worker trả top-k của shard mình, process chính gộp lại
+    (điểm bằng nhau xếp theo vị trí như bản tuần tự) -> kết quả giống hệt chạy 1 process.
+    """
+
+    def __init__(
+        self,
+        emb: Union[np.ndarray, EmbeddingStore],
+        workers: int = 4,
+        n_shards: Optional[int] = None,
+        min_rows: int = 100_000,
+        align: Optional[int] = None,
+    ):
+        self.n_rows = len(emb)
+        self.workers = workers
+        self.n_shards = n_shards or workers
+        self.min_rows = min_rows
+        self._shm: List[shared_memory.SharedMemory] = []
+        self._spec, self.embeddings = self._share(emb)
+        # Ranh giới shard là bội của khối nhân của EmbeddingStore: mỗi row được nhân trong
+        # đúng khối như bản tuần tự -> điểm trùng khớp từng bit (BLAS làm tròn theo khối)
+        if align is None:
+            align = emb.chunk_rows if isinstance(emb, EmbeddingStore) else 1
+        bounds = np.round(np.linspace(0, self.n_rows, self.n_shards + 1)[1:-1] / align) * align
+        bounds = np.clip(bounds, 0, self.n_rows).astype(np.int64)
+        self.bounds = np.unique(np.concatenate([[0], bounds, [self.n_rows]]))
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self._spec,))
+        atexit.register(self.close)
+
+    def _alloc(self, nbytes: int) -> shared_memory.SharedMemory:
+        shm = shared_memory.SharedMemory(create=True, size=max(int(nbytes), 1))
+        self._shm.append(shm)
+        return shm
+
+    def _share(self, emb: Union[np.ndarray, EmbeddingStore]):
+        is_store = isinstance(emb, EmbeddingStore)
+        src = emb.vectors if is_store else np.asarray(emb)
+        shape = (self.n_rows, int(src.shape[1]))
+        vec_shm = self._alloc(shape[0] * shape[1] * src.dtype.itemsize)
+        vectors = np.ndarray(shape, dtype=src.dtype, buffer=vec_shm.buf)
+        spec = {
+            "kind": "store" if is_store else "ndarray",
+            "vectors": vec_shm.name,
+            "shape": shape,
+            "dtype": src.dtype.str,
+            "scales": None,
+        }
+        scales = None
+        if is_store and emb.scales is not None:
+            s_shm = self._alloc(shape[0] * 4)
+            scales = np.ndarray((shape[0],), dtype=np.float32, buffer=s_shm.buf)
+            spec["scales"] = s_shm.name
+
+        # Copy theo khối (row logic, bỏ qua row map của store) để không bung cả ma trận
+        chunk = 65_536
+        for start in range(0, self.n_rows, chunk):
+            stop = min(start + chunk, self.n_rows)
+            file_rows = emb._file_rows(slice(start, stop)) if is_store else slice(start, stop)
+            vectors[start:stop] = src[file_rows]
+            if scales is not None:
+                scales[start:stop] = emb.scales[file_rows]
+        vectors.setflags(write=False)
+        if not is_store:
+            return spec, vectors
+        if scales is not None:
+            scales.setflags(write=False)
+        return spec, EmbeddingStore(vectors, scales, chunk_rows=emb.chunk_rows)
+
+    def accepts(self, emb, idx: np.ndarray) -> bool:
+        """Có chạy song song cho tập ứng viên `idx` (row id embedding) hay không."""
+        return (
+            self._pool is not None
+            and emb is self.embeddings
+            and len(idx) >= self.min_rows
+            and bool(np.all(idx[1:] >= idx[:-1]))
+        )
+
+    def rank(
+        self,
+        q_vec: np.ndarray,
+        idx: np.ndarray,
+        lexical_scores: np.ndarray,
+        alpha: float,
+        beta: float,
+        k: Optional[int],
+    ) -> np.ndarray:
+        """
+        Vị trí (trong `idx`) của các row có điểm > 0, xếp giảm dần theo
+        alpha * lexical + beta * vector, tối đa `k` row (None = tất cả).
+        `idx`: row id embedding tăng dần; `lexical_scores` song song với `idx`.
+        """
+        full = len(idx) == self.n_rows
+        cuts = np.searchsorted(idx, self.bounds)
+        lex_pos = np.flatnonzero(lexical_scores)
+
+        futures = []
+        for i in range(len(self.bounds) - 1):
+            lo, hi = int(cuts[i]), int(cuts[i + 1])
+            if lo == hi:
+                continue
+            rows = None if full else idx[lo:hi]
+            a, b = np.searchsorted(lex_pos, [lo, hi])
+            at = lex_pos[a:b]
+            futures.append((lo, self._pool.submit(
+                _score_shard, int(self.bounds[i]), int(self.bounds[i + 1]), q_vec, rows,
+                at - lo, lexical_scores[at], alpha, beta, k,
+            )))
+
+        parts = [(lo + order, scores) for lo, fut in futures for order, scores in [fut.result()]]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        positions = np.concatenate([p for p, _ in parts])
+        scores = np.concatenate([s for _, s in parts])
+        # Gộp theo vị trí tăng dần rồi xếp ổn định -> điểm bằng nhau giữ thứ tự như bản tuần tự
+        by_pos = np.argsort(positions, kind="stable")
+        positions, scores = positions[by_pos], scores[by_pos]
+        if k is not None:
+            return positions[_top_k(scores, k)]
+        return positions[np.argsort(-scores, kind="stable")]
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        for shm in self._shm:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+            try:
+                shm.close()
+            except BufferError:
+                # Vẫn còn view (VD `.embeddings` đang được dùng): vùng nhớ giải phóng khi view bị thu hồi
+                pass
+        self._shm = []
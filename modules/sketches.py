@@ -0,0 +1,275 @@
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+# Độ nén mặc định của t-digest: mỗi digest tối đa ~compression / 2 centroid,
+# centroid quanh trung vị phủ ~pi / compression phân vị (đuôi phân phối: centroid 1 giá trị)
+DEFAULT_COMPRESSION = 200.0
+
+
+def _k_scale(q: np.ndarray, compression: float) -> np.ndarray:
+    """Hàm scale k1 của t-digest: k(q) = compression / (2 pi) * asin(2q - 1)."""
+    return compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1.0, 1.0))
+
+
+def _lerp(a: np.ndarray, b: np.ndarray, gamma: np.ndarray) -> np.ndarray:
+    # Cùng công thức nội suy với np.quantile (numpy _lerp) -> nhóm chính xác trùng khớp từng bit
+    diff = b - a
+    return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+
+@dataclass
+class TDigestSet:
+    """
+    Nhiều t-digest (mỗi nhóm 1 digest) dạng CSR: centroid thứ i của nhóm g nằm trong
+    [offsets[g], offsets[g + 1]), xếp tăng dần theo `means`, kèm `weights` (số giá trị).
+    `point[i]` = mọi giá trị của centroid bằng nhau (giá trị chính xác, không phải trung bình);
+    nhóm có <= `exact_max` giá trị (hoặc compression = None) giữ chính xác: mỗi giá trị khác nhau
+    là 1 centroid point. `lo` / `hi`: min / max chính xác của từng nhóm.
+
+    Digest cộng được: gộp nhiều nhóm = nối centroid của chúng (quantiles() làm việc đó theo lô).
+    """
+
+    offsets: np.ndarray
+    means: np.ndarray
+    weights: np.ndarray
+    point: np.ndarray
+    lo: np.ndarray
+    hi: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def build(
+        cls,
+        group: np.ndarray,
+        values: np.ndarray,
+        n_groups: int,
+        compression: Optional[float] = DEFAULT_COMPRESSION,
+        exact_max: Optional[int] = None,
+    ) -> "TDigestSet":
+        """
+        Digest của `values` theo `group` (mã 0..n_groups-1, -1 / NaN bị bỏ).
+        `exact_max` mặc định = compression: nhóm nhỏ hơn không đáng nén.
+        """
+        keep = (group >= 0) & ~np.isnan(values)
+        group, values = group[keep], values[keep]
+        order = np.lexsort((values, group))
+        group, values = group[order].astype(np.int64), values[order]
+
+        n = np.bincount(group, minlength=n_groups)
+        start = np.concatenate([[0], np.cumsum(n)[:-1]]).astype(np.int64)
+        rank = np.arange(len(values)) - start[group]
+
+        if compression is None:
+            exact = np.ones(n_groups, dtype=bool)
+        else:
+            exact = n <= (compression if exact_max is None else exact_max)
+        # Mã centroid trong nhóm: nhóm chính xác -> theo giá trị, nhóm nén -> floor(k(q)) tại mép trái của giá trị
+        new_value = np.ones(len(values), dtype=bool)
+        new_value[1:] = (group[1:] != group[:-1]) | (values[1:] != values[:-1])
+        value_id = np.cumsum(new_value) - 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k = np.floor(_k_scale(rank / n[group], compression or 1.0)).astype(np.int64)
+        boundary = np.ones(len(values), dtype=bool)
+        boundary[1:] = (group[1:] != group[:-1]) | (k[1:] != k[:-1])
+        digest_id = np.cumsum(boundary) - 1
+        # Tách riêng nhóm chính xác / nén để mã centroid tăng dần trên toàn mảng
+        centroid_key = np.where(exact[group], value_id, digest_id)
+        centroid = np.cumsum(np.r_[True, (group[1:] != group[:-1]) | (centroid_key[1:] != centroid_key[:-1])]) - 1
+        if len(values) == 0:
+            centroid = np.empty(0, dtype=np.int64)
+
+        n_centroids = int(centroid[-1]) + 1 if len(centroid) else 0
+        weights = np.bincount(centroid, minlength=n_centroids).astype(np.int64)
+        first = np.concatenate([[0], np.cumsum(weights)[:-1]]).astype(np.int64)
+        last = first + weights - 1
+        point = values[first] == values[last] if n_centroids else np.empty(0, dtype=bool)
+        # Centroid 1 giá trị lấy đúng giá trị (trung bình cộng có thể lệch bit)
+        sums = np.bincount(centroid, weights=values, minlength=n_centroids)
+        means = np.where(point, values[first], sums / np.maximum(weights, 1))
+
+        per_group = np.bincount(group[first], minlength=n_groups) if n_centroids else np.zeros(n_groups, dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(per_group)]).astype(np.int64)
+        has = n > 0
+        lo, hi = np.full(n_groups, np.nan), np.full(n_groups, np.nan)
+        lo[has], hi[has] = values[start[has]], values[start[has] + n[has] - 1]
+        return cls(offsets, means.astype(np.float64), weights, point, lo, hi)
+
+    def take(self, groups: np.ndarray) -> "TDigestSet":
+        """Digest của các nhóm `groups` (theo đúng thứ tự đó)."""
+        lengths = np.diff(self.offsets)[groups]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        idx = np.repeat(self.offsets[groups] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return TDigestSet(offsets, self.means[idx], self.weights[idx], self.point[idx], self.lo[groups], self.hi[groups])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in ("offsets", "means", "weights", "point", "lo", "hi")}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "TDigestSet":
+        return cls(*(np.asarray(arrays[name]) for name in ("offsets", "means", "weights", "point", "lo", "hi")))
+
+    def quantiles(self, target: np.ndarray, n_targets: int, qs: Sequence[float]) -> Dict[float, np.ndarray]:
+        """
+        Gộp digest theo `target` (digest g -> nhóm đích target[g], -1 = bỏ) rồi tính quantile của
+        từng nhóm đích: {q: mảng n_targets} (NaN nếu nhóm rỗng).
+
+        Mỗi centroid là các giá trị ở vị trí [L, R] trong nhóm đã sắp xếp: centroid point cho mốc
+        (L, giá trị) và (R, giá trị), centroid nén cho 1 mốc tại tâm (L + R) / 2; hai đầu mút là
+        (0, min) và (n - 1, max). Quantile q = nội suy tuyến tính giữa các mốc tại vị trí (n - 1) q,
+        nên nhóm chỉ gồm centroid point trả về đúng np.quantile (method="linear").
+        """
+        out = {q: np.full(n_targets, np.nan) for q in qs}
+        c_target = np.repeat(target, np.diff(self.offsets))
+        keep = c_target >= 0
+        if not keep.any():
+            return out
+        g, means, weights, point = c_target[keep], self.means[keep], self.weights[keep], self.point[keep]
+        order = np.lexsort((means, g))
+        g, means, weights, point = g[order], means[order], weights[order], point[order]
+
+        n = np.bincount(g, weights=weights, minlength=n_targets).astype(np.int64)
+        start = np.concatenate([[0], np.cumsum(n)[:-1]]).astype(np.int64)
+        left = np.cumsum(weights) - weights - start[g]
+        right = left + weights - 1
+        has_digest = target >= 0
+        lo = np.full(n_targets, np.inf)
+        hi = np.full(n_targets, -np.inf)
+        np.fmin.at(lo, target[has_digest], self.lo[has_digest])
+        np.fmax.at(hi, target[has_digest], self.hi[has_digest])
+
+        # Mốc (nhóm, vị trí, giá trị)
+        is_first = np.r_[True, g[1:] != g[:-1]]
+        is_last = np.r_[g[1:] != g[:-1], True]
+        spread = ~point
+        knot_g = np.concatenate([g[point], g[point], g[spread], g[is_first & spread], g[is_last & spread]])
+        knot_pos = np.concatenate([
+            left[point], right[point], (left[spread] + right[spread]) / 2,
+            np.zeros(int((is_first & spread).sum())), (n[g] - 1)[is_last & spread],
+        ]).astype(np.float64)
+        knot_val = np.concatenate([
+            means[point], means[point], means[spread], lo[g[is_first & spread]], hi[g[is_last & spread]],
+        ])
+        order = np.lexsort((knot_pos, knot_g))
+        knot_g, knot_pos, knot_val = knot_g[order], knot_pos[order], knot_val[order]
+        # Bỏ mốc trùng vị trí (centroid point 1 giá trị: L = R) để khoảng nội suy luôn > 0
+        dup = np.r_[False, (knot_g[1:] == knot_g[:-1]) & (knot_pos[1:] == knot_pos[:-1])]
+        knot_g, knot_pos, knot_val = knot_g[~dup], knot_pos[~dup], knot_val[~dup]
+        # Vị trí là bội của 0.5 -> khóa nguyên 2 * (vị trí + số giá trị của các nhóm trước), tăng dần
+        # trên toàn mảng; tìm mốc bằng số nguyên để không lệch do làm tròn khi nhóm nằm xa đầu mảng
+        key = (2 * knot_pos).astype(np.int64) + 2 * start[knot_g]
+        last_knot = np.searchsorted(knot_g, np.arange(n_targets), side="right") - 1
+
+        groups = np.flatnonzero(n > 0)
+        for q in qs:
+            t = (n[groups] - 1) * q
+            a = np.searchsorted(key, np.floor(2 * t).astype(np.int64) + 2 * start[groups], side="right") - 1
+            b = np.minimum(a + 1, last_knot[groups])
+            span = knot_pos[b] - knot_pos[a]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                gamma = np.where(span > 0, (t - knot_pos[a]) / span, 0.0)
+            out[q][groups] = _lerp(knot_val[a], knot_val[b], gamma)
+        return out
+
+
+# Độ chính xác mặc định của HyperLogLog: 2^precision register, sai số chuẩn ~1.04 / sqrt(2^precision) (~1.6%)
+DEFAULT_PRECISION = 12
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Số bit của từng phần tử uint64 (0 -> 0), tính chính xác qua 2 nửa 32 bit."""
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1]).astype(np.int64)
+
+
+@dataclass
+class HyperLogLogSet:
+    """
+    Nhiều sketch HyperLogLog (mỗi nhóm 1 sketch) đếm số giá trị khác nhau, dạng CSR thưa:
+    register khác 0 của nhóm g là index[offsets[g]:offsets[g + 1]] (tăng dần) kèm `rho`.
+    Nhóm ít giá trị chỉ tốn vài register; gộp nhiều nhóm = lấy max register (estimate() làm theo lô).
+    """
+
+    offsets: np.ndarray
+    index: np.ndarray
+    rho: np.ndarray
+    precision: int
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def build(
+        cls,
+        group: np.ndarray,
+        values: np.ndarray,
+        n_groups: int,
+        precision: int = DEFAULT_PRECISION,
+    ) -> "HyperLogLogSet":
+        """Sketch các giá trị `values` (chuỗi / số, NaN bị bỏ) theo `group` (-1 bị bỏ)."""
+        values = pd.Series(values, dtype=object)
+        keep = (group >= 0) & values.notna().to_numpy()
+        group = group[keep].astype(np.int64)
+        # Hash 64 bit cố định (không phụ thuộc PYTHONHASHSEED) -> sketch lưu trong bundle dùng lại được
+        h = pd.util.hash_array(values[keep].astype(str).to_numpy(dtype=object))
+        width = 64 - precision
+        index = (h >> np.uint64(width)).astype(np.int64)
+        rest = h & np.uint64((1 << width) - 1)
+        rho = (width - _bit_length(rest) + 1).astype(np.uint8)
+
+        # Giữ register lớn nhất của mỗi (nhóm, index)
+        key = group * (1 << precision) + index
+        order = np.lexsort((rho, key))
+        key, rho = key[order], rho[order]
+        last = np.r_[key[1:] != key[:-1], True] if len(key) else np.empty(0, dtype=bool)
+        key, rho = key[last], rho[last]
+        per_group = np.bincount(key >> precision, minlength=n_groups)
+        offsets = np.concatenate([[0], np.cumsum(per_group)]).astype(np.int64)
+        return cls(offsets, (key & ((1 << precision) - 1)).astype(np.uint16), rho, precision)
+
+    def take(self, groups: np.ndarray) -> "HyperLogLogSet":
+        """Sketch của các nhóm `groups` (theo đúng thứ tự đó)."""
+        lengths = np.diff(self.offsets)[groups]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        idx = np.repeat(self.offsets[groups] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return HyperLogLogSet(offsets, self.index[idx], self.rho[idx], self.precision)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"offsets": self.offsets, "index": self.index, "rho": self.rho, "precision": np.asarray(self.precision)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "HyperLogLogSet":
+        return cls(
+            np.asarray(arrays["offsets"]), np.asarray(arrays["index"]), np.asarray(arrays["rho"]), int(arrays["precision"])
+        )
+
+    def estimate(self, target: np.ndarray, n_targets: int) -> np.ndarray:
+        """
+        Gộp sketch theo `target` (nhóm g -> nhóm đích target[g], -1 = bỏ) rồi ước lượng số giá trị
+        khác nhau của từng nhóm đích (HyperLogLog, hiệu chỉnh linear counting khi nhỏ).
+        """
+        m = 1 << self.precision
+        r_target = np.repeat(target, np.diff(self.offsets))
+        keep = r_target >= 0
+        key = r_target[keep].astype(np.int64) * m + self.index[keep]
+        rho = self.rho[keep]
+        order = np.lexsort((rho, key))
+        key, rho = key[order], rho[order]
+        last = np.r_[key[1:] != key[:-1], True] if len(key) else np.empty(0, dtype=bool)
+        key, rho = key[last], rho[last]
+
+        g = key // m
+        nonzero = np.bincount(g, minlength=n_targets)
+        harmonic = np.bincount(g, weights=np.ldexp(1.0, -rho.astype(np.int64)), minlength=n_targets) + (m - nonzero)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / harmonic
+        zeros = m - nonzero
+        with np.errstate(divide="ignore"):
+            linear = m * np.log(m / np.maximum(zeros, 1))
+        return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
@@ -4,20 +4,21 @@ from modules.data_loader import get_data_engine
 from typing import List, Dict, Any, Optional, Tuple
 from modules.analytics_core import (
     fe_describe_price, fe_sold_distribution, fe_rating_distribution,
-    fe_top_brands, fe_seller_diversity_index, fe_price_range_by_category,
-    fe_roi_table_for_A, fe_category_count_plot, fe_top_sellers, fe_brand_share_chart,
-    search_products_hybrid
+    fe_top_brands, fe_category_count_plot, fe_top_sellers, fe_brand_share_chart,
+    search_products_hybrid, AnalysisContext, catalog_vocab
 )
 
 # --- HELPER: Tự động convert kết quả sang JSON ---
+def _to_builtin(o):
+    # Chỉ gọi với giá trị json không tự serialize được: NumPy scalar / array còn sót, Timestamp...
+    # (record của analytics_core đã là kiểu Python gốc nên đường thường không đi qua hàm này)
+    if hasattr(o, 'item') and getattr(o, 'ndim', 0) == 0: return o.item() # Numpy scalar
+    if hasattr(o, 'tolist'): return o.tolist() # Numpy array
+    return str(o)
+
 def to_json(result_dict):
-    # Hàm này giúp xử lý các object NumPy (int64, float32) thành chuẩn Python để JSON không lỗi
-    def convert(o):
-        if isinstance(o, (int, float)): return o
-        if hasattr(o, 'item'): return o.item() # Numpy scalar
-        if hasattr(o, 'tolist'): return o.tolist() # Numpy array
-        return str(o)
-    return json.dumps(result_dict, default=convert, ensure_ascii=False)
+    # Kết quả là cây dict / list mới tạo, không có tham chiếu vòng -> bỏ bước kiểm tra vòng
+    return json.dumps(result_dict, default=_to_builtin, ensure_ascii=False, check_circular=False)
 
 # --- 2. HELPER: LẤY DANH MỤC HỢP LỆ ĐỂ DẠY AI ---
 def get_valid_categories_string():
@@ -26,7 +27,7 @@ def get_valid_categories_string():
         df = get_data_engine()
         if df is not None and not df.empty:
             # Lấy các category duy nhất, loại bỏ None/NaN
-            cats = sorted(df["super_category"].dropna().astype(str).unique().tolist())
+            cats, _ = catalog_vocab(df)
             # Ghép thành chuỗi: "Điện thoại, Máy tính bảng, Phụ kiện..."
             return ", ".join([f"'{c}'" for c in cats])
     except Exception:
@@ -100,10 +101,12 @@ def get_sales_stats(
 
     # Đóng gói hint
     hint = {"category": category} if category else None
+    # Search 1 lần, dùng chung cho mọi hàm bên dưới
+    ctx = AnalysisContext(df, A=product_name, platforms=target_platforms, min_reviews=min_reviews, hint=hint)
     # 1. Lấy Top Seller (Giữ nguyên)
     top_sellers = fe_top_sellers(
         df, A=product_name, platforms=target_platforms, 
-        by="sold", top_k=top_k, min_reviews=min_reviews, hint=hint
+        by="sold", top_k=top_k, min_reviews=min_reviews, hint=hint, context=ctx
     )
     
     # 2. [MỚI] Lấy danh sách 20 sản phẩm liên quan nhất để vẽ Scatter Plot
@@ -113,7 +116,8 @@ def get_sales_stats(
         platforms=target_platforms, 
         min_reviews=min_reviews,
         max_rows=20, # Lấy mẫu sản phẩm để vẽ biểu đồ 
-        hint=hint
+        hint=hint,
+        context=ctx
     )
 
     return to_json({
@@ -199,6 +203,8 @@ def get_top_brands_analysis(
         
     # Đóng gói hint
     hint = {"category": category} if category else None
+    # Search 1 lần, dùng chung cho cả 2 hàm bên dưới
+    ctx = AnalysisContext(df, A=product_name, platforms=target_platforms, min_reviews=min_reviews, hint=hint)
 
     # 1. Top Brands (List/Bar Chart)
     # rank_by mapping vào tham số 'by' của hàm core
@@ -209,7 +215,8 @@ def get_top_brands_analysis(
         by=rank_by, # <--- Tham số dynamic ("revenue_est" hoặc "sold")
         top_k=top_k,
         min_reviews=min_reviews, 
-        hint=hint
+        hint=hint,
+        context=ctx
     )
     
     # 2. Brand Share (Pie Chart)
@@ -220,7 +227,8 @@ def get_top_brands_analysis(
         platforms=target_platforms, 
         metric=share_metric, # <--- Tham số dynamic ("revenue_est" hoặc "sku")
         min_reviews=min_reviews, 
-        hint=hint
+        hint=hint,
+        context=ctx
     )
     
     return to_json({
@@ -265,45 +273,18 @@ def get_advanced_market_analysis(
 
     # Đóng gói hint
     hint = {"category": category} if category else None
+    # Search 1 lần, 4 hàm bên dưới dùng chung tập hit
+    ctx = AnalysisContext(df, A=product_name, platforms=target_platforms, min_reviews=min_reviews, hint=hint)
 
-    # 1. Top Brands (Cần thiết cho Tab 1 của Dashboard Advanced)
-    top_brands = fe_top_brands(
-        df, 
-        A=product_name, 
-        platforms=target_platforms, 
-        by="revenue_est", 
-        min_reviews=min_reviews,
-        hint=hint
-    )
-
-    # 2. Seller Diversity (Độ đa dạng danh mục của Shop)
-    seller_div = fe_seller_diversity_index(
-        df, 
-        A=product_name, 
-        platforms=target_platforms, 
-        min_products=min_products_div, 
-        min_reviews=min_reviews,
-        hint=hint
-    )
-
-    # 3. Price Range (Phân khúc giá Boxplot)
-    price_range = fe_price_range_by_category(
-        df, 
-        A=product_name, 
-        platforms=target_platforms, 
-        min_reviews=min_reviews, 
-        hint=hint
-    )
-
-    # 4. ROI Table (Hiệu suất đầu tư)
-    roi_table = fe_roi_table_for_A(
-        df, 
-        A=product_name, 
-        platforms=target_platforms, 
-        group_by=group_roi_by, 
-        min_reviews=min_reviews, 
-        hint=hint
-    )
+    # 4 chỉ số (Top Brands / Seller Diversity / Price Range / ROI) tính trong 1 lượt trên tập hit
+    stats = ctx.aggregate({
+        "top_brands": {"by": "revenue_est"},                        # Tab 1 của Dashboard Advanced
+        "seller_diversity": {"min_products": min_products_div},     # Độ đa dạng danh mục của Shop
+        "price_range": {},                                          # Phân khúc giá Boxplot
+        "roi": {"group_by": group_roi_by},                          # Hiệu suất đầu tư
+    })
+    top_brands, seller_div = stats["top_brands"], stats["seller_diversity"]
+    price_range, roi_table = stats["price_range"], stats["roi"]
     
     return to_json({
         "type": "advanced_analysis",
@@ -336,34 +317,27 @@ def get_product_analysis(
     target_platforms = platforms if platforms else ["Shopee", "Lazada", "Tiki", "TikTok Shop"]
     # Đóng gói hint
     hint = {"category": category} if category else None
+    # Search 1 lần, dùng chung cho Giá / Doanh số / Đánh giá
+    ctx = AnalysisContext(df, A=product_name, platforms=target_platforms, min_reviews=min_reviews, hint=hint)
 
-    # 1. PRICE (Mặc định bật by_platform=True để so sánh)
-    price = fe_describe_price(
-        df, A=product_name, platforms=target_platforms, 
-        min_reviews=min_reviews, by_platform=True, hint=hint
-    )
-    
-    # 2. SALES (Lấy Raw Items cho Scatter & Top 5 Sellers)
-    # Chúng ta tự động set top_k=5 và max_rows=10 cho báo cáo tổng hợp để không bị quá tải
+    # PRICE (by_platform=True để so sánh) / Top 5 Sellers / REVIEW (group_by_brand=True): tính chung 1 lượt
+    stats = ctx.aggregate({
+        "price_stats": {"by_platform": True},
+        "top_sellers": {"by": "sold", "top_k": 5},
+        "rating_distribution": {"group_by_brand": True},
+    })
+    price, top_sellers, rating = stats["price_stats"], stats["top_sellers"], stats["rating_distribution"]
+
+    # Raw Items cho Scatter (max_rows=10 cho báo cáo tổng hợp để không bị quá tải)
     raw_products = search_products_hybrid(
         df, A=product_name, platforms=target_platforms, 
-        min_reviews=min_reviews, max_rows=10, hint=hint
-    )
-    top_sellers = fe_top_sellers(
-        df, A=product_name, platforms=target_platforms, 
-        by="sold", top_k=5, min_reviews=min_reviews, hint=hint
+        min_reviews=min_reviews, max_rows=10, hint=hint, context=ctx
     )
     sales_stats_data = {
         "raw_items": raw_products.get("data"),
         "top_sellers": top_sellers.get("data")
     }
     
-    # 3. REVIEW (Mặc định bật group_by_brand=True)
-    rating = fe_rating_distribution(
-        df, A=product_name, platforms=target_platforms, 
-        min_reviews=min_reviews, group_by_brand=True, hint=hint
-    )
-    
     return to_json({
         "type": "combined_analysis",
         "product_name": product_name,
@@ -0,0 +1,295 @@
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Trả về vị trí của k phần tử lớn nhất, đã sắp xếp giảm dần.
+    Điểm bằng nhau xếp theo vị trí tăng dần (giống sort ổn định toàn mảng),
+    nên top-k luôn là tiền tố của top-(k + m).
+    """
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= scores.size:
+        return np.argsort(-scores, kind="stable")
+    neg = -scores
+    kth = np.partition(neg, k - 1)[k - 1]
+    above = np.flatnonzero(neg < kth)
+    ties = np.flatnonzero(neg == kth)[:k - len(above)]
+    part = np.sort(np.concatenate([above, ties]))
+    return part[np.argsort(neg[part], kind="stable")]
+
+
+class ExactIndex:
+    """
+    Index "vét cạn": nhân toàn bộ ma trận embedding với vector truy vấn.
+    Dùng làm fallback và làm chuẩn để đo recall của các index xấp xỉ.
+    """
+
+    kind = "exact"
+
+    def __init__(self, emb: np.ndarray):
+        self.emb = emb
+        self.n_rows = int(emb.shape[0])
+
+    def search(self, q_vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.emb @ q_vec
+        top = _top_k(scores, k)
+        return top.astype(np.int64), scores[top]
+
+
+class IVFIndex:
+    """
+    Inverted File Index (IVF) thuần NumPy.
+
+    - Phân cụm embedding bằng spherical k-means thành `n_lists` cụm.
+    - Khi tìm kiếm quét các cụm gần truy vấn nhất cho tới khi đủ
+      `scan_factor * k` row (tối thiểu `nprobe` cụm).
+
+    `nprobe` / `scan_factor` là núm chỉnh recall/latency: tăng -> recall cao hơn, chậm hơn.
+    nprobe = n_lists tương đương tìm kiếm vét cạn.
+    """
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        emb: np.ndarray,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        nprobe: int = 16,
+        scan_factor: float = 4.0,
+    ):
+        self.emb = emb
+        self.n_rows = int(emb.shape[0])
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.nprobe = nprobe
+        self.scan_factor = scan_factor
+
+    @property
+    def n_lists(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def build(
+        cls,
+        emb: np.ndarray,
+        n_lists: Optional[int] = None,
+        nprobe: int = 16,
+        scan_factor: float = 4.0,
+        n_iter: int = 10,
+        sample_size: int = 100_000,
+        chunk_size: int = 65_536,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        n_rows = int(emb.shape[0])
+        if n_lists is None:
+            # Quy tắc kinh nghiệm: ~sqrt(N) cụm
+            n_lists = int(np.clip(np.sqrt(n_rows), 1, 4096))
+        n_lists = max(1, min(n_lists, n_rows))
+
+        rng = np.random.default_rng(seed)
+        sample_idx = rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+        sample = np.asarray(emb[np.sort(sample_idx)], dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Cụm rỗng giữ nguyên centroid cũ
+            sums[empty] = centroids[empty]
+            norms[empty] = 1.0
+            centroids = sums / norms
+
+        # Gán toàn bộ catalogue theo từng chunk để không nhân đôi bộ nhớ
+        assign_full = np.empty(n_rows, dtype=np.int32)
+        for start in range(0, n_rows, chunk_size):
+            block = np.asarray(emb[start:start + chunk_size], dtype=np.float32)
+            assign_full[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+
+        list_rows = np.argsort(assign_full, kind="stable").astype(np.int64)
+        counts = np.bincount(assign_full, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        return cls(
+            emb, centroids.astype(np.float32), list_offsets, list_rows,
+            nprobe=nprobe, scan_factor=scan_factor,
+        )
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_rows=self.list_rows,
+        )
+
+    @classmethod
+    def load(cls, path: str, emb: np.ndarray, **kwargs) -> Optional["IVFIndex"]:
+        """Nạp index đã lưu; trả về None nếu không khớp số row của `emb`."""
+        with np.load(path) as z:
+            centroids, list_offsets, list_rows = z["centroids"], z["list_offsets"], z["list_rows"]
+        if len(list_rows) != len(emb) or centroids.shape[1] != emb.shape[1]:
+            return None
+        return cls(emb, centroids, list_offsets, list_rows, **kwargs)
+
+    def _probe_lists(self, q_vec: np.ndarray, k: int, nprobe: Optional[int]) -> np.ndarray:
+        """Các cụm cần quét: gần truy vấn nhất, đủ để phủ ít nhất scan_factor * k row."""
+        order = np.argsort(-(self.centroids @ q_vec), kind="stable")
+        sizes = np.diff(self.list_offsets)[order]
+        needed = int(np.searchsorted(np.cumsum(sizes), self.scan_factor * k)) + 1
+        n = max(nprobe or self.nprobe, needed)
+        return order[:min(n, self.n_lists)]
+
+    def search(
+        self,
+        q_vec: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        probe = self._probe_lists(q_vec, k, nprobe)
+        rows = np.concatenate(
+            [self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe]
+        )
+        if rows.size == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        rows.sort()
+        scores = np.asarray(self.emb[rows], dtype=np.float32) @ q_vec
+        top = _top_k(scores, k)
+        return rows[top], scores[top]
+
+
+class HNSWIndex:
+    """
+    Wrapper cho hnswlib (tùy chọn, cần `pip install hnswlib`).
+    `ef` là núm chỉnh recall/latency, được đặt MỘT lần lúc dựng/nạp index
+    (không đổi theo từng truy vấn vì index dùng chung giữa các session).
+    hnswlib tự dùng max(ef, k) nên ef chỉ cần >= k thường gặp.
+    """
+
+    kind = "hnsw"
+
+    def __init__(self, index, n_rows: int, ef: int = 128):
+        self.index = index
+        self.n_rows = n_rows
+        self.ef = ef
+        self.index.set_ef(ef)
+
+    @classmethod
+    def build(
+        cls,
+        emb: np.ndarray,
+        M: int = 16,
+        ef_construction: int = 200,
+        ef: int = 128,
+        chunk_size: int = 65_536,
+    ) -> "HNSWIndex":
+        import hnswlib
+
+        n_rows, dim = emb.shape
+        index = hnswlib.Index(space="ip", dim=int(dim))
+        index.init_index(max_elements=int(n_rows), M=M, ef_construction=ef_construction)
+        for start in range(0, n_rows, chunk_size):
+            block = np.asarray(emb[start:start + chunk_size], dtype=np.float32)
+            index.add_items(block, np.arange(start, start + len(block)))
+        return cls(index, int(n_rows), ef=ef)
+
+    def save(self, path: str) -> None:
+        self.index.save_index(path)
+
+    @classmethod
+    def load(cls, path: str, emb: np.ndarray, ef: int = 128) -> Optional["HNSWIndex"]:
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=int(emb.shape[1]))
+        index.load_index(path, max_elements=int(emb.shape[0]))
+        if index.get_current_count() != len(emb):
+            return None
+        return cls(index, int(emb.shape[0]), ef=ef)
+
+    def search(self, q_vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.n_rows)
+        labels, distances = self.index.knn_query(q_vec.astype(np.float32), k=k)
+        # Với space="ip", distance = 1 - inner product
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+
+def _has_hnswlib() -> bool:
+    try:
+        import hnswlib  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_vector_index(emb: np.ndarray, kind: str = "ivf", **kwargs):
+    """
+    Tạo ANN index từ ma trận embedding (đã chuẩn hóa L2).
+    kind: "ivf" (mặc định, thuần NumPy), "hnsw" (cần hnswlib) hoặc "exact".
+    Nếu không có hnswlib sẽ tự lùi về IVF.
+    """
+    if kind == "exact":
+        return ExactIndex(emb)
+    if kind == "hnsw":
+        try:
+            return HNSWIndex.build(emb, **kwargs)
+        except ImportError:
+            print("⚠️ Chưa cài hnswlib, dùng IVF thay thế.")
+            kwargs = {}
+    return IVFIndex.build(emb, **kwargs)
+
+
+def index_path(emb_path: str, kind: str) -> str:
+    """File lưu ANN index nằm cạnh file embedding, VD: product_name_embeddings.ivf.npz"""
+    base, _ = os.path.splitext(emb_path)
+    return f"{base}.{kind}.npz" if kind == "ivf" else f"{base}.{kind}.bin"
+
+
+def load_or_build_vector_index(emb: np.ndarray, emb_path: str, kind: str = "ivf", **kwargs):
+    """
+    Nạp ANN index đã lưu nếu file index mới hơn file embedding và khớp kích thước,
+    ngược lại dựng mới rồi lưu lại để lần khởi động sau không phải dựng lại.
+    `kwargs` là tham số truy vấn (nprobe/scan_factor cho IVF, ef cho HNSW).
+    """
+    if kind == "exact":
+        return ExactIndex(emb)
+    if kind == "hnsw" and not _has_hnswlib():
+        # Chọn IVF trước khi tính đường dẫn -> IVF thay thế cũng được nạp lại từ file .ivf.npz
+        print("⚠️ Chưa cài hnswlib, dùng IVF thay thế.")
+        kind, kwargs = "ivf", {}
+
+    path = index_path(emb_path, kind)
+    cls = HNSWIndex if kind == "hnsw" else IVFIndex
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(emb_path):
+        try:
+            index = cls.load(path, emb, **kwargs)
+            if index is not None:
+                return index
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            print(f"⚠️ Không nạp được ANN index {path}: {e}")
+
+    index = build_vector_index(emb, kind=kind, **kwargs)
+    try:
+        index.save(index_path(emb_path, index.kind))
+    except OSError as e:
+        print(f"⚠️ Không lưu được ANN index: {e}")
+    return index
+
+
+def measure_recall(index, emb: np.ndarray, queries: np.ndarray, k: int = 50) -> float:
+    """Recall@k trung bình của `index` so với tìm kiếm vét cạn trên cùng bộ truy vấn."""
+    exact = ExactIndex(emb)
+    hits = 0
+    for q in queries:
+        truth, _ = exact.search(q, k)
+        approx, _ = index.search(q, k)
+        hits += len(np.intersect1d(truth, approx))
+    return hits / float(k * len(queries)) if len(queries) else 1.0
@@ -0,0 +1,77 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+DIM = 32
+
+WORDS = [
+    "tai", "nghe", "bluetooth", "iphone", "15", "pro", "max", "samsung", "galaxy",
+    "op", "lung", "sac", "cap", "loa", "mini", "sony", "jbl", "xiaomi", "note", "gaming",
+]
+
+
+def fake_embed(texts) -> np.ndarray:
+    """Embedding giả lập: tổng vector ngẫu nhiên (seed theo token), chuẩn hóa L2."""
+    out = np.zeros((len(texts), DIM), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for tok in str(text).lower().split():
+            out[i] += np.random.default_rng(zlib.crc32(tok.encode())).standard_normal(DIM)
+        out[i] += 0.5
+        out[i] /= np.linalg.norm(out[i])
+    return out
+
+
+class FakeEncoder:
+    """Encoder giả lập theo interface QueryEncoder; ghi lại các batch đã encode."""
+
+    def __init__(self, fn=fake_embed):
+        self.fn = fn
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return self.fn(texts)
+
+
+def make_catalog(n: int = 3000, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "product_name": [" ".join(rng.choice(WORDS, rng.integers(2, 7))) for _ in range(n)],
+            "platform": rng.choice(["Shopee", "Lazada", "Tiki", "TikTok Shop"], n),
+            "super_category": rng.choice(["Audio Devices", "Phones & Accessories", "Accessories"], n),
+            "categories": rng.choice(["Headphones", "Speakers", "Mobile Phones", "Phone Cases"], n),
+            "brand": rng.choice(["Apple", "Samsung", "Sony", "JBL", "No Brand", ""], n),
+            "price": np.round(rng.lognormal(12, 1, n)),
+            "sold": rng.integers(0, 5000, n).astype(float),
+            "rating": np.where(rng.random(n) < 0.1, np.nan, np.round(rng.uniform(1, 5, n), 1)),
+            "review_count": rng.integers(0, 300, n),
+            "seller_name": [f"shop{x}" for x in rng.integers(0, n // 15, n)],
+            "sku": [f"sku{x}" for x in rng.integers(0, n, n)],
+            "url": [f"http://x/{i}" for i in range(n)],
+        }
+    )
+
+
+@pytest.fixture
+def core(monkeypatch):
+    """analytics_core với encoder giả lập; trạng thái toàn cục được khôi phục sau test."""
+    ac = pytest.importorskip("modules.analytics_core")
+    for name in list(vars(ac)):
+        if name.startswith("_") and name.isupper():
+            monkeypatch.setattr(ac, name, getattr(ac, name))
+    ac._ENCODER = FakeEncoder()
+    ac.clear_query_cache()
+    yield ac
+    ac.clear_query_cache()
+
+
+@pytest.fixture
+def catalog(core):
+    df = make_catalog()
+    core.set_product_embeddings(fake_embed(df["product_name"].tolist()))
+    core.set_token_index(core.build_token_index(df))
+    core.set_filter_index(core.build_filter_index(df))
+    return df
@@ -0,0 +1,226 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.aggregation import HitAggregator, SortedGroups
+from tests.conftest import make_catalog
+
+
+COLUMNS = {
+    "platform": "platform", "brand": "brand", "seller_name": "seller_name", "category": "categories",
+    "categories": "categories", "price": "price", "sold": "sold", "rating": "rating",
+}
+
+
+@pytest.fixture
+def hits():
+    # Key NaN, giá trị bằng nhau (tie khi xếp hạng) và giá không hợp lệ
+    df = make_catalog(800, seed=3)
+    df.loc[df.index % 17 == 0, "brand"] = np.nan
+    df.loc[df.index % 23 == 0, "seller_name"] = np.nan
+    df.loc[df.index % 29 == 0, "platform"] = np.nan
+    df.loc[df.index % 7 == 0, "sold"] = 100.0
+    df.loc[df.index % 31 == 0, "price"] = 0.0
+    df["price"] = df["price"].astype(object)
+    df.loc[df.index % 37 == 0, "price"] = "n/a"
+    return df
+
+
+def _top_by_platform(df, key, values, top_k):
+    # Cách tính cũ: groupby(dropna=False).sum() rồi sort_values trong từng platform
+    grouped = df.assign(v=values).groupby(["platform", key], dropna=False)["v"].sum().reset_index()
+    out = []
+    for platform, g in grouped.groupby("platform"):
+        g = g.sort_values("v", ascending=False).head(top_k)
+        out += [
+            {"rank": r, key: row[key], "platform": platform, "value": float(row["v"])}
+            for r, (_, row) in enumerate(g.iterrows(), start=1)
+        ]
+    return out
+
+
+def _dump(records):
+    return json.dumps(records, sort_keys=True, default=str)
+
+
+@pytest.mark.parametrize("by,top_k", [("revenue_est", 5), ("sold", 3)])
+def test_top_brands_matches_pandas(hits, by, top_k):
+    price = pd.to_numeric(hits["price"], errors="coerce").fillna(0)
+    sold = pd.to_numeric(hits["sold"], errors="coerce").fillna(0)
+    values = sold if by == "sold" else price * sold
+    result = HitAggregator(hits, COLUMNS).compute("top_brands", by=by, top_k=top_k)
+    # Coverage: số seller khác nhau của từng (platform, brand)
+    sellers = hits.groupby(["platform", "brand"], dropna=False)["seller_name"].nunique()
+    expected = [
+        {**r, "distinct_sellers": int(sellers.loc[(r["platform"], r["brand"])])}
+        for r in _top_by_platform(hits, "brand", values, top_k)
+    ]
+    assert _dump(result.data) == _dump(expected)
+
+
+def test_seller_diversity_matches_pandas(hits):
+    expected = []
+    for (platform, seller), g in hits.groupby(["platform", "seller_name"], dropna=False):
+        if len(g) < 2:
+            continue
+        p = g["categories"].astype(str).value_counts().values / len(g)
+        expected.append((seller, platform, len(g), len(p), float(-(p * np.log(p + 1e-12)).sum())))
+
+    data = HitAggregator(hits, COLUMNS).compute("seller_diversity", min_products=2).data
+    actual = [
+        (r["seller_name"], r["platform"], r["product_count"], r["unique_categories"], r["diversity_index"])
+        for r in data
+    ]
+    assert _dump([a[:4] for a in actual]) == _dump([e[:4] for e in expected])
+    np.testing.assert_allclose([a[4] for a in actual], [e[4] for e in expected], rtol=1e-12, atol=1e-12)
+
+
+def test_roi_and_price_range_match_pandas(hits):
+    agg = HitAggregator(hits, COLUMNS)
+    price = pd.to_numeric(hits["price"], errors="coerce")
+    roi = (pd.to_numeric(hits["sold"], errors="coerce") / price.replace(0, np.nan)).replace([np.inf, -np.inf], np.nan)
+    expected = roi.groupby(hits["brand"], dropna=False).agg(["mean", "median", "count"]).dropna(subset=["mean"])
+
+    data = agg.compute("roi", group_by="brand").data
+    assert [r["count"] for r in data] == expected["count"].tolist()
+    np.testing.assert_allclose([r["roi_median"] for r in data], expected["median"], rtol=1e-12)
+    np.testing.assert_allclose([r["roi_mean"] for r in data], expected["mean"], rtol=1e-9)
+
+    data = agg.compute("price_range", quantiles=(0.1, 0.9)).data
+    valid = hits.assign(p=price)[price.notna()]
+    for rec in data:
+        g = valid[(valid["platform"] == rec["platform"]) & (valid["categories"] == rec["categories"])]["p"]
+        assert rec["count"] == len(g)
+        assert (rec["q_low"], rec["median_price"], rec["q_high"]) == tuple(np.quantile(g, [0.1, 0.5, 0.9]))
+
+
+@pytest.mark.parametrize("top_k", [None, 2])
+def test_category_count_matches_value_counts(hits, top_k):
+    data = HitAggregator(hits, {**COLUMNS, "sku": "sku"}).compute("category_count", top_k=top_k).data
+    expected = hits["categories"].astype(str).value_counts().head(top_k)
+    assert [(r["product_count"], r["count"]) for r in data] == list(expected.items())
+    # Số seller / SKU khác nhau (bỏ NaN) của đúng từng danh mục
+    coverage = hits.groupby("categories")[["seller_name", "sku"]].nunique()
+    for r in data:
+        assert (r["distinct_sellers"], r["distinct_skus"]) == tuple(coverage.loc[r["product_count"]])
+
+
+def test_empty_and_all_nan_hits(hits):
+    empty = HitAggregator(hits.iloc[:0], COLUMNS)
+    for metric in ("top_brands", "top_sellers", "brand_share", "seller_diversity", "roi", "category_count"):
+        assert empty.compute(metric).data == [] and empty.compute(metric).notes == "; no data"
+
+    no_price = HitAggregator(hits.assign(price=np.nan), COLUMNS)
+    assert no_price.compute("price_range").data == []
+    assert no_price.compute("roi").data == []
+    with pytest.raises(ValueError):
+        no_price.compute("khong_co")
+
+
+def test_groupings_are_shared_between_metrics(hits):
+    agg = HitAggregator(hits, COLUMNS)
+    agg.compute_many({"top_brands": {}, "brand_share": {"metric": "revenue_est"}, "top_sellers": {}, "seller_diversity": {}})
+    assert set(agg._groupings) == {(("platform", "brand"), False), (("platform", "seller_name"), False)}
+
+
+def _strip_ts(result):
+    result["meta"].pop("ts_generated", None)
+    return json.dumps(result, sort_keys=True, default=str)
+
+
+def test_context_aggregate_matches_fe_calls(core, catalog, monkeypatch):
+    kwargs = {"platforms": ["Shopee", "Tiki", "Lazada"], "min_reviews": 10, "hint": None}
+    metrics = {
+        "price_stats": ("fe_describe_price", {"by_platform": True}),
+        "top_sellers": ("fe_top_sellers", {"by": "sold", "top_k": 5}),
+        "rating_distribution": ("fe_rating_distribution", {"group_by_brand": True}),
+        "brand_share": ("fe_brand_share_chart", {"metric": "revenue_est"}),
+        "roi": ("fe_roi_table_for_A", {"group_by": "seller"}),
+    }
+    expected = {m: _strip_ts(getattr(core, fe)(catalog, "tai nghe", **kwargs, **p)) for m, (fe, p) in metrics.items()}
+
+    built = []
+    real = core.HitAggregator
+    monkeypatch.setattr(core, "HitAggregator", lambda *a: built.append(1) or real(*a))
+    ctx = core.AnalysisContext(catalog, "tai nghe", **kwargs)
+    actual = ctx.aggregate({m: p for m, (_, p) in metrics.items()})
+
+    assert list(actual) == list(metrics)
+    assert {m: _strip_ts(r) for m, r in actual.items()} == expected
+    # 1 aggregator cho tập 500 hit (price_stats) + 1 cho tập 2000 hit
+    assert len(built) == 2
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_sorted_groups_match_numpy(seed):
+    rng = np.random.default_rng(seed)
+    group = rng.integers(-1, 40, size=3000)
+    values = np.round(rng.lognormal(8, 2, size=3000), 1)
+    values[rng.random(3000) < 0.05] = np.nan
+    counts = rng.integers(1, 4, size=3000)
+    expanded = (np.repeat(group, counts), np.repeat(values, counts))
+
+    for sg, (g_all, v_all) in [
+        (SortedGroups(group, values, 41), (group, values)),
+        (SortedGroups(group, values, 41, counts), expanded),
+    ]:
+        for g in range(41):
+            v = v_all[(g_all == g) & ~np.isnan(v_all)]
+            if len(v) == 0:
+                assert np.isnan(sg.median()[g])
+                continue
+            assert (sg.min()[g], sg.max()[g], sg.median()[g]) == (v.min(), v.max(), np.median(v))
+            for q in (0.0, 0.1, 0.25, 1 / 3, 0.5, 0.9, 0.99, 1.0):
+                assert sg.quantile(q)[g] == np.quantile(v, q)
+
+
+@pytest.mark.parametrize("by_platform", [True, False])
+def test_price_stats_matches_per_group_numpy(hits, by_platform):
+    price = pd.to_numeric(hits["price"], errors="coerce")
+    data = HitAggregator(hits, COLUMNS).compute("price_stats", by_platform=by_platform).data
+    groups = hits.groupby("platform") if by_platform else [(None, hits)]
+    assert len(data) == len(groups)
+    for rec, (platform, g) in zip(data, groups):
+        p = price[g.index].dropna().to_numpy()
+        assert rec.get("platform") == platform and rec["count"] == len(p)
+        assert (rec["min_price"], rec["q10"], rec["median_price"], rec["q90"], rec["max_price"]) == (
+            p.min(), np.quantile(p, 0.1), np.median(p), np.quantile(p, 0.9), p.max()
+        )
+        np.testing.assert_allclose([rec["mean_price"], rec["std_price"]], [p.mean(), p.std(ddof=1)], rtol=1e-12)
+
+
+def test_records_hold_only_builtin_types(hits):
+    results = HitAggregator(hits, COLUMNS).compute_many(
+        {m: {} for m in ("price_stats", "price_range", "rating_distribution", "sold_distribution",
+                         "top_sellers", "top_brands", "brand_share", "seller_diversity", "roi")}
+    )
+    for metric, result in results.items():
+        assert result.data, metric
+        assert {type(v) for r in result.data for v in r.values()} <= {str, float, int, type(None)}, metric
+    json.dumps([r.data for r in results.values()])
+
+
+def test_top_k_with_many_groups_and_ties():
+    rng = np.random.default_rng(7)
+    n = 50_000
+    df = pd.DataFrame(
+        {
+            "platform": rng.choice(["Shopee", "Lazada", "Tiki", None], n),
+            "seller_name": rng.integers(0, 20_000, n).astype(str),
+            "sold": rng.integers(0, 5, n).astype(float),  # nhiều tổng bằng nhau
+        }
+    )
+    data = HitAggregator(df, COLUMNS).compute("top_sellers", by="sold", top_k=50).data
+
+    # Tham chiếu: sort ổn định giảm dần trong từng platform (giá trị bằng nhau giữ thứ tự seller)
+    grouped = df.groupby(["platform", "seller_name"], dropna=False)["sold"].sum().reset_index()
+    expected = []
+    for platform, g in grouped.groupby("platform"):
+        g = g.sort_values("sold", ascending=False, kind="stable").head(50)
+        expected += [
+            {"rank": r, "seller_name": s, "platform": platform, "value": v}
+            for r, (s, v) in enumerate(zip(g["seller_name"], g["sold"]), start=1)
+        ]
+    assert data == expected
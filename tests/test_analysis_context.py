@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+
+FE_CALLS = [
+    ("fe_describe_price", {}),
+    ("fe_top_sellers", {"by": "sold", "top_k": 5}),
+    ("fe_rating_distribution", {}),
+    ("fe_top_brands", {"by": "revenue_est"}),
+    ("fe_seller_diversity_index", {"min_products": 2}),
+    ("fe_price_range_by_category", {}),
+    ("fe_roi_table_for_A", {"group_by": "platform"}),
+]
+
+
+def _strip_ts(result):
+    # So sánh qua JSON để NaN == NaN
+    result["meta"].pop("ts_generated", None)
+    return json.dumps(result, sort_keys=True, default=str)
+
+
+@pytest.mark.parametrize("query,hint", [("tai nghe", None), ("iphone", {"category": "Phones & Accessories"})])
+def test_context_matches_independent_searches(core, catalog, monkeypatch, query, hint):
+    kwargs = {"platforms": ["Shopee", "Tiki"], "min_reviews": 20, "hint": hint}
+    expected = [_strip_ts(getattr(core, fe)(catalog, query, **kwargs, **extra)) for fe, extra in FE_CALLS]
+    expected_raw = _strip_ts(core.search_products_hybrid(catalog, query, max_rows=10, **kwargs))
+
+    calls = []
+    real = core.hybrid_search
+
+    def counting(*args, **kw):
+        calls.append(kw.get("max_rows"))
+        return real(*args, **kw)
+
+    monkeypatch.setattr(core, "hybrid_search", counting)
+    ctx = core.AnalysisContext(catalog, query, **kwargs)
+    actual = [_strip_ts(getattr(core, fe)(catalog, query, **kwargs, **extra, context=ctx)) for fe, extra in FE_CALLS]
+    actual_raw = _strip_ts(core.search_products_hybrid(catalog, query, max_rows=10, **kwargs, context=ctx))
+
+    assert actual == expected
+    assert actual_raw == expected_raw
+    # Chỉ 1 lượt hybrid_search cho cả tool call
+    assert calls == [6000]
+
+
+def test_context_falls_back_when_filters_differ(core, catalog):
+    ctx = core.AnalysisContext(catalog, "tai nghe", platforms=["Shopee"])
+    with_ctx = _strip_ts(core.fe_price_range_by_category(catalog, "tai nghe", platforms=["Shopee"], brand="Sony", context=ctx))
+    alone = _strip_ts(core.fe_price_range_by_category(catalog, "tai nghe", platforms=["Shopee"], brand="Sony"))
+    assert with_ctx == alone
+    assert ctx._result is None
+
+
+def test_search_result_top_rejects_wider_request(core, catalog):
+    ctx = core.AnalysisContext(catalog, "tai nghe", max_rows=100)
+    ctx.search(50)
+    with pytest.raises(ValueError):
+        ctx._result.top(500)
+    hits, _ = ctx.search(500)  # context tự search lại ở phạm vi rộng hơn
+    assert ctx._result.max_rows == 500
+
+
+def test_search_core_scores_once_and_keeps_meta(core, catalog, monkeypatch):
+    calls = []
+    real = core.hybrid_search
+
+    def counting(*args, **kw):
+        calls.append(kw.get("max_rows"))
+        return real(*args, **kw)
+
+    monkeypatch.setattr(core, "hybrid_search", counting)
+    hint = {"category": "Audio Devices", "brand": "Sony"}
+    _, meta = core._search_df_core(catalog, "tai nghe", ["Audio Devices"], ["Sony"], hint=hint, max_rows=50)
+    assert calls == [150]
+    assert set(meta) == {
+        "product_query", "detected_category", "confidence", "filters", "notes", "ts_generated", "brand_guess",
+    }
+    assert meta["confidence"] == pytest.approx(0.2)
+    assert meta["notes"].startswith(
+        "resolve_product; hybrid_search_hits; category_from_hint=Audio Devices; brand_from_hint=Sony"
+    )
+
+    _, meta = core._search_df_core(catalog, "tai nghe", [], [], hint={"platforms": ["Sendo"]}, max_rows=50)
+    assert meta["confidence"] == pytest.approx(0.1)
+
+    # Gọi resolve_product độc lập vẫn tự search như trước
+    calls.clear()
+    out = core.resolve_product("tai nghe", [], [], catalog)
+    assert calls == [200] and out["meta"]["confidence"] == pytest.approx(0.2)
@@ -0,0 +1,161 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import artifact_bundle as ab
+from modules.embedding_store import EmbeddingStore
+from tests.conftest import fake_embed, make_catalog
+
+
+@pytest.fixture
+def sources(tmp_path):
+    df = make_catalog(500)
+    emb_path = str(tmp_path / "emb.npy")
+    csv_path = str(tmp_path / "data.csv")
+    np.save(emb_path, fake_embed(df["product_name"].tolist()))
+    df.to_csv(csv_path, index=False)
+    return df, csv_path, emb_path, str(tmp_path / "bundles")
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_bundle_round_trip(core, sources, dtype):
+    df, csv_path, emb_path, root = sources
+    emb = EmbeddingStore.open(emb_path, dtype=dtype).select(np.arange(len(df)) % 7 != 3)
+    df = df[np.arange(len(df)) % 7 != 3].reset_index(drop=True)
+    token_index, filter_index = core.build_token_index(df), core.build_filter_index(df)
+    cube = core.build_market_cube(df, seller_diversity=True)
+    cats, brands = core.catalog_vocab(df)
+
+    digest = ab.source_hash([csv_path, emb_path], root, extra={"emb_dtype": dtype})
+    ab.save_bundle(root, digest, df, emb, token_index, filter_index, cube, cats, brands)
+    bundle = ab.load_bundle(root, digest)
+
+    pd.testing.assert_frame_equal(bundle["df"], df)
+    np.testing.assert_array_equal(bundle["emb"][np.arange(len(df))], emb[np.arange(len(df))])
+    assert bundle["emb"].storage_dtype == emb.storage_dtype
+    assert (bundle["catalog_categories"], bundle["brand_list"]) == (cats, brands)
+
+    loaded = bundle["token_index"]
+    assert loaded.tokens == token_index.tokens
+    np.testing.assert_allclose(loaded.bm25(["tai", "nghe"]), token_index.bm25(["tai", "nghe"]))
+    np.testing.assert_array_equal(loaded.substring_rows("ngh"), token_index.substring_rows("ngh"))
+
+    kwargs = {"platforms": ["Tiki", "Shopee"], "category": "headphones", "brand": "so", "min_reviews": 50}
+    np.testing.assert_array_equal(bundle["filter_index"].rows(**kwargs), filter_index.rows(**kwargs))
+
+    loaded_cube = bundle["market_cube"]
+    pd.testing.assert_frame_equal(loaded_cube.cells.astype(object), cube.cells.astype(object))
+    cells = cube.select(["Tiki"], ["headphones"])
+    np.testing.assert_array_equal(loaded_cube.select(["Tiki"], ["headphones"]), cells)
+    for metric in ("price_range", "roi", "rating_distribution", "top_brands", "category_count"):
+        assert loaded_cube.aggregator(cells).compute(metric) == cube.aggregator(cells).compute(metric)
+    assert loaded_cube.seller_diversity.keys() == cube.seller_diversity.keys()
+    cells = cube.select(["Tiki"])
+    assert (
+        loaded_cube.aggregator(cells, platform_only=True).compute("seller_diversity")
+        == cube.aggregator(cells, platform_only=True).compute("seller_diversity")
+    )
+
+
+def test_search_same_with_bundle(core, sources):
+    df, csv_path, emb_path, root = sources
+    emb = EmbeddingStore.open(emb_path, dtype="float32")
+    core.set_product_embeddings(emb)
+    core.set_token_index(core.build_token_index(df))
+    core.set_filter_index(core.build_filter_index(df))
+    expected = core.hybrid_search(df, "tai nghe sony", platforms=["Tiki", "Lazada"], max_rows=20)
+
+    digest = ab.source_hash([csv_path, emb_path], root)
+    ab.save_bundle(
+        root, digest, df, emb, core._TOKEN_INDEX, core._FILTER_INDEX, core.build_market_cube(df), *core.catalog_vocab(df),
+    )
+    bundle = ab.load_bundle(root, digest)
+    core.set_product_embeddings(bundle["emb"])
+    core.set_token_index(bundle["token_index"])
+    core.set_filter_index(bundle["filter_index"])
+    actual = core.hybrid_search(bundle["df"], "tai nghe sony", platforms=["Tiki", "Lazada"], max_rows=20)
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_source_hash_tracks_content(sources, monkeypatch):
+    _, csv_path, emb_path, root = sources
+    h1 = ab.source_hash([csv_path, emb_path], root)
+    assert os.path.exists(os.path.join(root, "source_stamp.json"))
+
+    # Nguồn không đổi: dùng hash đã nhớ, không đọc lại file
+    monkeypatch.setattr(ab, "_file_digest", lambda path, chunk_size=0: pytest.fail("re-hashed"))
+    assert ab.source_hash([csv_path, emb_path], root) == h1
+    assert ab.source_hash([csv_path, emb_path], root, extra={"emb_dtype": "int8"}) != h1
+    monkeypatch.undo()
+
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert ab.source_hash([csv_path, emb_path], root) != h1
+
+
+def test_stale_or_foreign_bundle_is_ignored(core, sources, monkeypatch):
+    df, csv_path, emb_path, root = sources
+    emb = EmbeddingStore.open(emb_path, dtype="float32")
+    digest = ab.source_hash([csv_path, emb_path], root)
+    indexes = (core.build_token_index(df), core.build_filter_index(df), core.build_market_cube(df))
+    ab.save_bundle(root, "old", df, emb, *indexes, [], [])
+    ab.save_bundle(root, digest, df, emb, *indexes, [], [])
+
+    assert not os.path.exists(ab.bundle_dir(root, "old"))
+    assert ab.load_bundle(root, "missing") is None
+    assert ab.load_bundle(root, digest) is not None
+    monkeypatch.setattr(ab, "BUNDLE_VERSION", ab.BUNDLE_VERSION + 1)
+    assert ab.load_bundle(root, digest) is None
+
+
+def test_save_keeps_other_processes_temp_dirs(core, sources):
+    df, csv_path, emb_path, root = sources
+    emb = EmbeddingStore.open(emb_path, dtype="float32")
+    indexes = (core.build_token_index(df), core.build_filter_index(df), core.build_market_cube(df))
+    ab.save_bundle(root, "old", df, emb, *indexes, [], [])
+    # Bundle đang được tiến trình khác ghi / thư mục lạ không có manifest: không xóa
+    in_flight, foreign = os.path.join(root, "new.tmp-999999"), os.path.join(root, "notes")
+    stale = os.path.join(root, "older.tmp-999998")
+    for path in (in_flight, foreign, stale):
+        os.makedirs(path)
+    os.utime(stale, (0, 0))
+
+    path = ab.save_bundle(root, "new", df, emb, *indexes, [], [])
+    assert sorted(os.listdir(root)) == ["new", "new.tmp-999999", "notes"]
+
+    # Tiến trình khác đã ghi xong bundle cùng hash -> giữ nguyên bundle đó
+    stamp = os.path.getmtime(os.path.join(path, "manifest.json"))
+    ab.save_bundle(root, "new", df, emb, *indexes, [], [])
+    assert os.path.getmtime(os.path.join(path, "manifest.json")) == stamp
+    ab.save_bundle(root, "new", df, emb, *indexes, [], [], overwrite=True)
+    assert os.path.getmtime(os.path.join(path, "manifest.json")) != stamp
+
+
+@pytest.mark.parametrize("damage", ["garbage", "missing"])
+def test_corrupt_bundle_is_rebuilt(core, sources, monkeypatch, damage):
+    from modules import data_loader
+
+    df, csv_path, emb_path, root = sources
+    monkeypatch.setattr(data_loader, "DATA_CSV", csv_path)
+    monkeypatch.setattr(data_loader, "EMB_NPY", emb_path)
+    monkeypatch.setattr(data_loader, "BUNDLE_ROOT", root)
+    monkeypatch.setattr(data_loader, "_CACHED_DF", None)
+    assert len(data_loader.get_data_engine()) == len(df)
+
+    digest = data_loader._source_hash()
+    part = "token_index" if damage == "garbage" else "market_cube"
+    target = os.path.join(ab.bundle_dir(root, digest), part, "000.npy")
+    if damage == "garbage":
+        with open(target, "wb") as f:
+            f.write(os.urandom(256))
+    else:
+        os.remove(target)
+    assert ab.load_bundle(root, digest) is None
+
+    # Khởi động lại: dựng lại từ CSV (không trả DF rỗng) và ghi đè bundle hỏng
+    monkeypatch.setattr(data_loader, "_CACHED_DF", None)
+    assert len(data_loader.get_data_engine()) == len(df)
+    assert ab.load_bundle(root, digest) is not None
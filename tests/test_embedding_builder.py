@@ -0,0 +1,94 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import embedding_builder as eb
+from tests.conftest import FakeEncoder, fake_embed, make_catalog
+
+
+ENCODED = []
+
+
+class CountingEncoder(FakeEncoder):
+    """FakeEncoder ghi lại mọi text đã encode (chỉ đúng khi chạy workers=0)."""
+
+    def encode(self, texts):
+        ENCODED.extend(texts)
+        return super().encode(texts)
+
+
+class CrashingEncoder(CountingEncoder):
+    limit = 0
+
+    def encode(self, texts):
+        if len(ENCODED) >= self.limit:
+            raise RuntimeError("bị ngắt")
+        return super().encode(texts)
+
+
+@pytest.fixture
+def csv(tmp_path):
+    ENCODED.clear()
+    df = make_catalog(400)
+    path = str(tmp_path / "data.csv")
+    df.to_csv(path, index=False)
+    return df, path, str(tmp_path / "emb.npy")
+
+
+def _expected(names):
+    return fake_embed(list(names))
+
+
+def test_build_then_incremental_refresh(csv):
+    df, csv_path, out = csv
+    stats = eb.build_embeddings(csv_path, out, workers=0, chunk_rows=64, batch_size=16, encoder_factory=CountingEncoder)
+
+    np.testing.assert_allclose(np.load(out), _expected(df["product_name"]), atol=1e-6)
+    unique = df["product_name"].nunique()
+    assert stats["encoded"] == unique == len(ENCODED) == len(set(ENCODED))
+    assert not os.path.exists(out + ".work")
+
+    df.loc[[3, 50, 51], "product_name"] = ["tai nghe moi 1", "loa moi 2", "tai nghe moi 1"]
+    df = pd.concat([df, df.head(5)], ignore_index=True)
+    df.to_csv(csv_path, index=False)
+    ENCODED.clear()
+    stats = eb.build_embeddings(csv_path, out, workers=0, chunk_rows=64, encoder_factory=CountingEncoder)
+
+    assert sorted(ENCODED) == ["loa moi 2", "tai nghe moi 1"]
+    assert stats["reused"] == len(df) - 4  # row 3 xuất hiện 2 lần
+    np.testing.assert_allclose(np.load(out), _expected(df["product_name"]), atol=1e-6)
+
+
+def test_resume_after_interruption(csv):
+    df, csv_path, out = csv
+    CrashingEncoder.limit = 150
+    with pytest.raises(RuntimeError):
+        eb.build_embeddings(csv_path, out, workers=0, chunk_rows=50, batch_size=50, encoder_factory=CrashingEncoder)
+    assert not os.path.exists(out)
+    done = len(ENCODED)
+
+    ENCODED.clear()
+    CrashingEncoder.limit = 10**9
+    stats = eb.build_embeddings(csv_path, out, workers=0, chunk_rows=50, batch_size=50, encoder_factory=CrashingEncoder)
+
+    assert stats["chunks_resumed"] == done // 50 > 0
+    assert len(ENCODED) == stats["encoded"] - done
+    np.testing.assert_allclose(np.load(out), _expected(df["product_name"]), atol=1e-6)
+
+
+def test_process_pool_matches_in_process(csv):
+    df, csv_path, out = csv
+    eb.build_embeddings(csv_path, out, workers=2, chunk_rows=40, encoder_factory=FakeEncoder)
+    np.testing.assert_allclose(np.load(out), _expected(df["product_name"]), atol=1e-6)
+    with open(out[:-4] + ".build.json", encoding="utf-8") as f:
+        assert json.load(f)["rows"] == len(df)
+
+
+def test_changed_encoder_rebuilds_everything(csv):
+    df, csv_path, out = csv
+    eb.build_embeddings(csv_path, out, workers=0, encoder_factory=FakeEncoder)
+    stats = eb.build_embeddings(csv_path, out, workers=0, encoder_factory=CountingEncoder)
+    assert stats["reused"] == 0 and len(ENCODED) == df["product_name"].nunique()
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from modules.embedding_store import EmbeddingStore, quantization_recall
+
+
+def _random_emb(n: int, dim: int = 64, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    emb = rng.standard_normal((n, dim)).astype(np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def emb_file(tmp_path):
+    emb = _random_emb(3000)
+    path = str(tmp_path / "emb.npy")
+    np.save(path, emb)
+    return emb, path
+
+
+@pytest.mark.parametrize("dtype, tol, min_recall", [
+    ("float32", 0.0, 1.0),
+    ("float16", 1e-3, 0.98),
+    ("int8", 2e-2, 0.9),
+])
+def test_quantized_store_scores_close_to_float32(emb_file, dtype, tol, min_recall):
+    emb, path = emb_file
+    store = EmbeddingStore.open(path, dtype=dtype)
+    assert isinstance(store.vectors, np.memmap)
+    assert store.shape == emb.shape and len(store) == len(emb)
+
+    queries = _random_emb(20, seed=1)
+    q = queries[0]
+    np.testing.assert_allclose(store @ q, emb @ q, atol=tol + 1e-6)
+    rows = np.array([5, 17, 2999])
+    np.testing.assert_allclose(store[rows], emb[rows], atol=tol + 1e-6)
+    assert quantization_recall(emb, store, queries, k=50) >= min_recall
+
+
+def test_select_maps_rows_without_copy(emb_file):
+    emb, path = emb_file
+    store = EmbeddingStore.open(path, dtype="float16")
+    mask = np.ones(len(emb), dtype=bool)
+    mask[[0, 10, 20]] = False
+
+    sub = store.select(mask)
+    assert sub.vectors is store.vectors
+    assert len(sub) == len(emb) - 3
+    q = _random_emb(1, seed=2)[0]
+    np.testing.assert_allclose(sub @ q, emb[mask] @ q, atol=1e-3)
+    np.testing.assert_allclose(sub[np.array([0, 9])], emb[mask][[0, 9]], atol=1e-3)
+    assert store.select(np.ones(len(emb), dtype=bool)).rows is None
+
+
+def test_quantized_file_rebuilt_when_source_changes(emb_file):
+    emb, path = emb_file
+    EmbeddingStore.open(path, dtype="int8")
+    vec_path, scale_path = EmbeddingStore.quantized_paths(path, "int8")
+    assert os.path.exists(vec_path) and os.path.exists(scale_path)
+
+    new_emb = _random_emb(100, seed=3)
+    np.save(path, new_emb)
+    later = os.path.getmtime(vec_path) + 10
+    os.utime(path, (later, later))
+    store = EmbeddingStore.open(path, dtype="int8")
+    assert len(store) == 100
+    np.testing.assert_allclose(store[np.arange(3)], new_emb[:3], atol=2e-2)
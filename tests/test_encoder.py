@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from modules.encoder import SentenceTransformerEncoder, make_encoder
+from tests.conftest import FakeEncoder
+
+
+def test_importing_analytics_does_not_load_model():
+    code = (
+        "import sys, modules.analytics_core as ac; "
+        "assert ac._ENCODER is None; "
+        "assert 'sentence_transformers' not in sys.modules and 'torch' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_make_encoder_falls_back_without_onnx_model(tmp_path, monkeypatch):
+    monkeypatch.delenv("EMBEDDING_BACKEND", raising=False)
+    assert isinstance(make_encoder(), SentenceTransformerEncoder)
+    enc = make_encoder(backend="onnx", model_dir=str(tmp_path))
+    assert isinstance(enc, SentenceTransformerEncoder)
+    assert enc._model is None  # chưa nạp model cho tới lần encode đầu
+
+
+def test_encoder_created_lazily_and_swappable(core, monkeypatch):
+    created = []
+    monkeypatch.setattr(core, "_ENCODER", None)
+    monkeypatch.setattr(core, "make_encoder", lambda: created.append(1) or FakeEncoder())
+    core.encode_query("tai nghe")
+    core.encode_query("loa")
+    assert created == [1]
+
+    other = FakeEncoder(lambda texts: np.ones((len(texts), 32), dtype=np.float32))
+    core.set_encoder(other)
+    assert core.encode_query("tai nghe")[0] == 1.0  # cache cũ đã bị xóa khi đổi encoder
+    assert other.calls == [["tai nghe"]]
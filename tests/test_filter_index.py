@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.filter_index import FilterIndex
+from tests.conftest import make_catalog
+
+
+COLS = ["platform", "super_category", "categories", "brand"]
+
+
+def _pandas_rows(df, platforms=None, category=None, brand=None, min_reviews=0):
+    mask = pd.Series(True, index=df.index)
+    if category:
+        mask &= df["super_category"].astype(str).str.lower().eq(category) | df["categories"].astype(
+            str
+        ).str.lower().str.contains(category)
+    if platforms:
+        mask &= df["platform"].isin(platforms)
+    if min_reviews > 0:
+        mask &= pd.to_numeric(df["review_count"], errors="coerce").fillna(0) >= min_reviews
+    if brand:
+        mask &= df["brand"].astype(str).str.lower().str.contains(brand)
+    return np.flatnonzero(mask.to_numpy())
+
+
+@pytest.fixture(scope="module")
+def df():
+    return make_catalog(5000, seed=3)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"platforms": ["Tiki"]},
+    {"platforms": ["Shopee", "Lazada", "Tiki", "TikTok Shop"], "category": "audio devices"},
+    {"category": "phone", "brand": "sony"},
+    {"category": "headphones", "min_reviews": 250},
+    {"brand": "no brand", "min_reviews": 1, "platforms": ["Lazada"]},
+    {"category": "khong co"},
+    {"brand": "a", "category": "accessories", "platforms": ["Tiki", "Shopee"], "min_reviews": 100},
+])
+def test_filter_index_matches_pandas(df, kwargs):
+    index = FilterIndex.build(df, COLS, review_col="review_count")
+    rows = index.rows(**kwargs)
+    assert rows.tolist() == _pandas_rows(df, **kwargs).tolist()
+    assert not rows.flags.writeable
+
+
+def test_filter_index_caches_combinations(df):
+    index = FilterIndex.build(df, COLS, review_col="review_count")
+    assert index.rows() is None
+    first = index.rows(platforms=["Tiki", "Shopee"], category="audio devices")
+    assert index.rows(platforms=["Shopee", "Tiki"], category="audio devices") is first
+
+
+def test_hybrid_search_same_with_and_without_filter_index(core, catalog):
+    kwargs = {"detected_category": "Audio Devices", "platforms": ["Tiki", "Shopee"], "brand": "Sony", "min_reviews": 50}
+    core.set_filter_index(core.build_filter_index(catalog))
+    indexed = core.hybrid_search(catalog, "tai nghe", max_rows=100, **kwargs)
+    core.set_filter_index(None)
+    scanned = core.hybrid_search(catalog, "tai nghe", max_rows=100, **kwargs)
+    assert indexed.index.tolist() == scanned.index.tolist()
+    assert len(indexed) > 0
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from tests.conftest import FakeEncoder, fake_embed
+
+
+def test_vector_scores_gather_only_filtered_rows(core, catalog, monkeypatch):
+    q_vec = fake_embed(["tai nghe"])[0]
+    full = core._PRODUCT_EMB @ q_vec
+    rows = np.flatnonzero(catalog["platform"].to_numpy() == "Tiki")
+
+    monkeypatch.setattr(core, "_GATHER_CHUNK_ROWS", 100)
+    assert np.allclose(core._vector_scores(q_vec, rows), full[rows], atol=1e-6)
+    assert np.allclose(core._vector_scores(q_vec, np.arange(len(catalog))), full, atol=1e-6)
+    assert core._vector_scores(q_vec, rows[:0]).shape == (0,)
+
+
+def test_filtered_search_does_not_touch_full_matrix(core, catalog):
+    class GatherOnly:
+        """Ma trận chỉ cho phép lấy theo row id, không cho nhân cả khối."""
+
+        def __init__(self, emb):
+            self.emb = emb
+
+        def __len__(self):
+            return len(self.emb)
+
+        @property
+        def dtype(self):
+            return self.emb.dtype
+
+        def __getitem__(self, rows):
+            return self.emb[rows]
+
+        def __matmul__(self, other):
+            raise AssertionError("full-matrix product")
+
+    expected = core.hybrid_search(catalog, "tai nghe", platforms=["Tiki"], max_rows=20)
+    core.set_product_embeddings(GatherOnly(core._PRODUCT_EMB))
+    actual = core.hybrid_search(catalog, "tai nghe", platforms=["Tiki"], max_rows=20)
+    assert actual.index.tolist() == expected.index.tolist()
+
+
+def test_top_k_matches_stable_full_sort():
+    from modules.vector_index import _top_k
+
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 20, 1000).astype(float)  # nhiều điểm bằng nhau
+    full = np.argsort(-scores, kind="stable")
+    for k in (1, 7, 50, 999, 1000, 2000):
+        assert _top_k(scores, k).tolist() == full[:k].tolist()
+
+
+@pytest.mark.parametrize("query, kwargs", [
+    ("tai nghe", {}),
+    ("iphone 15 pro", {"platforms": ["Shopee", "Tiki"]}),
+    ("loa", {"min_reviews": 100}),
+])
+def test_top_k_is_prefix_of_full_ranking(core, catalog, query, kwargs):
+    full = core.hybrid_search(catalog, query, **kwargs)
+    top = core.hybrid_search(catalog, query, max_rows=25, **kwargs)
+    assert top.index.tolist() == full.index[:25].tolist()
+    assert list(top.columns) == list(catalog.columns)
+
+
+def test_batch_search_matches_single_searches(core, catalog):
+    queries = ["tai nghe bluetooth", "iphone 15", "", "loa mini", "khong co gi"]
+    kwargs = {"platforms": ["Shopee", "Tiki"], "min_reviews": 20, "max_rows": 15}
+
+    expected = [core.search_products_hybrid(catalog, q, **kwargs) for q in queries]
+
+    core.set_encoder(FakeEncoder())
+    actual = core.search_products_hybrid_batch(catalog, queries, **kwargs)
+
+    assert core._ENCODER.calls == [["tai nghe bluetooth", "iphone 15", "loa mini", "khong co gi"]]
+    assert len(actual) == len(queries)
+    for exp, act in zip(expected, actual):
+        assert [r["url"] for r in act["data"]] == [r["url"] for r in exp["data"]]
+        exp["meta"].pop("ts_generated"), act["meta"].pop("ts_generated")
+        assert act["meta"] == exp["meta"]
+
+
+def test_vector_scores_for_several_queries(core, catalog):
+    q_mat = fake_embed(["tai nghe", "loa"])
+    rows = np.flatnonzero(catalog["platform"].to_numpy() == "Tiki")
+    scores = core._vector_scores(q_mat.T, rows)
+    assert scores.shape == (len(rows), 2)
+    assert np.allclose(scores[:, 1], core._vector_scores(q_mat[1], rows), atol=1e-6)
+
+
+def test_hit_records_match_row_by_row_conversion(core, catalog):
+    df = catalog.head(300).copy()
+    df.loc[df.index % 7 == 0, "brand"] = np.nan
+    df.loc[df.index % 5 == 0, "price"] = np.nan
+    df["sold"] = df["sold"].astype(object)
+    df.loc[df.index % 3 == 0, "sold"] = None
+    df = df.drop(columns=["url"])
+
+    expected = [
+        {
+            "sku": row.get("sku"), "product_name": row.get("product_name"), "platform": row.get("platform"),
+            "super_category": row.get("super_category"), "categories": row.get("categories"),
+            "brand": row.get("brand"), "price": float(row.get("price", 0) or 0),
+            "sold": float(row.get("sold", 0) or 0), "rating": float(row.get("rating", 0) or 0),
+            "review_count": int(row.get("review_count", 0) or 0), "seller_name": row.get("seller_name"),
+            "url": row.get("url"),
+        }
+        for _, row in df.iterrows()
+    ]
+    actual = core._hits_to_records(df)
+    assert [list(r) for r in actual] == [list(r) for r in expected]
+    for a, e in zip(actual, expected):
+        for k in a:
+            assert a[k] == e[k] or (a[k] != a[k] and e[k] != e[k]), k
+    # Chỉ kiểu Python gốc -> json.dumps không cần hook
+    assert {type(v) for r in actual for v in r.values()} <= {str, float, int, type(None)}
@@ -0,0 +1,202 @@
+import numpy as np
+import pytest
+
+from modules.aggregation import COVERAGE_FIELDS, HitAggregator
+from modules.market_cube import MarketCube, quantize
+from tests.conftest import make_catalog
+
+
+METRICS = [
+    ("price_stats", {"by_platform": True}),
+    ("price_stats", {"by_platform": False}),
+    ("price_range", {"quantiles": (0.25, 0.75)}),
+    ("rating_distribution", {"bins": 10, "group_by_brand": True}),
+    ("rating_distribution", {"group_by_brand": False}),
+    ("brand_share", {"metric": "revenue_est"}),
+    ("brand_share", {"metric": "sku"}),
+    ("top_sellers", {"by": "product_count", "top_k": 5}),
+    ("top_brands", {"by": "sold", "top_k": 3}),
+    ("seller_diversity", {"min_products": 2}),
+    ("roi", {"group_by": "brand"}),
+    ("roi", {"group_by": "seller"}),
+]
+
+FILTERS = [
+    ({}, None),
+    ({"platforms": ["Shopee", "Tiki"]}, None),
+    ({"categories": ["audio devices"]}, "Audio Devices"),
+    ({"categories": ["speakers"], "brand": "so"}, "Speakers"),
+]
+
+
+def _assert_records_close(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a.keys() == e.keys()
+        for k in a:
+            if k in dict(COVERAGE_FIELDS):
+                # HyperLogLog: sai số chuẩn ~1.6% (số nhỏ gần như chính xác)
+                assert abs(a[k] - e[k]) <= 2 + 0.05 * e[k], (k, a[k], e[k])
+            elif isinstance(e[k], float):
+                assert a[k] == pytest.approx(e[k], rel=1e-9, abs=1e-9, nan_ok=True), k
+            else:
+                assert a[k] == e[k], k
+
+
+@pytest.fixture(scope="module")
+def market():
+    df = make_catalog(1500, seed=5)
+    df.loc[df.index % 13 == 0, "brand"] = np.nan
+    df.loc[df.index % 11 == 0, "price"] = 0.0
+    return df
+
+
+@pytest.fixture
+def exact_cube(core, market):
+    return MarketCube.build(market, core._COLUMN_MAP, relative_accuracy=0, compression=None)
+
+
+@pytest.mark.parametrize("filters,category", FILTERS)
+def test_exact_cube_matches_rows(core, market, exact_cube, filters, category):
+    cells = exact_cube.select(**filters)
+    pos = core._filter_positions(market, category, filters.get("platforms"), filters.get("brand"), 0)
+    rows = market if pos is None else market.iloc[pos]
+    cube_agg, row_agg = exact_cube.aggregator(cells), HitAggregator(rows, core._COLUMN_MAP)
+
+    assert exact_cube.measures["rows"][cells].sum() == len(rows) > 0
+    for metric, params in METRICS:
+        actual, expected = cube_agg.compute(metric, **params), row_agg.compute(metric, **params)
+        _assert_records_close(actual.data, expected.data)
+        assert actual.notes == expected.notes.replace("search subset", "market cube")
+
+    # Số đếm giống value_counts (thứ tự các giá trị bằng nhau có thể khác)
+    for field in ("categories", "brand"):
+        counts = cube_agg.compute("category_count", sublevel_field=field).data
+        expected = row_agg.compute("category_count", sublevel_field=field).data
+        key = lambda r: (r["product_count"], r["count"])  # noqa: E731
+        _assert_records_close(sorted(counts, key=key), sorted(expected, key=key))
+
+
+def test_sketch_quantiles_within_accuracy(core):
+    market = make_catalog(20000, seed=9)
+    cube = MarketCube.build(market, core._COLUMN_MAP, compression=50)
+    # Digest lớn hơn compression bị nén: <= compression / 2 + 1 centroid; digest nhỏ giữ chính xác
+    digests = cube.price_digests
+    sizes = np.bincount(np.repeat(np.arange(len(digests)), np.diff(digests.offsets)), weights=digests.weights)
+    assert (np.diff(digests.offsets)[sizes > 50] <= 50 / 2 + 1).all()
+    assert (sizes > 50).sum() > len(digests) / 2
+    assert len(cube.price_digests.means) < market["price"].nunique() / 2
+
+    approx = cube.aggregator(cube.select()).compute("price_range").data
+    for a in approx:
+        prices = np.sort(market.loc[
+            (market["platform"] == a["platform"]) & (market["categories"] == a["categories"]), "price"
+        ].to_numpy())
+        assert (a["min_price"], a["max_price"], a["count"]) == (prices[0], prices[-1], len(prices))
+        # Sai số theo hạng (rank) của quantile t-digest
+        for k, q in (("q_low", 0.1), ("median_price", 0.5), ("q_high", 0.9)):
+            rank = np.searchsorted(prices, a[k]) / len(prices)
+            assert abs(rank - q) < 0.02, (k, rank)
+
+    # Sketch ROI: mốc bị chặn theo thang log, không theo số giá trị thật
+    roi = market["sold"] / market["price"]
+    assert len(np.unique(cube.sketches["roi"].values)) < roi.nunique() / 3
+    values = np.array([0.0, 1e-3, 1.0, 123.4, -5.0, 1e9])
+    np.testing.assert_allclose(quantize(values, 0.02), values, rtol=0.02 + 1e-12)
+
+
+@pytest.fixture
+def with_cube(core, catalog):
+    core.set_market_cube(core.build_market_cube(catalog))
+    return catalog
+
+
+def _no_search(core, monkeypatch):
+    monkeypatch.setattr(core, "hybrid_search", lambda *a, **k: pytest.fail("searched"))
+
+
+def test_keyword_free_and_category_queries_use_cube(core, with_cube, monkeypatch):
+    df = with_cube
+    _no_search(core, monkeypatch)
+
+    out = core.fe_brand_share_chart(df, "", platforms=["Shopee"], metric="revenue_est")
+    assert out["meta"]["notes"].startswith("market_cube; whole_market")
+    assert {r["platform"] for r in out["data"]} == {"Shopee"}
+    assert sum(r["share_pct"] for r in out["data"]) == pytest.approx(100.0)
+
+    # Từ khóa là tên danh mục (không phân biệt hoa thường / dấu câu)
+    out = core.fe_top_brands(df, "audio  DEVICES", hint={"brand": "Sony"})
+    assert out["meta"]["detected_category"] == "Audio Devices"
+    assert "keyword_category=Audio Devices" in out["meta"]["notes"]
+    pos = core._filter_positions(df, "Audio Devices", core._DEFAULT_PLATFORMS, "Sony", 0)
+    revenue = (df["price"] * df["sold"]).iloc[pos].groupby(df["platform"].iloc[pos]).sum()
+    assert {r["platform"]: r["value"] for r in out["data"]} == pytest.approx(revenue.to_dict())
+
+    ctx = core.AnalysisContext(df, "Speakers", platforms=["Tiki", "Lazada"])
+    stats = ctx.aggregate({"price_stats": {}, "roi": {"group_by": "brand"}, "seller_diversity": {}})
+    assert all("over market cube" in r["meta"]["notes"] for r in stats.values())
+    assert stats["price_stats"]["data"] == core.fe_describe_price(df, "speakers", platforms=["Tiki", "Lazada"])["data"]
+
+
+def test_other_queries_still_search(core, with_cube, monkeypatch):
+    df = with_cube
+    calls = []
+    real = core.hybrid_search
+    monkeypatch.setattr(core, "hybrid_search", lambda *a, **k: calls.append(1) or real(*a, **k))
+
+    assert "market_cube" not in core.fe_top_brands(df, "tai nghe sony")["meta"]["notes"]
+    assert "market_cube" not in core.fe_top_brands(df, "", min_reviews=50)["meta"]["notes"]
+    assert "market_cube" not in core.fe_sold_distribution(df, "Speakers")["meta"]["notes"]
+    assert "market_cube" not in core.fe_category_count_plot(df, "", sublevel_field="sku")["meta"]["notes"]
+    assert len(calls) == 4
+
+    # Cube của catalogue khác (số row không khớp) không được dùng
+    assert "market_cube" not in core.fe_top_brands(df.head(100), "")["meta"]["notes"]
+
+
+def test_precomputed_seller_diversity(core, market, monkeypatch):
+    cube = MarketCube.build(market, core._COLUMN_MAP, seller_diversity=True)
+    assert len(cube.seller_diversity["platform"]) == market.groupby(["platform", "seller_name"], dropna=False).ngroups
+
+    for platforms in (None, ["Shopee", "Tiki"]):
+        cells = cube.select(platforms)
+        agg = cube.aggregator(cells, platform_only=True)
+        assert agg.seller_diversity is not None
+        pos = core._filter_positions(market, None, platforms, None, 0)
+        rows = market if pos is None else market.iloc[pos]
+        expected = HitAggregator(rows, core._COLUMN_MAP).compute("seller_diversity", min_products=3)
+        actual = agg.compute("seller_diversity", min_products=3)
+        _assert_records_close(actual.data, expected.data)
+        assert actual.notes == expected.notes.replace("search subset", "market cube")
+
+    # Lọc category / brand: bảng toàn catalogue không còn đúng -> gộp cell như cũ
+    assert cube.aggregator(cube.select(None, ["speakers"])).seller_diversity is None
+
+    core.set_market_cube(core.build_market_cube(market, seller_diversity=True))
+    monkeypatch.setattr(core, "hybrid_search", lambda *a, **k: pytest.fail("searched"))
+    out = core.fe_seller_diversity_index(market, "", platforms=["Lazada"])
+    assert out["data"] and {r["platform"] for r in out["data"]} == {"Lazada"}
+
+
+def test_distinct_counts_merge_across_cells(core):
+    market = make_catalog(20000, seed=3)
+    market["sku"] = np.arange(len(market)) % 7000
+    cube = MarketCube.build(market, core._COLUMN_MAP)
+    # Sketch theo DIGEST_DIMS (không theo seller), gộp khi query: mỗi SKU / seller chỉ đếm 1 lần
+    assert set(cube.distinct) == {"seller_name", "sku"} and len(cube.distinct["sku"]) == len(cube.price_digests)
+
+    for platforms, categories in ((None, None), (["Tiki"], ["audio devices"])):
+        pos = core._filter_positions(market, categories and categories[0], platforms, None, 0)
+        rows = market if pos is None else market.iloc[pos]
+        agg = cube.aggregator(cube.select(platforms, categories))
+        for r in agg.compute("top_brands", by="sold", top_k=3).data:
+            sub = rows[(rows["platform"] == r["platform"]) & (rows["brand"] == r["brand"])]
+            assert abs(r["distinct_skus"] / sub["sku"].nunique() - 1) < 0.05
+            assert abs(r["distinct_sellers"] / sub["seller_name"].nunique() - 1) < 0.05
+        for r in agg.compute("category_count", sublevel_field="platform").data:
+            sub = rows[rows["platform"] == r["product_count"]]
+            assert abs(r["distinct_skus"] / sub["sku"].nunique() - 1) < 0.05
+
+    # Nhóm theo seller cắt ngang sketch -> không phục vụ từ cube
+    assert not cube.supports("category_count", {"sublevel_field": "seller_name"})
+    assert cube.supports("category_count", {"sublevel_field": "brand"})
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from tests.conftest import FakeEncoder
+
+
+@pytest.fixture
+def core(monkeypatch):
+    ac = pytest.importorskip("modules.analytics_core")
+    calls = []
+
+    def fake_encode(texts):
+        calls.append(list(texts))
+        return np.ones((len(texts), 4), dtype=np.float32) * len(texts[0])
+
+    monkeypatch.setattr(ac, "_ENCODER", FakeEncoder(fake_encode))
+    monkeypatch.setattr(ac, "_QUERY_CACHE_SIZE", 2)
+    ac.clear_query_cache()
+    yield ac, calls
+    ac.clear_query_cache()
+
+
+def test_encode_query_hits_cache_for_normalized_text(core):
+    ac, calls = core
+    a = ac.encode_query("Tai nghe  Bluetooth")
+    b = ac.encode_query("  tai nghe bluetooth ")
+    assert a is b
+    assert calls == [["tai nghe bluetooth"]]
+    assert ac.query_cache_info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 2}
+    assert not a.flags.writeable
+
+
+def test_encode_query_evicts_least_recently_used(core):
+    ac, calls = core
+    ac.encode_query("a")
+    ac.encode_query("b")
+    ac.encode_query("a")
+    ac.encode_query("c")  # đẩy "b" ra khỏi cache
+    ac.encode_query("a")
+    ac.encode_query("b")
+    assert [c[0] for c in calls] == ["a", "b", "c", "b"]
+    info = ac.query_cache_info()
+    assert info["hits"] == 2 and info["misses"] == 4 and info["size"] == 2
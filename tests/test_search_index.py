@@ -0,0 +1,157 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.search_index import TokenIndex
+
+
+NAMES = [
+    "Apple iPhone 15 Pro Max 256GB",
+    "Op lung iPhone 15",
+    "Tai nghe Bluetooth Sony WH-1000XM5",
+    "Tai nghe có dây Sony",
+    "Samsung Galaxy S24 Ultra",
+    "",
+    "Cáp sạc Type-C iPhone",
+    "Loa Bluetooth JBL mini",
+]
+
+
+def _norm(s: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", s.lower()).strip()
+
+
+def _brute_substring(names, q_norm):
+    return np.array([i for i, n in enumerate(names) if q_norm and q_norm in n], dtype=np.int64)
+
+
+@pytest.fixture
+def index():
+    return TokenIndex.build([_norm(n) for n in NAMES])
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["iphone", "e 15 ip", "e 15", "ai ngh", "tai nghe bluetooth", "ph", "15 pro max", "xyz", "bluetooth sony wh"],
+)
+def test_substring_rows_matches_brute_force(index, query):
+    names = [_norm(n) for n in NAMES]
+    q_norm = _norm(query)
+    assert np.array_equal(index.substring_rows(q_norm), _brute_substring(names, q_norm))
+
+
+def test_jaccard_matches_python_sets(index):
+    q_tokens = {"tai", "nghe", "sony", "khong"}
+    rows, scores = index.jaccard(q_tokens)
+    for row, score in zip(rows, scores):
+        tokens = set(_norm(NAMES[row]).split())
+        assert score == pytest.approx(len(q_tokens & tokens) / len(q_tokens | tokens))
+    expected = [i for i, n in enumerate(NAMES) if q_tokens & set(_norm(n).split())]
+    assert rows.tolist() == expected
+
+
+def test_indexed_lexical_scores_match_row_scan():
+    ac = pytest.importorskip("modules.analytics_core")
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "product_name": [NAMES[i] for i in rng.integers(0, len(NAMES), 200)],
+            "platform": rng.choice(["Shopee", "Lazada", "Tiki"], 200),
+            "super_category": "Phones & Accessories",
+            "categories": "Mobile Phones",
+            "brand": "",
+            "review_count": rng.integers(0, 100, 200),
+        }
+    )
+    old_emb, old_index = ac._PRODUCT_EMB, ac._TOKEN_INDEX
+    try:
+        ac.set_product_embeddings(None)
+        for query in ["iphone 15", "e 15 ip", "tai nghe", "ai ngh", "xyz", ""]:
+            for kwargs in ({}, {"platforms": ["Shopee", "Tiki"], "min_reviews": 30}):
+                ac.set_token_index(None)
+                expected = ac.hybrid_search(df, query, **kwargs)
+                ac.set_token_index(ac.build_token_index(df))
+                actual = ac.hybrid_search(df, query, **kwargs)
+                assert actual.index.tolist() == expected.index.tolist(), (query, kwargs)
+    finally:
+        ac.set_product_embeddings(old_emb)
+        ac.set_token_index(old_index)
+
+
+def test_substring_rows_cached_and_read_only(index):
+    rows = index.substring_rows("iphone")
+    assert index.substring_rows("iphone") is rows
+    assert not rows.flags.writeable
+
+
+@pytest.mark.parametrize("query", ["tai nghe", "i sony", "15 pro", "galaxy s", "khong co", ""])
+def test_phrase_mask_indexed_matches_regex(core, catalog, query):
+    hits = catalog.sample(500, random_state=1)
+    q_norm = core._normalize_text(query)
+    indexed = core._phrase_mask(catalog, hits, q_norm)
+    core.set_token_index(None)
+    assert np.array_equal(indexed, core._phrase_mask(catalog, hits, q_norm))
+
+
+def test_fuzzy_terms_tolerate_typos(index):
+    tokens = [index.tokens[t] for t in index.fuzzy_terms("bluetoth")]
+    assert tokens[0] == "bluetooth"
+    assert index.tokens[index.fuzzy_terms("iphone")[0]] == "iphone"
+    assert len(index.fuzzy_terms("qqqq")) == 0
+
+
+def test_fold_accents_in_normalize_text(core):
+    assert core._normalize_text("Tai nghe KHÔNG dây Đen") == "tai nghe khong day den"
+    assert core._normalize_text("Ốp lưng iPhone 15") == "op lung iphone 15"
+
+
+def test_typo_tolerant_search_restricts_to_fuzzy_candidates(core, catalog):
+    hits = core.hybrid_search(catalog, "tai ngeh bluetoth", typo_tolerant=True)
+    assert len(hits) > 0
+    names = hits["product_name"].str.split()
+    assert names.map(lambda t: bool({"tai", "bluetooth"} & set(t))).all()
+    # Top hit chứa token đã sửa
+    assert {"tai", "bluetooth"} <= set(hits["product_name"].iloc[0].split())
+
+    # Không có token nào gần giống -> tìm kiếm như bình thường
+    plain = core.hybrid_search(catalog, "qqqq zzzz", max_rows=10)
+    assert core.hybrid_search(catalog, "qqqq zzzz", max_rows=10, typo_tolerant=True).index.equals(plain.index)
+
+
+def test_bm25_matches_reference_formula(index):
+    docs = [_norm(n).split() for n in NAMES]
+    avgdl = sum(map(len, docs)) / len(docs)
+    q_tokens = {"tai", "nghe", "sony", "iphone", "khong"}
+
+    def ref(doc):
+        score = 0.0
+        for t in q_tokens:
+            n_t = sum(t in d for d in docs)
+            tf = doc.count(t)
+            if tf:
+                idf = np.log1p((len(docs) - n_t + 0.5) / (n_t + 0.5))
+                score += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(doc) / avgdl))
+        return score
+
+    rows, scores = index.bm25(q_tokens)
+    expected = {i: ref(d) for i, d in enumerate(docs) if ref(d) > 0}
+    assert rows.tolist() == sorted(expected)
+    assert scores == pytest.approx([expected[r] for r in rows], rel=1e-5)
+
+
+def test_bm25_counts_repeated_tokens():
+    index = TokenIndex.build(["sac sac sac nhanh", "sac nhanh"])
+    rows, scores = index.bm25(["sac"])
+    assert rows.tolist() == [0, 1] and scores[0] > scores[1]
+
+
+def test_hybrid_search_bm25_mode(core, catalog):
+    indexed = core.hybrid_search(catalog, "tai nghe bluetooth", max_rows=50, lexical="bm25")
+    core.set_token_index(None)
+    rebuilt = core.hybrid_search(catalog, "tai nghe bluetooth", max_rows=50, lexical="bm25")
+    assert indexed.index.tolist() == rebuilt.index.tolist()
+    with pytest.raises(ValueError):
+        core.hybrid_search(catalog, "tai nghe", lexical="tfidf")
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from modules.embedding_store import EmbeddingStore
+from modules.sharded_search import ShardedSearch
+from tests.conftest import fake_embed
+
+
+CASES = [
+    ("tai nghe bluetooth", {}),
+    ("iphone 15 pro", {"platforms": ["Shopee", "Tiki"], "max_rows": 30}),
+    ("loa", {"min_reviews": 100, "max_rows": 10}),
+    ("sony", {"lexical": "bm25", "max_rows": 50}),
+    ("khong co gi", {"max_rows": 5}),
+]
+
+
+@pytest.fixture(params=["ndarray", "int8"])
+def emb(request, catalog, tmp_path):
+    vecs = fake_embed(catalog["product_name"].tolist())
+    if request.param == "ndarray":
+        return vecs
+    path = str(tmp_path / "emb.npy")
+    np.save(path, vecs)
+    return EmbeddingStore.open(path, dtype="int8")
+
+
+def test_sharded_matches_single_process(core, catalog, emb):
+    core.set_product_embeddings(emb)
+    expected = [core.hybrid_search(catalog, q, **kw) for q, kw in CASES]
+
+    sharded = ShardedSearch(emb, workers=2, n_shards=3, min_rows=0, align=1000)
+    try:
+        core.set_sharded_search(sharded)
+        assert core._PRODUCT_EMB is sharded.embeddings
+        calls = []
+        rank = sharded.rank
+        sharded.rank = lambda *a, **k: calls.append(1) or rank(*a, **k)
+        actual = [core.hybrid_search(catalog, q, **kw) for q, kw in CASES]
+    finally:
+        sharded.close()
+
+    assert len(calls) == len(CASES)
+    for exp, act in zip(expected, actual):
+        assert act.index.tolist() == exp.index.tolist()
+
+
+def test_ties_merge_like_stable_sort():
+    # Nhiều row giống hệt nhau -> điểm bằng nhau trải qua nhiều shard
+    # (vector nguyên nhỏ: tích vô hướng chính xác, không phụ thuộc cách BLAS chia khối)
+    base = np.array([[1, 0, 2, 0], [0, 1, 1, 1], [2, 2, 0, 1]], dtype=np.float32)
+    emb = base[np.arange(600) % 3]
+    q = np.array([1, -1, 1, 0], dtype=np.float32) / 4
+    idx = np.arange(600)
+    lexical = np.where(idx % 5 == 0, 0.5, 0.0)
+
+    final = 0.5 * lexical + 0.5 * (emb @ q)
+    sharded = ShardedSearch(emb, workers=2, n_shards=4, min_rows=0)
+    try:
+        for k in (1, 7, 100, None):
+            ranked = np.argsort(-final, kind="stable")
+            expected = ranked[final[ranked] > 0][:k]
+            assert sharded.rank(q, idx, lexical, 0.5, 0.5, k).tolist() == expected.tolist()
+        sub = idx[idx % 4 != 1]
+        expected = np.argsort(-final[sub], kind="stable")[:20]
+        assert sharded.rank(q, sub, lexical[sub], 0.5, 0.5, 20).tolist() == expected.tolist()
+    finally:
+        sharded.close()
+
+
+def test_shard_bounds_follow_store_chunks(tmp_path):
+    path = str(tmp_path / "emb.npy")
+    np.save(path, fake_embed(["tai nghe"] * 1000))
+    store = EmbeddingStore.open(path, dtype="float16")
+    store.chunk_rows = 128
+    sharded = ShardedSearch(store, workers=1, n_shards=3)
+    try:
+        assert sharded.bounds.tolist() == [0, 384, 640, 1000]
+    finally:
+        sharded.close()
+
+    # Catalogue nhỏ hơn 1 khối -> 1 shard duy nhất
+    store.chunk_rows = 65_536
+    sharded = ShardedSearch(store, workers=1, n_shards=3, min_rows=0)
+    try:
+        assert sharded.bounds.tolist() == [0, 1000]
+        q = fake_embed(["tai nghe"])[0]
+        assert len(sharded.rank(q, np.arange(1000), np.zeros(1000), 0.5, 0.5, 10)) == 10
+    finally:
+        sharded.close()
+
+
+def test_small_or_unsorted_candidates_stay_in_process(core):
+    emb = fake_embed(["tai nghe"] * 10)
+    sharded = ShardedSearch(emb, workers=1, min_rows=5)
+    try:
+        assert sharded.accepts(sharded.embeddings, np.arange(10))
+        assert not sharded.accepts(sharded.embeddings, np.arange(3))
+        assert not sharded.accepts(sharded.embeddings, np.array([5, 1, 2, 3, 4, 0]))
+        assert not sharded.accepts(emb, np.arange(10))
+    finally:
+        sharded.close()
+    assert not sharded.accepts(sharded.embeddings, np.arange(10))
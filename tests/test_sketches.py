@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from modules.sketches import HyperLogLogSet, TDigestSet
+
+
+QS = (0.0, 0.1, 0.25, 0.5, 0.9, 0.99, 1.0)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(4)
+    n = 30000
+    group = rng.integers(0, 24, n)
+    # Nhiều giá trị trùng (giá làm tròn) + NaN
+    values = np.round(rng.lognormal(11, 1.2, n), -3)
+    values[rng.random(n) < 0.03] = np.nan
+    return group, values
+
+
+def test_exact_digests_match_numpy_bitwise(data):
+    group, values = data
+    digests = TDigestSet.build(group, values, 24, compression=None)
+    target = np.arange(24) % 5
+    result = digests.quantiles(target, 5, QS)
+    for t in range(5):
+        x = values[(target[group] == t) & ~np.isnan(values)]
+        for q in QS:
+            assert result[q][t] == np.quantile(x, q)
+
+
+def test_merged_digests_within_rank_error(data):
+    group, values = data
+    digests = TDigestSet.build(group, values, 24, compression=100)
+    assert len(digests.means) < 24 * (100 / 2 + 1)
+
+    # Gộp digest ở query: 24 nhóm -> 3 nhóm đích, 1 nhóm bị bỏ (-1)
+    target = np.where(np.arange(24) < 21, np.arange(24) % 3, -1)
+    result = digests.quantiles(target, 3, QS)
+    for t in range(3):
+        x = np.sort(values[(target[group] == t) & ~np.isnan(values)])
+        assert (result[0.0][t], result[1.0][t]) == (x[0], x[-1])
+        for q in QS:
+            assert abs(np.searchsorted(x, result[q][t]) / len(x) - q) < 0.01
+
+
+def test_small_groups_fall_back_to_exact():
+    rng = np.random.default_rng(1)
+    group = np.repeat([0, 1], [40, 5000])
+    values = rng.normal(100, 10, len(group))
+    digests = TDigestSet.build(group, values, 2, compression=50, exact_max=64)
+    sizes = np.diff(digests.offsets)
+    assert sizes[0] == 40 and digests.point[:40].all()
+    assert sizes[1] <= 26
+
+    result = digests.quantiles(np.array([0, -1]), 2, (0.3,))
+    assert result[0.3][0] == np.quantile(values[:40], 0.3) and np.isnan(result[0.3][1])
+
+    # take() + to_arrays() / from_arrays() giữ nguyên digest
+    taken = TDigestSet.from_arrays(digests.take(np.array([1])).to_arrays())
+    np.testing.assert_array_equal(taken.means, digests.means[40:])
+    np.testing.assert_array_equal(
+        taken.quantiles(np.array([0]), 1, QS)[0.5], digests.quantiles(np.array([-1, 0]), 1, QS)[0.5]
+    )
+
+
+def test_hyperloglog_estimates_and_merges():
+    rng = np.random.default_rng(7)
+    n = 60000
+    group = rng.integers(0, 30, n)
+    values = rng.integers(0, 40000, n).astype(str).astype(object)
+    values[rng.random(n) < 0.02] = None
+    sketches = HyperLogLogSet.build(group, values, 30)
+    assert sketches.index.dtype == np.uint16 and len(sketches) == 30
+
+    # Gộp = max register: 30 nhóm -> 4 nhóm đích, 1 nhóm bị bỏ, giá trị chung giữa nhóm chỉ đếm 1 lần
+    target = np.where(np.arange(30) < 28, np.arange(30) % 4, -1)
+    estimate = sketches.estimate(target, 4)
+    for t in range(4):
+        exact = len(set(values[(target[group] == t) & (values != None)]))  # noqa: E711
+        assert abs(estimate[t] / exact - 1) < 0.05
+
+    # take() + to_arrays() / from_arrays() giữ nguyên sketch
+    taken = HyperLogLogSet.from_arrays(sketches.take(np.array([3, 5])).to_arrays())
+    np.testing.assert_array_equal(
+        taken.estimate(np.array([0, 0]), 1), sketches.estimate(np.where(np.isin(np.arange(30), [3, 5]), 0, -1), 1)
+    )
+
+
+def test_hyperloglog_small_counts_near_exact():
+    values = np.array(["a", "b", "c", "a", np.nan, "d", "b"], dtype=object)
+    group = np.array([0, 0, 0, 0, 0, 1, -1])
+    sketches = HyperLogLogSet.build(group, values, 3)
+    np.testing.assert_allclose(sketches.estimate(np.arange(3), 3), [3, 1, 0], atol=0.01)
@@ -0,0 +1,119 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.vector_index import ExactIndex, IVFIndex, load_or_build_vector_index, measure_recall
+from tests.conftest import FakeEncoder
+
+
+def _random_emb(n: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    emb = rng.standard_normal((n, dim)).astype(np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def test_ivf_full_probe_matches_exact():
+    emb = _random_emb(2000)
+    index = IVFIndex.build(emb, n_lists=20)
+    queries = _random_emb(10, seed=1)
+    index.nprobe = index.n_lists
+    assert measure_recall(index, emb, queries, k=50) == 1.0
+
+
+def test_ivf_probes_enough_rows_for_k():
+    emb = _random_emb(5000)
+    index = IVFIndex.build(emb, n_lists=50, nprobe=1, scan_factor=2.0)
+    q = _random_emb(1, seed=2)[0]
+    probe = index._probe_lists(q, k=500, nprobe=None)
+    scanned = np.diff(index.list_offsets)[probe].sum()
+    assert scanned >= 1000
+    rows, scores = index.search(q, 500)
+    assert len(rows) == 500
+    assert np.all(np.diff(scores) <= 1e-6)
+
+
+def test_ivf_saved_next_to_embeddings_and_reloaded(tmp_path):
+    emb = _random_emb(500)
+    emb_path = str(tmp_path / "emb.npy")
+    np.save(emb_path, emb)
+
+    built = load_or_build_vector_index(emb, emb_path, kind="ivf", nprobe=4)
+    assert os.path.exists(str(tmp_path / "emb.ivf.npz"))
+
+    loaded = load_or_build_vector_index(emb, emb_path, kind="ivf", nprobe=4)
+    assert np.array_equal(loaded.centroids, built.centroids)
+    assert np.array_equal(loaded.list_rows, built.list_rows)
+
+    # Index cũ không khớp số row -> dựng lại
+    rebuilt = load_or_build_vector_index(emb[:400], emb_path, kind="ivf")
+    assert rebuilt.n_rows == 400
+
+
+def test_hnsw_without_hnswlib_reuses_saved_ivf(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "hnswlib", None)
+    emb = _random_emb(500)
+    emb_path = str(tmp_path / "emb.npy")
+    np.save(emb_path, emb)
+
+    built = load_or_build_vector_index(emb, emb_path, kind="hnsw", ef=64)
+    assert built.kind == "ivf" and os.path.exists(str(tmp_path / "emb.ivf.npz"))
+    assert not os.path.exists(str(tmp_path / "emb.hnsw.bin"))
+
+    # Lần khởi động sau nạp IVF đã lưu, không chạy lại k-means
+    monkeypatch.setattr(IVFIndex, "build", classmethod(lambda cls, *a, **k: pytest.fail("rebuilt")))
+    loaded = load_or_build_vector_index(emb, emb_path, kind="hnsw", ef=64)
+    assert np.array_equal(loaded.list_rows, built.list_rows)
+
+
+def test_ann_candidates_fallbacks(core):
+    emb = _random_emb(1000)
+    q = emb[0]
+    all_rows = np.arange(1000)
+    core.set_product_embeddings(emb)
+    core._ANN_MIN_CANDIDATES = 10
+
+    core.set_vector_index(None)
+    assert core._ann_candidates(q, 20, all_rows) is None
+
+    core.set_vector_index(ExactIndex(emb))
+    assert core._ann_candidates(q, None, all_rows) is None
+    # k * 2 >= n_rows -> quét exact rẻ hơn
+    assert core._ann_candidates(q, 200, all_rows) is None
+    # filter quá hẹp: còn < max_rows ứng viên
+    assert core._ann_candidates(q, 20, np.arange(5)) is None
+
+    rows = core._ann_candidates(q, 20, all_rows)
+    assert rows is not None and len(rows) == 80 and rows[0] == 0
+
+
+def test_hybrid_search_ann_agrees_with_exact(core):
+    n = 1500
+    emb = _random_emb(n, seed=3)
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame(
+        {
+            "product_name": [f"item {i % 37} model {i % 11}" for i in range(n)],
+            "platform": rng.choice(["Shopee", "Lazada"], n),
+            "super_category": "Audio Devices",
+            "categories": "Headphones",
+            "brand": "",
+            "review_count": rng.integers(0, 50, n),
+        }
+    )
+    core.set_product_embeddings(emb)
+    core.set_token_index(None)
+    core._ANN_MIN_CANDIDATES = 10
+    q_vec = emb[7]
+    core.set_encoder(FakeEncoder(lambda texts: np.tile(q_vec, (len(texts), 1))))
+
+    for kwargs in ({}, {"platforms": ["Shopee"]}):
+        core.set_vector_index(None)
+        exact = core.hybrid_search(df, "item 5", max_rows=30, **kwargs)
+        ivf = IVFIndex.build(emb, n_lists=10)
+        ivf.nprobe = ivf.n_lists
+        core.set_vector_index(ivf)
+        approx = core.hybrid_search(df, "item 5", max_rows=30, **kwargs)
+        assert approx.index.tolist() == exact.index.tolist()